@@ -10,6 +10,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
 from app.models import Base
 from app.core.config import settings
+# Service modules declare their own tables on Base; import them so autogenerate sees the whole schema
+import app.services.dialog_mirror
+import app.services.high_water
+import app.services.latency
+import app.services.log_rollup
+import app.services.peer_cache
+import app.services.retry_engine
+import app.services.seen_store
+import app.services.tenant_scheduler
 
 # this is the Alembic Config object
 config = context.config
@@ -0,0 +1,120 @@
+"""core schema
+
+Revision ID: 0000_core_schema
+Revises:
+Create Date: 2026-10-17 00:00:00.000000
+
+Creates the core tables (users, channels, rules, logs, bot sessions,
+subscriptions) as they stood when ``Base.metadata.create_all`` at API startup
+was replaced by the migrations. The definitions are frozen here so a fresh
+database replays to the same schema as existing deployments no matter how
+``app.models`` changes later; model changes need a revision of their own.
+Tables that already exist are left alone, so databases set up by
+``create_all`` upgrade from here as well.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0000_core_schema"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _tables():
+    return [
+        (
+            "users",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("username", sa.String(), nullable=True),
+            sa.Column("telegram_user_id", sa.String(), nullable=True),
+            sa.Column("subscription_active", sa.Boolean(), nullable=True, server_default=sa.false()),
+            sa.Column("is_active", sa.Boolean(), nullable=True, server_default=sa.true()),
+            sa.Column("created_at", sa.DateTime(), nullable=True, server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("email"),
+        ),
+        (
+            "telegram_channels",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("channel_id", sa.String(), nullable=False),
+            sa.Column("channel_name", sa.String(), nullable=True),
+            sa.Column("channel_type", sa.String(), nullable=True),
+            sa.Column("is_active", sa.Boolean(), nullable=True, server_default=sa.true()),
+            sa.Column("created_at", sa.DateTime(), nullable=True, server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        ),
+        (
+            "forwarding_rules",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("source_channel_id", sa.String(), nullable=False),
+            sa.Column("target_channel_id", sa.String(), nullable=False),
+            sa.Column("filter_keywords", sa.JSON(), nullable=True),
+            sa.Column("exclude_keywords", sa.JSON(), nullable=True),
+            sa.Column("is_active", sa.Boolean(), nullable=True, server_default=sa.true()),
+            sa.Column("messages_forwarded", sa.Integer(), nullable=True, server_default="0"),
+            sa.Column("last_forwarded_at", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True, server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        ),
+        (
+            "forwarding_logs",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("rule_id", sa.Integer(), nullable=True),
+            sa.Column("source_message_id", sa.Integer(), nullable=True),
+            sa.Column("target_message_id", sa.Integer(), nullable=True),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("error_message", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True, server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.ForeignKeyConstraint(["rule_id"], ["forwarding_rules.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        ),
+        (
+            "bot_sessions",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("phone_number", sa.String(), nullable=True),
+            sa.Column("is_running", sa.Boolean(), nullable=True, server_default=sa.false()),
+            sa.Column("is_authenticated", sa.Boolean(), nullable=True, server_default=sa.false()),
+            sa.Column("last_activity", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        ),
+        (
+            "subscriptions",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("paypal_subscription_id", sa.String(), nullable=True),
+            sa.Column("status", sa.String(), nullable=True),
+            sa.Column("amount", sa.Float(), nullable=True),
+            sa.Column("currency", sa.String(), nullable=True),
+            sa.Column("next_billing_time", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True, server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        ),
+    ]
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, *columns in _tables():
+        if name not in existing:
+            op.create_table(name, *columns)
+
+
+def downgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, *_ in reversed(_tables()):
+        if name in existing:
+            op.drop_table(name)
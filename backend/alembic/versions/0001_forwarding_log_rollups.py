@@ -0,0 +1,42 @@
+"""forwarding log daily rollups
+
+Revision ID: 0001_forwarding_log_rollups
+Revises: 0000_core_schema
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0001_forwarding_log_rollups"
+down_revision = "0000_core_schema"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "forwarding_log_daily",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("rule_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("successful", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("failed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("filtered", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("user_id", "rule_id", "day"),
+    )
+    op.create_table(
+        "forwarding_error_daily",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("fingerprint", sa.String(length=16), nullable=False),
+        sa.Column("error_message", sa.Text(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("user_id", "day", "fingerprint"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("forwarding_error_daily")
+    op.drop_table("forwarding_log_daily")
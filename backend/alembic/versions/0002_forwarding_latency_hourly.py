@@ -0,0 +1,32 @@
+"""forwarding latency hourly histograms
+
+Revision ID: 0002_forwarding_latency_hourly
+Revises: 0001_forwarding_log_rollups
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0002_forwarding_latency_hourly"
+down_revision = "0001_forwarding_log_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "forwarding_latency_hourly",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("buckets", postgresql.ARRAY(sa.BigInteger()), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("total_ms", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("user_id", "hour"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("forwarding_latency_hourly")
@@ -0,0 +1,79 @@
+"""range-partition forwarding_logs by day
+
+Revision ID: 0003_partition_forwarding_logs
+Revises: 0002_forwarding_latency_hourly
+Create Date: 2026-10-17 00:00:00.000000
+
+Rebuilds ``forwarding_logs`` as a table partitioned by RANGE (created_at) with
+one partition per day, copies the existing rows across and pre-creates the
+partitions for the coming week. Later partitions are created, and expired
+ones detached and dropped, by ``app.services.log_partitions``.
+
+The primary key becomes (id, created_at) because PostgreSQL requires the
+partition key in every unique constraint. Foreign keys from the old table are
+not recreated: retention drops whole partitions and must not be blocked by,
+or cascade into, rule deletions.
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003_partition_forwarding_logs"
+down_revision = "0002_forwarding_latency_hourly"
+branch_labels = None
+depends_on = None
+
+PREMAKE_DAYS = 7
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE forwarding_logs RENAME TO forwarding_logs_unpartitioned")
+    op.execute("UPDATE forwarding_logs_unpartitioned SET created_at = now() WHERE created_at IS NULL")
+
+    op.execute(
+        "CREATE TABLE forwarding_logs "
+        "(LIKE forwarding_logs_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER TABLE forwarding_logs ALTER COLUMN created_at SET NOT NULL")
+    op.execute("ALTER TABLE forwarding_logs ALTER COLUMN created_at SET DEFAULT now()")
+    op.execute("ALTER TABLE forwarding_logs ADD PRIMARY KEY (id, created_at)")
+    # Keep handing out ids from the original sequence
+    op.execute("ALTER SEQUENCE forwarding_logs_id_seq OWNED BY forwarding_logs.id")
+
+    # One partition per day from the oldest row through the premake window
+    op.execute(f"""
+        DO $$
+        DECLARE
+            day date := coalesce(
+                (SELECT min(created_at)::date FROM forwarding_logs_unpartitioned),
+                (now() at time zone 'utc')::date
+            );
+            last_day date := (now() at time zone 'utc')::date + {PREMAKE_DAYS};
+        BEGIN
+            WHILE day <= last_day LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF forwarding_logs FOR VALUES FROM (%L) TO (%L)',
+                    'forwarding_logs_p' || to_char(day, 'YYYYMMDD'), day, day + 1
+                );
+                day := day + 1;
+            END LOOP;
+        END
+        $$;
+    """)
+
+    op.execute("INSERT INTO forwarding_logs SELECT * FROM forwarding_logs_unpartitioned")
+    op.execute("DROP TABLE forwarding_logs_unpartitioned")
+
+    op.execute("CREATE INDEX ix_forwarding_logs_user_created ON forwarding_logs (user_id, created_at)")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE forwarding_logs RENAME TO forwarding_logs_partitioned")
+    op.execute(
+        "CREATE TABLE forwarding_logs "
+        "(LIKE forwarding_logs_partitioned INCLUDING DEFAULTS INCLUDING GENERATED)"
+    )
+    op.execute("ALTER TABLE forwarding_logs ADD PRIMARY KEY (id)")
+    op.execute("ALTER SEQUENCE forwarding_logs_id_seq OWNED BY forwarding_logs.id")
+    op.execute("INSERT INTO forwarding_logs SELECT * FROM forwarding_logs_partitioned")
+    op.execute("DROP TABLE forwarding_logs_partitioned")
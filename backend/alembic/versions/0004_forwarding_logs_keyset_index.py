@@ -0,0 +1,30 @@
+"""keyset pagination index on forwarding_logs
+
+Revision ID: 0004_forwarding_logs_keyset_index
+Revises: 0003_partition_forwarding_logs
+Create Date: 2026-10-17 00:00:00.000000
+
+``/stats/logs`` pages by seeking on (created_at, id) in descending order per
+user; this index serves that scan directly and supersedes the plain
+(user_id, created_at) index.
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0004_forwarding_logs_keyset_index"
+down_revision = "0003_partition_forwarding_logs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX ix_forwarding_logs_user_created_id "
+        "ON forwarding_logs (user_id, created_at DESC, id DESC)"
+    )
+    op.execute("DROP INDEX IF EXISTS ix_forwarding_logs_user_created")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX ix_forwarding_logs_user_created ON forwarding_logs (user_id, created_at)")
+    op.execute("DROP INDEX IF EXISTS ix_forwarding_logs_user_created_id")
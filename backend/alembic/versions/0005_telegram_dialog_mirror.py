@@ -0,0 +1,46 @@
+"""telegram dialog mirror
+
+Revision ID: 0005_telegram_dialog_mirror
+Revises: 0004_forwarding_logs_keyset_index
+Create Date: 2026-10-17 00:00:00.000000
+
+Per-user copy of the channels and groups in each Telegram account, served by
+``/channels/available`` (see ``app.services.dialog_mirror``).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0005_telegram_dialog_mirror"
+down_revision = "0004_forwarding_logs_keyset_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "telegram_dialogs",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("peer_id", sa.BigInteger(), nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=False, server_default=""),
+        sa.Column("username", sa.String(length=64), nullable=True),
+        sa.Column("dialog_type", sa.String(length=16), nullable=False),
+        sa.Column("is_broadcast", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("user_id", "peer_id"),
+    )
+    # Default ordering of /channels/available pages
+    op.execute("CREATE INDEX ix_telegram_dialogs_user_title ON telegram_dialogs (user_id, lower(title), peer_id)")
+    op.create_table(
+        "telegram_dialog_syncs",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("synced_at", sa.DateTime(), nullable=False),
+        sa.Column("dialog_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("telegram_dialog_syncs")
+    op.execute("DROP INDEX IF EXISTS ix_telegram_dialogs_user_title")
+    op.drop_table("telegram_dialogs")
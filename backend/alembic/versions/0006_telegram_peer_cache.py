@@ -0,0 +1,36 @@
+"""telegram peer resolution cache
+
+Revision ID: 0006_telegram_peer_cache
+Revises: 0005_telegram_dialog_mirror
+Create Date: 2026-10-17 00:00:00.000000
+
+Resolved peers, access hashes and access-check results per account (see
+``app.services.peer_cache``).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0006_telegram_peer_cache"
+down_revision = "0005_telegram_dialog_mirror"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "telegram_peers",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("peer_key", sa.String(length=128), nullable=False),
+        sa.Column("peer_id", sa.BigInteger(), nullable=True),
+        sa.Column("peer_type", sa.String(length=16), nullable=True),
+        sa.Column("access_hash", sa.BigInteger(), nullable=True),
+        sa.Column("has_access", sa.Boolean(), nullable=False),
+        sa.Column("resolved_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "peer_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("telegram_peers")
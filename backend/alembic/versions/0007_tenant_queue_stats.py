@@ -0,0 +1,37 @@
+"""tenant queue stats
+
+Revision ID: 0007_tenant_queue_stats
+Revises: 0006_telegram_peer_cache
+Create Date: 2026-10-17 00:00:00.000000
+
+Per-user queue depth and queueing delay published by the forwarder workers'
+fair scheduler (see ``app.services.tenant_scheduler``).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0007_tenant_queue_stats"
+down_revision = "0006_telegram_peer_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tenant_queue_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("worker", sa.String(length=32), nullable=False),
+        sa.Column("weight", sa.Float(), nullable=False),
+        sa.Column("queued", sa.Integer(), nullable=False),
+        sa.Column("processed", sa.Integer(), nullable=False),
+        sa.Column("wait_p50", sa.Float(), nullable=True),
+        sa.Column("wait_p95", sa.Float(), nullable=True),
+        sa.Column("wait_max", sa.Float(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("tenant_queue_stats")
@@ -0,0 +1,37 @@
+"""forwarding seen-message state
+
+Revision ID: 0008_forwarding_seen_state
+Revises: 0007_tenant_queue_stats
+Create Date: 2026-10-17 00:00:00.000000
+
+Persisted Bloom filter / LRU state of the forwarder's seen-message store (see
+``app.services.seen_store``), and an index for its fallback lookup of a
+(rule, source message) pair in ``forwarding_logs``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0008_forwarding_seen_state"
+down_revision = "0007_tenant_queue_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "forwarding_seen_state",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("state", sa.LargeBinary(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.execute(
+        "CREATE INDEX ix_forwarding_logs_rule_source_message "
+        "ON forwarding_logs (rule_id, source_message_id)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_forwarding_logs_rule_source_message")
+    op.drop_table("forwarding_seen_state")
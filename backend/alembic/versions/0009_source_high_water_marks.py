@@ -0,0 +1,34 @@
+"""source high-water marks
+
+Revision ID: 0009_source_high_water_marks
+Revises: 0008_forwarding_seen_state
+Create Date: 2026-10-17 00:00:00.000000
+
+Last processed message id and catch-up progress per user and source channel
+(see ``app.services.high_water``).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0009_source_high_water_marks"
+down_revision = "0008_forwarding_seen_state"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "source_high_water_marks",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("source_channel_id", sa.String(), nullable=False),
+        sa.Column("last_message_id", sa.BigInteger(), nullable=False),
+        sa.Column("catching_up", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("backlog", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "source_channel_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("source_high_water_marks")
@@ -0,0 +1,51 @@
+"""forwarding retries
+
+Revision ID: 0010_forwarding_retries
+Revises: 0009_source_high_water_marks
+Create Date: 2026-10-17 00:00:00.000000
+
+Retry queue of failed forwards (see ``app.services.retry_engine``), and a
+partial index the engine's scan for new FAILED rows runs on.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0010_forwarding_retries"
+down_revision = "0009_source_high_water_marks"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "forwarding_retries",
+        sa.Column("log_id", sa.BigInteger(), nullable=False),
+        sa.Column("log_created_at", sa.DateTime(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("rule_id", sa.Integer(), nullable=False),
+        sa.Column("source_channel_id", sa.String(), nullable=False),
+        sa.Column("target_channel_id", sa.String(), nullable=False),
+        sa.Column("source_message_id", sa.BigInteger(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("log_id"),
+    )
+    op.execute(
+        "CREATE INDEX ix_forwarding_retries_user_status_next "
+        "ON forwarding_retries (user_id, status, next_attempt_at)"
+    )
+    op.execute(
+        "CREATE INDEX ix_forwarding_logs_failed "
+        "ON forwarding_logs (user_id, id) WHERE status = 'FAILED'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_forwarding_logs_failed")
+    op.execute("DROP INDEX IF EXISTS ix_forwarding_retries_user_status_next")
+    op.drop_table("forwarding_retries")
@@ -0,0 +1,27 @@
+"""DEFAULT partition for forwarding_logs
+
+Revision ID: 0011_forwarding_logs_default_partition
+Revises: 0010_forwarding_retries
+Create Date: 2026-10-17 00:00:00.000000
+
+Catches rows for days whose partition has not been created yet (partition
+maintenance did not run for longer than the premake window), so inserts do
+not fail. ``app.services.log_partitions`` moves them into the day's partition
+when it creates it.
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0011_forwarding_logs_default_partition"
+down_revision = "0010_forwarding_retries"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE TABLE forwarding_logs_default PARTITION OF forwarding_logs DEFAULT")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE forwarding_logs DETACH PARTITION forwarding_logs_default")
+    op.execute("DROP TABLE forwarding_logs_default")
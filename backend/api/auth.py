@@ -2,32 +2,38 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User
 from app.schemas import UserCreate, UserLogin, UserResponse
 from app.core.security import create_access_token, verify_token
+from app.services.principal_cache import CachedPrincipal, principal_cache
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 security = HTTPBearer()
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user"""
+    db: AsyncSession = Depends(get_async_db)
+) -> CachedPrincipal:
+    """Get current authenticated user (id, is_active, subscription_active)"""
+    token = credentials.credentials
     try:
-        payload = verify_token(credentials.credentials)
+        payload = principal_cache.get_claims(token)
         if payload is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            payload = verify_token(token)
+            if payload is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid authentication credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            principal_cache.put_claims(token, payload)
         
         user_id: int = payload.get("user_id")
         if user_id is None:
@@ -44,23 +50,33 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
-    if user is None:
+    principal = principal_cache.get_user(user_id)
+    if principal is None:
+        user = await db.scalar(select(User).where(User.id == user_id, User.is_active == True))
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found or inactive",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        principal = principal_cache.put_user(user)
+    
+    if not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return user
+    return principal
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     logger.info(f"Registration attempt for email: {user_data.email}")
     
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         logger.warning(f"Registration failed - email already exists: {user_data.email}")
         raise HTTPException(
@@ -69,7 +85,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if username is taken
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
+    existing_username = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_username:
         logger.warning(f"Registration failed - username already exists: {user_data.username}")
         raise HTTPException(
@@ -88,8 +104,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
         
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         
         # Create access token
         access_token = create_access_token({"user_id": user.id})
@@ -107,7 +123,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Registration error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -115,14 +131,14 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
 
 @router.post("/login", response_model=UserResponse)
-async def login(login_data: UserLogin, db: Session = Depends(get_db)):
+async def login(login_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user with email"""
     logger.info(f"Login attempt for email: {login_data.email}")
     
-    user = db.query(User).filter(
+    user = await db.scalar(select(User).where(
         User.email == login_data.email,
         User.is_active == True
-    ).first()
+    ))
     
     if not user:
         logger.warning(f"Login failed - user not found: {login_data.email}")
@@ -134,7 +150,10 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
     try:
         # Update last login
         user.updated_at = datetime.utcnow()
-        db.commit()
+        await db.commit()
+        
+        # A fresh login re-reads the principal rather than trusting a stale entry
+        principal_cache.put_user(user)
         
         # Create access token
         access_token = create_access_token({"user_id": user.id})
@@ -152,7 +171,7 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Login error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -160,15 +179,26 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
         )
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get current user information"""
+    user = await db.scalar(select(User).where(User.id == current_user.id))
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
     return UserResponse(
-        id=current_user.id,
-        email=current_user.email,
-        username=current_user.username,
-        subscription_active=current_user.subscription_active,
-        is_active=current_user.is_active,
-        created_at=current_user.created_at
+        id=user.id,
+        email=user.email,
+        username=user.username,
+        subscription_active=user.subscription_active,
+        is_active=user.is_active,
+        created_at=user.created_at
     )
 
 @router.post("/refresh")
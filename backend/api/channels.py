@@ -1,13 +1,16 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User, TelegramChannel
 from app.schemas import ChannelCreate, ChannelResponse
 from app.api.auth import get_current_user
-from app.services.telegram_service import TelegramService
+from app.services.peer_cache import peer_cache
+from app.services.dialog_mirror import dialog_mirror
+from app.services.forwarder_control import publish_command, RELOAD_RULES
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,13 +19,13 @@ router = APIRouter()
 @router.get("/", response_model=List[ChannelResponse])
 async def get_channels(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all channels for the current user"""
     try:
-        channels = db.query(TelegramChannel).filter(
+        channels = (await db.scalars(select(TelegramChannel).where(
             TelegramChannel.user_id == current_user.id
-        ).order_by(TelegramChannel.created_at.desc()).all()
+        ).order_by(TelegramChannel.created_at.desc()))).all()
         
         return [
             ChannelResponse(
@@ -46,7 +49,7 @@ async def get_channels(
 async def add_channel(
     channel_data: ChannelCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Add a new channel"""
     logger.info(f"Adding channel {channel_data.channel_name} for user {current_user.id}")
@@ -60,10 +63,10 @@ async def add_channel(
         )
     
     # Check if channel already exists for this user
-    existing_channel = db.query(TelegramChannel).filter(
+    existing_channel = await db.scalar(select(TelegramChannel).where(
         TelegramChannel.user_id == current_user.id,
         TelegramChannel.channel_id == channel_data.channel_id
-    ).first()
+    ))
     
     if existing_channel:
         logger.warning(f"Channel {channel_data.channel_id} already exists for user {current_user.id}")
@@ -72,10 +75,9 @@ async def add_channel(
             detail="Channel already added"
         )
     
-    # Verify channel access using Telegram service
-    telegram_service = TelegramService()
+    # Verify channel access (cached per account, see peer_cache)
     try:
-        has_access = await telegram_service.verify_channel_access(
+        has_access = await peer_cache.verify_channel_access(
             current_user.id, 
             channel_data.channel_id
         )
@@ -102,8 +104,9 @@ async def add_channel(
         )
         
         db.add(channel)
-        db.commit()
-        db.refresh(channel)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        await db.refresh(channel)
         
         logger.info(f"Channel {channel.channel_name} added successfully for user {current_user.id}")
         
@@ -117,7 +120,7 @@ async def add_channel(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error adding channel: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -129,13 +132,13 @@ async def update_channel(
     channel_id: int,
     channel_data: ChannelCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a channel"""
-    channel = db.query(TelegramChannel).filter(
+    channel = await db.scalar(select(TelegramChannel).where(
         TelegramChannel.id == channel_id,
         TelegramChannel.user_id == current_user.id
-    ).first()
+    ))
     
     if not channel:
         raise HTTPException(
@@ -148,8 +151,9 @@ async def update_channel(
         channel.channel_type = channel_data.channel_type
         channel.channel_id = channel_data.channel_id
         
-        db.commit()
-        db.refresh(channel)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        await db.refresh(channel)
         
         logger.info(f"Channel {channel_id} updated successfully for user {current_user.id}")
         
@@ -163,7 +167,7 @@ async def update_channel(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating channel {channel_id}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -174,13 +178,13 @@ async def update_channel(
 async def delete_channel(
     channel_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a channel"""
-    channel = db.query(TelegramChannel).filter(
+    channel = await db.scalar(select(TelegramChannel).where(
         TelegramChannel.id == channel_id,
         TelegramChannel.user_id == current_user.id
-    ).first()
+    ))
     
     if not channel:
         raise HTTPException(
@@ -192,11 +196,11 @@ async def delete_channel(
         # Check if channel is used in any forwarding rules
         from app.models import ForwardingRule
         
-        rules_using_channel = db.query(ForwardingRule).filter(
+        rules_using_channel = (await db.scalars(select(ForwardingRule).where(
             ForwardingRule.user_id == current_user.id,
             (ForwardingRule.source_channel_id == channel.channel_id) |
             (ForwardingRule.target_channel_id == channel.channel_id)
-        ).all()
+        ))).all()
         
         if rules_using_channel:
             raise HTTPException(
@@ -204,8 +208,9 @@ async def delete_channel(
                 detail="Cannot delete channel that is used in forwarding rules. Please delete the rules first."
             )
         
-        db.delete(channel)
-        db.commit()
+        await db.delete(channel)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
         
         logger.info(f"Channel {channel_id} deleted successfully for user {current_user.id}")
         
@@ -214,7 +219,7 @@ async def delete_channel(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error deleting channel {channel_id}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -225,13 +230,13 @@ async def delete_channel(
 async def toggle_channel_status(
     channel_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Toggle channel active status"""
-    channel = db.query(TelegramChannel).filter(
+    channel = await db.scalar(select(TelegramChannel).where(
         TelegramChannel.id == channel_id,
         TelegramChannel.user_id == current_user.id
-    ).first()
+    ))
     
     if not channel:
         raise HTTPException(
@@ -241,8 +246,9 @@ async def toggle_channel_status(
     
     try:
         channel.is_active = not channel.is_active
-        db.commit()
-        db.refresh(channel)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        await db.refresh(channel)
         
         logger.info(f"Channel {channel_id} status toggled to {channel.is_active} for user {current_user.id}")
         
@@ -256,7 +262,7 @@ async def toggle_channel_status(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error toggling channel {channel_id} status: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -265,15 +271,24 @@ async def toggle_channel_status(
 
 @router.get("/available")
 async def get_available_channels(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    search: Optional[str] = Query(None, description="Filter by title or username"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    refresh: bool = Query(False, description="Resync the dialog mirror from Telegram first")
 ):
     """Get list of available channels from Telegram for the user"""
     try:
-        telegram_service = TelegramService()
-        channels = await telegram_service.get_user_channels(current_user.id)
+        await dialog_mirror.ensure_synced(db, current_user.id, refresh)
+        channels, total = await dialog_mirror.list_channels(db, current_user.id, search, offset, limit)
+        
+        next_offset = offset + len(channels)
         
         return {
             "channels": channels,
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None,
             "message": "Available channels fetched successfully"
         }
         
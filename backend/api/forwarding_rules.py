@@ -1,9 +1,10 @@
 # app/api/forwarding_rules.py
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User, ForwardingRule, TelegramChannel
 from app.schemas import (
     ForwardingRuleCreate, 
@@ -12,6 +13,7 @@ from app.schemas import (
     ForwardingLogResponse
 )
 from app.api.auth import get_current_user
+from app.services.forwarder_control import publish_command, RELOAD_RULES
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,19 +22,19 @@ router = APIRouter()
 @router.get("/", response_model=List[ForwardingRuleResponse])
 async def get_forwarding_rules(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     active_only: bool = Query(False, description="Return only active rules")
 ):
     """Get all forwarding rules for the current user"""
     try:
-        query = db.query(ForwardingRule).filter(
+        query = select(ForwardingRule).where(
             ForwardingRule.user_id == current_user.id
         )
         
         if active_only:
-            query = query.filter(ForwardingRule.is_active == True)
+            query = query.where(ForwardingRule.is_active == True)
         
-        rules = query.order_by(ForwardingRule.created_at.desc()).all()
+        rules = (await db.scalars(query.order_by(ForwardingRule.created_at.desc()))).all()
         
         return [
             ForwardingRuleResponse(
@@ -60,16 +62,16 @@ async def get_forwarding_rules(
 async def create_forwarding_rule(
     rule_data: ForwardingRuleCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new forwarding rule"""
     logger.info(f"Creating forwarding rule for user {current_user.id}")
     
     # Check subscription limits
     if not current_user.subscription_active:
-        existing_rules_count = db.query(ForwardingRule).filter(
+        existing_rules_count = await db.scalar(select(func.count()).select_from(ForwardingRule).where(
             ForwardingRule.user_id == current_user.id
-        ).count()
+        ))
         
         if existing_rules_count >= 3:  # Free tier limit
             logger.warning(f"User {current_user.id} exceeded free tier limit for forwarding rules")
@@ -79,11 +81,11 @@ async def create_forwarding_rule(
             )
     
     # Validate that source and target channels exist and belong to user
-    source_channel = db.query(TelegramChannel).filter(
+    source_channel = await db.scalar(select(TelegramChannel).where(
         TelegramChannel.user_id == current_user.id,
         TelegramChannel.channel_id == rule_data.source_channel_id,
         TelegramChannel.is_active == True
-    ).first()
+    ))
     
     if not source_channel:
         raise HTTPException(
@@ -91,11 +93,11 @@ async def create_forwarding_rule(
             detail="Source channel not found or not accessible"
         )
     
-    target_channel = db.query(TelegramChannel).filter(
+    target_channel = await db.scalar(select(TelegramChannel).where(
         TelegramChannel.user_id == current_user.id,
         TelegramChannel.channel_id == rule_data.target_channel_id,
         TelegramChannel.is_active == True
-    ).first()
+    ))
     
     if not target_channel:
         raise HTTPException(
@@ -104,11 +106,11 @@ async def create_forwarding_rule(
         )
     
     # Check for duplicate rules
-    existing_rule = db.query(ForwardingRule).filter(
+    existing_rule = await db.scalar(select(ForwardingRule).where(
         ForwardingRule.user_id == current_user.id,
         ForwardingRule.source_channel_id == rule_data.source_channel_id,
         ForwardingRule.target_channel_id == rule_data.target_channel_id
-    ).first()
+    ))
     
     if existing_rule:
         raise HTTPException(
@@ -128,8 +130,9 @@ async def create_forwarding_rule(
         )
         
         db.add(rule)
-        db.commit()
-        db.refresh(rule)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        await db.refresh(rule)
         
         logger.info(f"Forwarding rule {rule.id} created successfully for user {current_user.id}")
         
@@ -147,7 +150,7 @@ async def create_forwarding_rule(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error creating forwarding rule: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -158,13 +161,13 @@ async def create_forwarding_rule(
 async def get_forwarding_rule(
     rule_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific forwarding rule"""
-    rule = db.query(ForwardingRule).filter(
+    rule = await db.scalar(select(ForwardingRule).where(
         ForwardingRule.id == rule_id,
         ForwardingRule.user_id == current_user.id
-    ).first()
+    ))
     
     if not rule:
         raise HTTPException(
@@ -190,13 +193,13 @@ async def update_forwarding_rule(
     rule_id: int,
     rule_data: ForwardingRuleUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a forwarding rule"""
-    rule = db.query(ForwardingRule).filter(
+    rule = await db.scalar(select(ForwardingRule).where(
         ForwardingRule.id == rule_id,
         ForwardingRule.user_id == current_user.id
-    ).first()
+    ))
     
     if not rule:
         raise HTTPException(
@@ -211,8 +214,9 @@ async def update_forwarding_rule(
         for field, value in update_data.items():
             setattr(rule, field, value)
         
-        db.commit()
-        db.refresh(rule)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        await db.refresh(rule)
         
         logger.info(f"Forwarding rule {rule_id} updated successfully for user {current_user.id}")
         
@@ -221,5 +225,100 @@ async def update_forwarding_rule(
             source_channel_id=rule.source_channel_id,
             target_channel_id=rule.target_channel_id,
             filter_keywords=rule.filter_keywords,
-            exclude_keywords=rule.exclude_
-        )
\ No newline at end of file
+            exclude_keywords=rule.exclude_keywords,
+            is_active=rule.is_active,
+            messages_forwarded=rule.messages_forwarded,
+            last_forwarded_at=rule.last_forwarded_at,
+            created_at=rule.created_at,
+            updated_at=rule.updated_at
+        )
+        
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error updating forwarding rule {rule_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update forwarding rule"
+        )
+
+@router.delete("/{rule_id}")
+async def delete_forwarding_rule(
+    rule_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete a forwarding rule"""
+    rule = await db.scalar(select(ForwardingRule).where(
+        ForwardingRule.id == rule_id,
+        ForwardingRule.user_id == current_user.id
+    ))
+    
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Forwarding rule not found"
+        )
+    
+    try:
+        await db.delete(rule)
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        
+        logger.info(f"Forwarding rule {rule_id} deleted successfully for user {current_user.id}")
+        
+        return {"message": "Forwarding rule deleted successfully"}
+        
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error deleting forwarding rule {rule_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete forwarding rule"
+        )
+
+@router.patch("/{rule_id}/toggle", response_model=ForwardingRuleResponse)
+async def toggle_forwarding_rule(
+    rule_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Toggle forwarding rule active status"""
+    rule = await db.scalar(select(ForwardingRule).where(
+        ForwardingRule.id == rule_id,
+        ForwardingRule.user_id == current_user.id
+    ))
+    
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Forwarding rule not found"
+        )
+    
+    try:
+        rule.is_active = not rule.is_active
+        await publish_command(db, RELOAD_RULES, current_user.id)
+        await db.commit()
+        await db.refresh(rule)
+        
+        logger.info(f"Forwarding rule {rule_id} status toggled to {rule.is_active} for user {current_user.id}")
+        
+        return ForwardingRuleResponse(
+            id=rule.id,
+            source_channel_id=rule.source_channel_id,
+            target_channel_id=rule.target_channel_id,
+            filter_keywords=rule.filter_keywords,
+            exclude_keywords=rule.exclude_keywords,
+            is_active=rule.is_active,
+            messages_forwarded=rule.messages_forwarded,
+            last_forwarded_at=rule.last_forwarded_at,
+            created_at=rule.created_at,
+            updated_at=rule.updated_at
+        )
+        
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error toggling forwarding rule {rule_id} status: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to toggle forwarding rule status"
+        )
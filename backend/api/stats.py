@@ -1,14 +1,19 @@
 # app/api/stats.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select, func, case, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+import base64
 
-from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User, TelegramChannel, ForwardingRule, ForwardingLog, BotSession
 from app.schemas import StatsResponse, ForwardingLogResponse
 from app.api.auth import get_current_user
+from app.services.log_rollup import ForwardingLogDaily, ForwardingErrorDaily, error_fingerprint
+from app.services.latency import latency_recorder
+from app.services.tenant_scheduler import TenantQueueStats
+from app.services.retry_engine import retry_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,34 +22,34 @@ router = APIRouter()
 @router.get("/", response_model=StatsResponse)
 async def get_user_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get comprehensive statistics for the current user"""
     try:
         # Get channel count
-        total_channels = db.query(TelegramChannel).filter(
+        total_channels = await db.scalar(select(func.count()).select_from(TelegramChannel).where(
             TelegramChannel.user_id == current_user.id
-        ).count()
+        ))
         
         # Get rules count
-        total_rules = db.query(ForwardingRule).filter(
+        total_rules = await db.scalar(select(func.count()).select_from(ForwardingRule).where(
             ForwardingRule.user_id == current_user.id
-        ).count()
+        ))
         
-        active_rules = db.query(ForwardingRule).filter(
+        active_rules = await db.scalar(select(func.count()).select_from(ForwardingRule).where(
             ForwardingRule.user_id == current_user.id,
             ForwardingRule.is_active == True
-        ).count()
+        ))
         
         # Get total messages forwarded
-        total_messages_forwarded = db.query(func.sum(ForwardingRule.messages_forwarded)).filter(
+        total_messages_forwarded = await db.scalar(select(func.sum(ForwardingRule.messages_forwarded)).where(
             ForwardingRule.user_id == current_user.id
-        ).scalar() or 0
+        )) or 0
         
         # Get bot status
-        bot_session = db.query(BotSession).filter(
+        bot_session = await db.scalar(select(BotSession).where(
             BotSession.user_id == current_user.id
-        ).first()
+        ))
         
         bot_running = bot_session.is_running if bot_session else False
         
@@ -64,38 +69,70 @@ async def get_user_stats(
             detail="Failed to fetch user statistics"
         )
 
+def encode_log_cursor(created_at: datetime, log_id: int) -> str:
+    """Opaque keyset cursor pointing just past the given log row"""
+    raw = f"{created_at.isoformat()}|{log_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_log_cursor(cursor: str) -> Tuple[datetime, int]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, log_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|")
+    return datetime.fromisoformat(created_at), int(log_id)
+
 @router.get("/logs", response_model=List[ForwardingLogResponse])
 async def get_forwarding_logs(
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    page: int = Query(1, ge=1, description="Page number"),
+    db: AsyncSession = Depends(get_async_db),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    page: int = Query(1, ge=1, description="Page number (deprecated, ignored when cursor is given)"),
     limit: int = Query(50, ge=1, le=100, description="Items per page"),
     status_filter: str = Query(None, description="Filter by status (SUCCESS, FAILED, FILTERED)"),
     rule_id: int = Query(None, description="Filter by rule ID"),
     days: int = Query(7, ge=1, le=90, description="Number of days to look back")
 ):
-    """Get forwarding logs with filtering and pagination"""
+    """Get forwarding logs with filtering and keyset pagination"""
+    after = None
+    if cursor:
+        try:
+            after = decode_log_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+    
     try:
-        offset = (page - 1) * limit
-        
         # Base query
-        query = db.query(ForwardingLog).filter(
+        query = select(ForwardingLog).where(
             ForwardingLog.user_id == current_user.id
         )
         
         # Apply filters
         if status_filter:
-            query = query.filter(ForwardingLog.status == status_filter)
+            query = query.where(ForwardingLog.status == status_filter)
         
         if rule_id:
-            query = query.filter(ForwardingLog.rule_id == rule_id)
+            query = query.where(ForwardingLog.rule_id == rule_id)
         
         # Date filter
         start_date = datetime.utcnow() - timedelta(days=days)
-        query = query.filter(ForwardingLog.created_at >= start_date)
+        query = query.where(ForwardingLog.created_at >= start_date)
+        
+        # Seek past the last row of the previous page on (created_at, id),
+        # which the (user_id, created_at DESC, id DESC) index serves directly
+        if after:
+            query = query.where(tuple_(ForwardingLog.created_at, ForwardingLog.id) < after)
+        elif page > 1:
+            query = query.offset((page - 1) * limit)
+        
+        logs = (await db.scalars(query.order_by(
+            ForwardingLog.created_at.desc(),
+            ForwardingLog.id.desc()
+        ).limit(limit))).all()
         
-        # Get logs with pagination
-        logs = query.order_by(ForwardingLog.created_at.desc()).offset(offset).limit(limit).all()
+        if len(logs) == limit:
+            response.headers["X-Next-Cursor"] = encode_log_cursor(logs[-1].created_at, logs[-1].id)
         
         return [
             ForwardingLogResponse(
@@ -119,56 +156,101 @@ async def get_forwarding_logs(
 @router.get("/analytics")
 async def get_analytics(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     days: int = Query(30, ge=1, le=365, description="Number of days for analytics")
 ):
     """Get detailed analytics for the user"""
     try:
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Messages forwarded per day
-        daily_stats = db.query(
-            func.date(ForwardingLog.created_at).label('date'),
+        start_day = (datetime.utcnow() - timedelta(days=days)).date()
+        today = datetime.utcnow().date()
+        today_start = datetime.combine(today, datetime.min.time())
+        
+        # Closed days come from the daily rollup, one row per rule and day
+        rollup_stats = (await db.execute(select(
+            ForwardingLogDaily.day.label('date'),
+            func.sum(ForwardingLogDaily.successful).label('successful'),
+            func.sum(ForwardingLogDaily.failed).label('failed'),
+            func.sum(ForwardingLogDaily.filtered).label('filtered')
+        ).where(
+            ForwardingLogDaily.user_id == current_user.id,
+            ForwardingLogDaily.day >= start_day,
+            ForwardingLogDaily.day < today
+        ).group_by(ForwardingLogDaily.day).order_by(ForwardingLogDaily.day))).all()
+        
+        # Only today's rows are aggregated from the raw log table
+        today_stats = (await db.execute(select(
             func.count(ForwardingLog.id).label('total_messages'),
-            func.sum(func.case([(ForwardingLog.status == 'SUCCESS', 1)], else_=0)).label('successful'),
-            func.sum(func.case([(ForwardingLog.status == 'FAILED', 1)], else_=0)).label('failed'),
-            func.sum(func.case([(ForwardingLog.status == 'FILTERED', 1)], else_=0)).label('filtered')
-        ).filter(
+            func.sum(case((ForwardingLog.status == 'SUCCESS', 1), else_=0)).label('successful'),
+            func.sum(case((ForwardingLog.status == 'FAILED', 1), else_=0)).label('failed'),
+            func.sum(case((ForwardingLog.status == 'FILTERED', 1), else_=0)).label('filtered')
+        ).where(
             ForwardingLog.user_id == current_user.id,
-            ForwardingLog.created_at >= start_date
-        ).group_by(func.date(ForwardingLog.created_at)).order_by(func.date(ForwardingLog.created_at)).all()
+            ForwardingLog.created_at >= today_start
+        ))).one()
+        
+        daily_stats = [
+            {
+                "date": stat.date.isoformat(),
+                "total_messages": int((stat.successful or 0) + (stat.failed or 0) + (stat.filtered or 0)),
+                "successful": int(stat.successful or 0),
+                "failed": int(stat.failed or 0),
+                "filtered": int(stat.filtered or 0)
+            } for stat in rollup_stats
+        ]
+        
+        if today_stats.total_messages:
+            daily_stats.append({
+                "date": today.isoformat(),
+                "total_messages": today_stats.total_messages,
+                "successful": int(today_stats.successful or 0),
+                "failed": int(today_stats.failed or 0),
+                "filtered": int(today_stats.filtered or 0)
+            })
         
         # Top performing rules
-        top_rules = db.query(
+        top_rules = (await db.execute(select(
             ForwardingRule.id,
             ForwardingRule.source_channel_id,
             ForwardingRule.target_channel_id,
             ForwardingRule.messages_forwarded
-        ).filter(
+        ).where(
             ForwardingRule.user_id == current_user.id
-        ).order_by(ForwardingRule.messages_forwarded.desc()).limit(10).all()
+        ).order_by(ForwardingRule.messages_forwarded.desc()).limit(10))).all()
         
-        # Error analysis
-        error_stats = db.query(
+        # Error analysis: fingerprinted rollups for closed days plus today's raw errors
+        errors = {}
+        
+        rollup_errors = (await db.execute(select(
+            ForwardingErrorDaily.fingerprint,
+            func.min(ForwardingErrorDaily.error_message).label('error_message'),
+            func.sum(ForwardingErrorDaily.count).label('count')
+        ).where(
+            ForwardingErrorDaily.user_id == current_user.id,
+            ForwardingErrorDaily.day >= start_day,
+            ForwardingErrorDaily.day < today
+        ).group_by(ForwardingErrorDaily.fingerprint))).all()
+        
+        for error in rollup_errors:
+            errors[error.fingerprint] = [error.error_message, int(error.count)]
+        
+        today_errors = (await db.execute(select(
             ForwardingLog.error_message,
             func.count(ForwardingLog.id).label('count')
-        ).filter(
+        ).where(
             ForwardingLog.user_id == current_user.id,
             ForwardingLog.status == 'FAILED',
-            ForwardingLog.created_at >= start_date,
+            ForwardingLog.created_at >= today_start,
             ForwardingLog.error_message.isnot(None)
-        ).group_by(ForwardingLog.error_message).order_by(func.count(ForwardingLog.id).desc()).limit(5).all()
+        ).group_by(ForwardingLog.error_message))).all()
+        
+        for error in today_errors:
+            entry = errors.setdefault(error_fingerprint(error.error_message), [error.error_message, 0])
+            entry[1] += error.count
+        
+        common_errors = sorted(errors.values(), key=lambda entry: entry[1], reverse=True)[:5]
         
         return {
-            "daily_stats": [
-                {
-                    "date": stat.date.isoformat(),
-                    "total_messages": stat.total_messages,
-                    "successful": int(stat.successful or 0),
-                    "failed": int(stat.failed or 0),
-                    "filtered": int(stat.filtered or 0)
-                } for stat in daily_stats
-            ],
+            "daily_stats": daily_stats,
             "top_rules": [
                 {
                     "rule_id": rule.id,
@@ -179,9 +261,9 @@ async def get_analytics(
             ],
             "common_errors": [
                 {
-                    "error": error.error_message,
-                    "count": error.count
-                } for error in error_stats
+                    "error": error_message,
+                    "count": count
+                } for error_message, count in common_errors
             ]
         }
         
@@ -195,43 +277,74 @@ async def get_analytics(
 @router.get("/performance")
 async def get_performance_metrics(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get performance metrics"""
     try:
         # Recent performance (last 24 hours)
         last_24h = datetime.utcnow() - timedelta(hours=24)
         
-        recent_logs = db.query(ForwardingLog).filter(
+        recent = (await db.execute(select(
+            func.count(ForwardingLog.id).label('total'),
+            func.sum(case((ForwardingLog.status == 'SUCCESS', 1), else_=0)).label('successful'),
+            func.sum(case((ForwardingLog.status == 'FAILED', 1), else_=0)).label('failed')
+        ).where(
             ForwardingLog.user_id == current_user.id,
             ForwardingLog.created_at >= last_24h
-        ).all()
+        ))).one()
         
-        total_recent = len(recent_logs)
-        successful_recent = sum(1 for log in recent_logs if log.status == 'SUCCESS')
-        failed_recent = sum(1 for log in recent_logs if log.status == 'FAILED')
+        total_recent = int(recent.total or 0)
+        successful_recent = int(recent.successful or 0)
+        failed_recent = int(recent.failed or 0)
         
         success_rate = (successful_recent / total_recent * 100) if total_recent > 0 else 0
         
-        # Average processing time (mock data - would need actual timing in production)
-        avg_processing_time = 1.2  # seconds
+        # Processing time from the recorded per-message latency histograms
+        latency = await latency_recorder.histogram_since(db, current_user.id, last_24h)
+        
+        def seconds(value):
+            return round(value, 3) if value is not None else None
         
         # Bot uptime
-        bot_session = db.query(BotSession).filter(
+        bot_session = await db.scalar(select(BotSession).where(
             BotSession.user_id == current_user.id
-        ).first()
+        ))
         
         uptime_hours = 0
         if bot_session and bot_session.last_activity:
             uptime_hours = (datetime.utcnow() - bot_session.last_activity).total_seconds() / 3600
         
+        # Forwarder queue as last published by the worker serving this user
+        queue = await db.scalar(select(TenantQueueStats).where(
+            TenantQueueStats.user_id == current_user.id
+        ))
+        
+        # Automatic retries of failed forwards (queue depth now, outcomes over the last 24h)
+        retries = await retry_stats(db, current_user.id, last_24h)
+        
         return {
             "success_rate": round(success_rate, 2),
             "total_messages_24h": total_recent,
             "successful_messages_24h": successful_recent,
             "failed_messages_24h": failed_recent,
-            "avg_processing_time": avg_processing_time,
+            "avg_processing_time": seconds(latency.mean()) or 0,
+            "processing_time_percentiles": {
+                "p50": seconds(latency.percentile(50)),
+                "p95": seconds(latency.percentile(95)),
+                "p99": seconds(latency.percentile(99))
+            },
+            "processed_messages_24h": latency.count,
             "bot_uptime_hours": round(uptime_hours, 2),
+            "queue": {
+                "weight": queue.weight,
+                "depth": queue.queued,
+                "processed": queue.processed,
+                "wait_p50": seconds(queue.wait_p50),
+                "wait_p95": seconds(queue.wait_p95),
+                "wait_max": seconds(queue.wait_max),
+                "updated_at": queue.updated_at.isoformat()
+            } if queue else None,
+            "retries": retries,
             "last_updated": datetime.utcnow().isoformat()
         }
         
@@ -240,36 +353,4 @@ async def get_performance_metrics(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch performance metrics"
-        )
-
-@router.delete("/logs/cleanup")
-async def cleanup_old_logs(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    days_to_keep: int = Query(90, ge=7, le=365, description="Number of days of logs to keep")
-):
-    """Clean up old forwarding logs"""
-    try:
-        cutoff_date = datetime.utcnow() - timedelta(days=days_to_keep)
-        
-        deleted_count = db.query(ForwardingLog).filter(
-            ForwardingLog.user_id == current_user.id,
-            ForwardingLog.created_at < cutoff_date
-        ).delete()
-        
-        db.commit()
-        
-        logger.info(f"Cleaned up {deleted_count} old logs for user {current_user.id}")
-        
-        return {
-            "message": f"Successfully deleted {deleted_count} old log entries",
-            "deleted_count": deleted_count
-        }
-        
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error cleaning up logs for user {current_user.id}: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to cleanup old logs"
         )
\ No newline at end of file
@@ -2,14 +2,17 @@
 
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 
-from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User, Subscription
 from app.schemas import SubscriptionResponse
 from app.api.auth import get_current_user
 from app.services.paypal_service import PayPalService
+from app.services.principal_cache import principal_cache
+from app.services.forwarder_control import publish_command, RELOAD_PLAN
 import logging
 import json
 
@@ -19,13 +22,13 @@ router = APIRouter()
 @router.get("/status", response_model=SubscriptionResponse)
 async def get_subscription_status(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current subscription status"""
     try:
-        subscription = db.query(Subscription).filter(
+        subscription = await db.scalar(select(Subscription).where(
             Subscription.user_id == current_user.id
-        ).order_by(Subscription.created_at.desc()).first()
+        ).order_by(Subscription.created_at.desc()))
         
         if not subscription:
             raise HTTPException(
@@ -55,16 +58,16 @@ async def get_subscription_status(
 @router.post("/create")
 async def create_subscription(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new PayPal subscription"""
     logger.info(f"Creating subscription for user {current_user.id}")
     
     # Check if user already has an active subscription
-    existing_subscription = db.query(Subscription).filter(
+    existing_subscription = await db.scalar(select(Subscription).where(
         Subscription.user_id == current_user.id,
         Subscription.status.in_(["ACTIVE", "PENDING"])
-    ).first()
+    ))
     
     if existing_subscription:
         logger.warning(f"User {current_user.id} already has an active subscription")
@@ -89,8 +92,8 @@ async def create_subscription(
         )
         
         db.add(subscription)
-        db.commit()
-        db.refresh(subscription)
+        await db.commit()
+        await db.refresh(subscription)
         
         logger.info(f"Subscription created successfully for user {current_user.id}")
         
@@ -102,7 +105,7 @@ async def create_subscription(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error creating subscription for user {current_user.id}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -112,16 +115,16 @@ async def create_subscription(
 @router.post("/cancel")
 async def cancel_subscription(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cancel current subscription"""
     logger.info(f"Cancelling subscription for user {current_user.id}")
     
     # Get active subscription
-    subscription = db.query(Subscription).filter(
+    subscription = await db.scalar(select(Subscription).where(
         Subscription.user_id == current_user.id,
         Subscription.status == "ACTIVE"
-    ).first()
+    ))
     
     if not subscription:
         raise HTTPException(
@@ -141,9 +144,13 @@ async def cancel_subscription(
         if success:
             # Update subscription status
             subscription.status = "CANCELLED"
-            current_user.subscription_active = False
+            await db.execute(
+                update(User).where(User.id == current_user.id).values(subscription_active=False)
+            )
             
-            db.commit()
+            await publish_command(db, RELOAD_PLAN, current_user.id)
+            await db.commit()
+            principal_cache.invalidate_user(current_user.id)
             
             logger.info(f"Subscription cancelled successfully for user {current_user.id}")
             
@@ -157,7 +164,7 @@ async def cancel_subscription(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error cancelling subscription for user {current_user.id}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -165,7 +172,7 @@ async def cancel_subscription(
         )
 
 @router.post("/webhook")
-async def paypal_webhook(request: Request, db: Session = Depends(get_db)):
+async def paypal_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Handle PayPal webhook events"""
     try:
         body = await request.body()
@@ -206,97 +213,105 @@ async def paypal_webhook(request: Request, db: Session = Depends(get_db)):
             detail="Failed to process webhook"
         )
 
-async def handle_subscription_activated(resource: Dict[str, Any], db: Session):
+async def handle_subscription_activated(resource: Dict[str, Any], db: AsyncSession):
     """Handle subscription activation"""
     subscription_id = resource.get("id")
     
-    subscription = db.query(Subscription).filter(
+    subscription = await db.scalar(select(Subscription).where(
         Subscription.paypal_subscription_id == subscription_id
-    ).first()
+    ))
     
     if subscription:
         subscription.status = "ACTIVE"
         subscription.next_billing_time = resource.get("billing_info", {}).get("next_billing_time")
         
         # Activate user subscription
-        user = db.query(User).filter(User.id == subscription.user_id).first()
+        user = await db.scalar(select(User).where(User.id == subscription.user_id))
         if user:
             user.subscription_active = True
         
-        db.commit()
+        await publish_command(db, RELOAD_PLAN, subscription.user_id)
+        await db.commit()
+        principal_cache.invalidate_user(subscription.user_id)
         logger.info(f"Subscription {subscription_id} activated")
 
-async def handle_subscription_cancelled(resource: Dict[str, Any], db: Session):
+async def handle_subscription_cancelled(resource: Dict[str, Any], db: AsyncSession):
     """Handle subscription cancellation"""
     subscription_id = resource.get("id")
     
-    subscription = db.query(Subscription).filter(
+    subscription = await db.scalar(select(Subscription).where(
         Subscription.paypal_subscription_id == subscription_id
-    ).first()
+    ))
     
     if subscription:
         subscription.status = "CANCELLED"
         
         # Deactivate user subscription
-        user = db.query(User).filter(User.id == subscription.user_id).first()
+        user = await db.scalar(select(User).where(User.id == subscription.user_id))
         if user:
             user.subscription_active = False
         
-        db.commit()
+        await publish_command(db, RELOAD_PLAN, subscription.user_id)
+        await db.commit()
+        principal_cache.invalidate_user(subscription.user_id)
         logger.info(f"Subscription {subscription_id} cancelled")
 
-async def handle_subscription_suspended(resource: Dict[str, Any], db: Session):
+async def handle_subscription_suspended(resource: Dict[str, Any], db: AsyncSession):
     """Handle subscription suspension"""
     subscription_id = resource.get("id")
     
-    subscription = db.query(Subscription).filter(
+    subscription = await db.scalar(select(Subscription).where(
         Subscription.paypal_subscription_id == subscription_id
-    ).first()
+    ))
     
     if subscription:
         subscription.status = "SUSPENDED"
         
         # Deactivate user subscription
-        user = db.query(User).filter(User.id == subscription.user_id).first()
+        user = await db.scalar(select(User).where(User.id == subscription.user_id))
         if user:
             user.subscription_active = False
         
-        db.commit()
+        await publish_command(db, RELOAD_PLAN, subscription.user_id)
+        await db.commit()
+        principal_cache.invalidate_user(subscription.user_id)
         logger.info(f"Subscription {subscription_id} suspended")
 
-async def handle_payment_failed(resource: Dict[str, Any], db: Session):
+async def handle_payment_failed(resource: Dict[str, Any], db: AsyncSession):
     """Handle payment failure"""
     subscription_id = resource.get("billing_agreement_id")
     
     if subscription_id:
-        subscription = db.query(Subscription).filter(
+        subscription = await db.scalar(select(Subscription).where(
             Subscription.paypal_subscription_id == subscription_id
-        ).first()
+        ))
         
         if subscription:
             # Log payment failure but don't immediately deactivate
             logger.warning(f"Payment failed for subscription {subscription_id}")
             # You might want to implement retry logic or grace period
 
-async def handle_payment_completed(resource: Dict[str, Any], db: Session):
+async def handle_payment_completed(resource: Dict[str, Any], db: AsyncSession):
     """Handle successful payment"""
     subscription_id = resource.get("billing_agreement_id")
     
     if subscription_id:
-        subscription = db.query(Subscription).filter(
+        subscription = await db.scalar(select(Subscription).where(
             Subscription.paypal_subscription_id == subscription_id
-        ).first()
+        ))
         
         if subscription:
             # Ensure subscription is active
             if subscription.status != "ACTIVE":
                 subscription.status = "ACTIVE"
                 
-                user = db.query(User).filter(User.id == subscription.user_id).first()
+                user = await db.scalar(select(User).where(User.id == subscription.user_id))
                 if user:
                     user.subscription_active = True
                 
-                db.commit()
+                await publish_command(db, RELOAD_PLAN, subscription.user_id)
+                await db.commit()
+                principal_cache.invalidate_user(subscription.user_id)
             
             logger.info(f"Payment completed for subscription {subscription_id}")
 
@@ -326,14 +341,14 @@ async def get_subscription_plans():
 @router.post("/retry-payment")
 async def retry_payment(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Retry failed payment for subscription"""
     # Get user's subscription
-    subscription = db.query(Subscription).filter(
+    subscription = await db.scalar(select(Subscription).where(
         Subscription.user_id == current_user.id,
         Subscription.status.in_(["SUSPENDED", "PENDING"])
-    ).first()
+    ))
     
     if not subscription:
         raise HTTPException(
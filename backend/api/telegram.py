@@ -1,32 +1,39 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Optional
 
-from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User, BotSession
 from app.schemas import BotStatusResponse
 from app.api.auth import get_current_user
 from app.services.telegram_service import TelegramService
+from app.services.client_registry import client_registry
+from app.services.dialog_mirror import dialog_mirror
+from app.services.peer_cache import peer_cache
+from app.services.forwarder_control import publish_command, START, STOP, RESET_ACCOUNT
+from app.services.high_water import CATCH_UP_RATE, catch_up_status
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+class BotStatusWithCatchUpResponse(BotStatusResponse):
+    catch_up: Optional[Dict[str, Any]] = None
+
 @router.post("/start-bot")
 async def start_telegram_bot(
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Start the Telegram bot for message forwarding"""
     logger.info(f"Starting Telegram bot for user {current_user.id}")
     
     try:
-        telegram_service = TelegramService()
-        
-        bot_session = db.query(BotSession).filter(
+        bot_session = await db.scalar(select(BotSession).where(
             BotSession.user_id == current_user.id
-        ).first()
+        ))
         
         if bot_session and bot_session.is_running:
             return {
@@ -34,11 +41,6 @@ async def start_telegram_bot(
                 "status": "running"
             }
         
-        background_tasks.add_task(
-            telegram_service.start_forwarding, 
-            current_user.id
-        )
-        
         if not bot_session:
             bot_session = BotSession(
                 user_id=current_user.id,
@@ -50,7 +52,9 @@ async def start_telegram_bot(
             bot_session.is_running = True
             bot_session.is_authenticated = True
         
-        db.commit()
+        # The forwarder worker owning this user picks the command up on commit
+        await publish_command(db, START, current_user.id)
+        await db.commit()
         
         logger.info(f"Telegram bot started successfully for user {current_user.id}")
         
@@ -69,24 +73,21 @@ async def start_telegram_bot(
 @router.post("/stop-bot")
 async def stop_telegram_bot(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Stop the Telegram bot"""
     logger.info(f"Stopping Telegram bot for user {current_user.id}")
     
     try:
-        telegram_service = TelegramService()
-        
-       
-        await telegram_service.stop_forwarding(current_user.id)
-        
-        bot_session = db.query(BotSession).filter(
+        bot_session = await db.scalar(select(BotSession).where(
             BotSession.user_id == current_user.id
-        ).first()
+        ))
         
         if bot_session:
             bot_session.is_running = False
-            db.commit()
+        
+        await publish_command(db, STOP, current_user.id)
+        await db.commit()
         
         logger.info(f"Telegram bot stopped successfully for user {current_user.id}")
         
@@ -102,37 +103,55 @@ async def stop_telegram_bot(
             detail="Failed to stop Telegram bot"
         )
 
-@router.get("/bot-status", response_model=BotStatusResponse)
+@router.get("/bot-status", response_model=BotStatusWithCatchUpResponse)
 async def get_bot_status(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current bot status"""
     try:
         from app.models import ForwardingRule
         
-        bot_session = db.query(BotSession).filter(
+        bot_session = await db.scalar(select(BotSession).where(
             BotSession.user_id == current_user.id
-        ).first()
+        ))
         
-        active_rules_count = db.query(ForwardingRule).filter(
+        active_rules_count = await db.scalar(select(func.count()).select_from(ForwardingRule).where(
             ForwardingRule.user_id == current_user.id,
             ForwardingRule.is_active == True
-        ).count()
+        ))
         
         if not bot_session:
-            return BotStatusResponse(
+            return BotStatusWithCatchUpResponse(
                 running=False,
                 authenticated=False,
                 last_activity=None,
                 active_rules=active_rules_count
             )
         
-        return BotStatusResponse(
+        # Backfill of messages posted while the bot was down, as reported by the worker
+        marks = await catch_up_status(db, current_user.id)
+        catch_up = {
+            "rate": CATCH_UP_RATE,
+            "catching_up": any(mark.catching_up for mark in marks),
+            "backlog": sum(mark.backlog for mark in marks if mark.catching_up),
+            "sources": [
+                {
+                    "source_channel_id": mark.source_channel_id,
+                    "last_message_id": mark.last_message_id,
+                    "catching_up": mark.catching_up,
+                    "backlog": mark.backlog if mark.catching_up else 0,
+                    "updated_at": mark.updated_at
+                } for mark in marks
+            ]
+        }
+        
+        return BotStatusWithCatchUpResponse(
             running=bot_session.is_running,
             authenticated=bot_session.is_authenticated,
             last_activity=bot_session.last_activity,
-            active_rules=active_rules_count
+            active_rules=active_rules_count,
+            catch_up=catch_up
         )
         
     except Exception as e:
@@ -146,7 +165,7 @@ async def get_bot_status(
 async def authenticate_telegram(
     phone_number: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Authenticate with Telegram using phone number"""
     logger.info(f"Authenticating Telegram for user {current_user.id}")
@@ -157,10 +176,17 @@ async def authenticate_telegram(
      
         client = await telegram_service.create_client(current_user.id, phone_number)
         
+        # Any shared client still holds the previous session, and the mirrored
+        # dialogs and resolved peers may belong to a different account
+        await client_registry.invalidate(current_user.id)
+        await dialog_mirror.reset(db, current_user.id)
+        await peer_cache.invalidate_user(db, current_user.id)
+        await publish_command(db, RESET_ACCOUNT, current_user.id)
+        
        
-        bot_session = db.query(BotSession).filter(
+        bot_session = await db.scalar(select(BotSession).where(
             BotSession.user_id == current_user.id
-        ).first()
+        ))
         
         if not bot_session:
             bot_session = BotSession(
@@ -174,7 +200,7 @@ async def authenticate_telegram(
             bot_session.phone_number = phone_number
             bot_session.is_authenticated = True
         
-        db.commit()
+        await db.commit()
         
         logger.info(f"Telegram authentication successful for user {current_user.id}")
         
@@ -192,16 +218,25 @@ async def authenticate_telegram(
 
 @router.get("/channels/available")
 async def get_available_telegram_channels(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    search: Optional[str] = Query(None, description="Filter by title or username"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    refresh: bool = Query(False, description="Resync the dialog mirror from Telegram first")
 ):
     """Get list of available Telegram channels for the user"""
     try:
-        telegram_service = TelegramService()
-        channels = await telegram_service.get_user_channels(current_user.id)
+        await dialog_mirror.ensure_synced(db, current_user.id, refresh)
+        channels, total = await dialog_mirror.list_channels(db, current_user.id, search, offset, limit)
+        
+        next_offset = offset + len(channels)
         
         return {
             "channels": channels,
-            "count": len(channels)
+            "count": len(channels),
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None
         }
         
     except Exception as e:
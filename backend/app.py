@@ -10,9 +10,12 @@ import logging
 import sys
 
 from app.core.config import settings
-from app.database import engine
+from app.async_database import async_engine
 from app.api import auth, channels, forwarding_rules, subscription, telegram, stats
-import app.models as models
+from app.services.log_partitions import log_partition_maintainer
+from app.services.principal_cache import principal_cache
+from app.services.client_registry import client_registry
+from app.services.peer_cache import peer_cache
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,14 +32,21 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up Telegram Forwarder API")
     
-    # Create database tables
-    models.Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created/verified")
+    # The schema is owned by the alembic migrations (``alembic upgrade head``), not created here
+    await log_partition_maintainer.start()
+    # The workers' forwarders hold the session files; the API connects on short-lived copies
+    client_registry.use_session_copies()
+    await client_registry.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down Telegram Forwarder API")
+    
+    await log_partition_maintainer.stop()
+    await client_registry.stop()
+    
+    await async_engine.dispose()
 
 # Create FastAPI app
 app = FastAPI(
@@ -61,6 +71,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Global exception handler
@@ -78,7 +89,12 @@ async def health_check():
     return {
         "status": "healthy",
         "service": settings.app_name,
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "caches": {
+            "principals": principal_cache.stats(),
+            "peers": peer_cache.stats()
+        },
+        "telegram_clients": client_registry.stats()
     }
 
 # Include API routers
@@ -0,0 +1,6 @@
+# app/benchmarks/__init__.py
+"""
+Standalone micro-benchmarks for the forwarding hot paths.
+
+Each module is runnable with ``python -m app.benchmarks.<name>``.
+"""
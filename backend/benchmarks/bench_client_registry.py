@@ -0,0 +1,80 @@
+# app/benchmarks/bench_client_registry.py
+"""
+Telegram request latency: a fresh client per request vs. the client registry.
+
+Uses ``FakeTelegramClient`` with a simulated connect handshake and round trip,
+so it runs without Telegram credentials.
+
+Run with ``python -m app.benchmarks.bench_client_registry [--users N --requests N]``.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.benchmarks.fakes import FakeTelegramClient
+from app.services.client_registry import ClientRegistry
+
+
+async def per_request(user_id, args):
+    """What the endpoints did before: connect, authorize, list, disconnect"""
+    client = FakeTelegramClient(args.dialogs, args.connect_delay, args.rtt)
+    await client.connect()
+    try:
+        await client.is_user_authorized()
+        return [dialog async for dialog in client.iter_dialogs()]
+    finally:
+        await client.disconnect()
+
+
+async def measure(label, call, args):
+    rng = random.Random(args.seed)
+    latencies = []
+
+    async def one(user_id):
+        started = time.perf_counter()
+        await call(user_id)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(args.requests // args.concurrency):
+        await asyncio.gather(*(one(rng.randrange(args.users)) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = sorted(latency * 1e3 for latency in latencies)
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95)]
+    print(f"{label:9s} wall={elapsed:6.2f}s median={statistics.median(latencies_ms):7.1f}ms p95={p95:7.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--max-connections", type=int, default=40)
+    parser.add_argument("--dialogs", type=int, default=150)
+    parser.add_argument("--connect-delay", type=float, default=0.3)
+    parser.add_argument("--rtt", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    registry = ClientRegistry(
+        factory=lambda user_id: FakeTelegramClient(args.dialogs, args.connect_delay, args.rtt),
+        max_connections=args.max_connections,
+    )
+
+    async def via_registry(user_id):
+        async with registry.client(user_id) as client:
+            return [dialog async for dialog in client.iter_dialogs()]
+
+    print(f"users={args.users} requests={args.requests} concurrency={args.concurrency} "
+          f"max_connections={args.max_connections} connect={args.connect_delay * 1e3:.0f}ms rtt={args.rtt * 1e3:.0f}ms")
+    await measure("fresh", lambda user_id: per_request(user_id, args), args)
+    await measure("registry", via_registry, args)
+    print(f"registry: {registry.stats()}")
+    await registry.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+# app/benchmarks/bench_event_loop_lag.py
+"""
+Event loop stall under concurrent DB load: sync Session vs. AsyncSession.
+
+A ticker task stands in for the Telethon clients sharing the loop and records
+how late each tick fires while N concurrent "requests" each run a slow query,
+first through a blocking psycopg2 session called from the loop (the old
+``get_db`` routers) and then through an asyncpg ``AsyncSession``.
+
+Run with ``python -m app.benchmarks.bench_event_loop_lag --database-url postgresql://...``.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.async_database import async_database_url
+
+TICK_INTERVAL = 0.005
+
+
+async def ticker(lags, stop: asyncio.Event):
+    """Record how far past its deadline each tick wakes up"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK_INTERVAL
+        await asyncio.sleep(TICK_INTERVAL)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run_scenario(request, concurrency: int, rounds: int):
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(request() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick_task
+    return elapsed, lags
+
+
+def report(label, elapsed, lags):
+    lags_ms = sorted(lag * 1e3 for lag in lags) or [0.0]
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(
+        f"{label:6s} wall={elapsed:6.2f}s ticks={len(lags):5d} "
+        f"lag median={statistics.median(lags_ms):7.2f}ms p99={p99:7.2f}ms max={lags_ms[-1]:7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent requests per round")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--query-seconds", type=float, default=0.05, help="Server-side duration of each query")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    query = text("SELECT pg_sleep(:seconds)")
+    params = {"seconds": args.query_seconds}
+
+    sync_engine = create_engine(args.database_url, pool_size=args.concurrency)
+    SyncSession = sessionmaker(bind=sync_engine)
+
+    async def sync_request():
+        # What the routers did before: a blocking driver call inside a coroutine
+        db = SyncSession()
+        try:
+            db.execute(query, params)
+        finally:
+            db.close()
+
+    async_engine = create_async_engine(async_database_url(args.database_url), pool_size=args.concurrency)
+    AsyncSessionFactory = async_sessionmaker(async_engine, class_=AsyncSession)
+
+    async def async_request():
+        async with AsyncSessionFactory() as db:
+            await db.execute(query, params)
+
+    # Warm both pools so connection setup is not measured
+    await asyncio.gather(*(async_request() for _ in range(args.concurrency)))
+    await sync_request()
+
+    print(f"concurrency={args.concurrency} rounds={args.rounds} query={args.query_seconds * 1e3:.0f}ms")
+    report("sync", *await run_scenario(sync_request, args.concurrency, args.rounds))
+    report("async", *await run_scenario(async_request, args.concurrency, args.rounds))
+
+    sync_engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
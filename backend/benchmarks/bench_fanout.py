@@ -0,0 +1,63 @@
+# app/benchmarks/bench_fanout.py
+"""
+End-to-end latency of one source message fanned out to many targets: sends
+one after another (concurrency 1, the previous dispatcher) vs. concurrent
+fan-out through the send scheduler.
+
+Run with ``python -m app.benchmarks.bench_fanout [--targets N --rtt S]``.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.benchmarks.fakes import FakeFloodingSender
+from app.services.send_scheduler import SendScheduler
+
+
+async def fan_out(scheduler, sender, targets, message):
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(scheduler.send(1, target, lambda target=target: sender.forward_messages(target, message)) for target in targets),
+        return_exceptions=True,
+    )
+    failures = sum(isinstance(result, Exception) for result in results)
+    return time.perf_counter() - started, failures
+
+
+async def measure(label, concurrency, args):
+    targets = [f"target-{index}" for index in range(args.targets)]
+    sender = FakeFloodingSender(account_rate=10_000, chat_interval=0, rtt=args.rtt)
+    scheduler = SendScheduler(
+        account_rate=args.targets,
+        account_burst=args.targets,
+        target_rate=1,
+        target_burst=1,
+        concurrency=concurrency,
+    )
+    latencies = []
+    for message in range(args.messages):
+        elapsed, failures = await fan_out(scheduler, sender, targets, message)
+        latencies.append(elapsed)
+        # Let the buckets refill between messages, as between real posts
+        await asyncio.sleep(1.0)
+    await scheduler.stop()
+    print(f"{label:10s} median={statistics.median(latencies) * 1e3:8.1f}ms max={max(latencies) * 1e3:8.1f}ms "
+          f"delivered={len(sender.delivered)}/{args.targets * args.messages} failed={failures}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--targets", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--rtt", type=float, default=0.08, help="Seconds per send")
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"targets={args.targets} rtt={args.rtt * 1e3:.0f}ms")
+    await measure("sequential", 1, args)
+    await measure("fan-out", args.concurrency, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
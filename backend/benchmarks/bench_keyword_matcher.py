@@ -0,0 +1,78 @@
+# app/benchmarks/bench_keyword_matcher.py
+"""
+Micro-benchmark: compiled keyword matcher vs. the naive per-rule loop.
+
+Run with ``python -m app.benchmarks.bench_keyword_matcher [--rules N]``.
+"""
+import argparse
+import random
+import string
+import time
+
+from app.services.keyword_matcher import KeywordMatcher, normalize_text
+
+
+def naive_match(rules, text):
+    """Reference implementation: check every rule's keywords one by one"""
+    matched = set()
+    for rule_id, include, exclude in rules:
+        lowered = normalize_text(text)
+        if include and not any(normalize_text(k) in lowered for k in include):
+            continue
+        if any(normalize_text(k) in lowered for k in exclude):
+            continue
+        matched.add(rule_id)
+    return matched
+
+
+def random_word(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, default=300)
+    parser.add_argument("--keywords", type=int, default=5, help="Keywords per rule")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [random_word(rng, rng.randint(4, 10)) for _ in range(5000)]
+    rules = [
+        (
+            rule_id,
+            rng.sample(vocabulary, args.keywords) if rule_id % 4 else [],
+            rng.sample(vocabulary, 2),
+        )
+        for rule_id in range(args.rules)
+    ]
+    messages = [
+        " ".join(rng.choice(vocabulary).capitalize() for _ in range(rng.randint(20, 80)))
+        for _ in range(args.messages)
+    ]
+
+    started = time.perf_counter()
+    matcher = KeywordMatcher(rules)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compiled_results = [matcher.match(message) for message in messages]
+    compiled_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive_results = [naive_match(rules, message) for message in messages]
+    naive_time = time.perf_counter() - started
+
+    assert compiled_results == naive_results, "compiled matcher disagrees with naive loop"
+
+    per_message = lambda total: total / len(messages) * 1e6
+    print(f"rules={args.rules} keywords/rule={args.keywords} messages={len(messages)}")
+    print(f"build:    {build_time * 1e3:8.2f} ms")
+    print(f"compiled: {per_message(compiled_time):8.1f} us/message")
+    print(f"naive:    {per_message(naive_time):8.1f} us/message")
+    print(f"speedup:  {naive_time / compiled_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
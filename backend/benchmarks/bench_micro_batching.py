@@ -0,0 +1,75 @@
+# app/benchmarks/bench_micro_batching.py
+"""
+A burst from one source (including a 10-item album) forwarded to several
+targets: one forward call per message (``FORWARD_BATCH_WINDOW=0``) vs.
+micro-batched multi-message forwards, both paced by the send scheduler.
+
+Reports forward calls, time until the whole burst landed, and whether every
+message got its own forwarded copy in order.
+
+Run with ``python -m app.benchmarks.bench_micro_batching [--burst N --targets N --window S]``.
+"""
+import argparse
+import asyncio
+import time
+
+from app.benchmarks.fakes import FakeFloodingSender
+from app.services.forward_batcher import ForwardBatcher
+from app.services.send_scheduler import SendScheduler
+
+
+class FakeMessage:
+    def __init__(self, id, grouped_id=None):
+        self.id = id
+        self.grouped_id = grouped_id
+
+
+async def measure(label, window, args):
+    sender = FakeFloodingSender(account_rate=20, chat_interval=0.25, rtt=args.rtt)
+    scheduler = SendScheduler()
+    batcher = ForwardBatcher(window=window, scheduler=scheduler)
+    targets = [f"target-{index}" for index in range(args.targets)]
+    messages = [
+        FakeMessage(index, grouped_id=1 if index < 10 else None) for index in range(1, args.burst + 1)
+    ]
+
+    started = time.perf_counter()
+    futures = []
+    for message in messages:
+        for target in targets:
+            futures.append((message, await batcher.submit(1, sender, "source", target, target, "source", message)))
+        # Posts of a burst arrive a few milliseconds apart
+        await asyncio.sleep(args.spacing)
+    copies = await asyncio.gather(*(future for _, future in futures), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    await scheduler.stop()
+
+    failed = sum(isinstance(copy, Exception) for copy in copies)
+    # Per target, copies must carry increasing ids in source message order
+    in_order = all(
+        ids == sorted(ids)
+        for ids in (
+            [copy.id for copy in copies if not isinstance(copy, Exception) and copy.chat == target]
+            for target in targets
+        )
+    )
+    print(f"{label:10s} calls={len(sender.delivered):4d} elapsed={elapsed:7.2f}s "
+          f"copies={len(copies) - failed}/{len(copies)} floods={sender.errors} in_order={in_order}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--burst", type=int, default=30)
+    parser.add_argument("--targets", type=int, default=5)
+    parser.add_argument("--spacing", type=float, default=0.01, help="Seconds between posts of the burst")
+    parser.add_argument("--window", type=float, default=0.3)
+    parser.add_argument("--rtt", type=float, default=0.08, help="Seconds per forward call")
+    args = parser.parse_args()
+
+    print(f"burst={args.burst} targets={args.targets} window={args.window * 1e3:.0f}ms")
+    await measure("unbatched", 0, args)
+    await measure("batched", args.window, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+# app/benchmarks/bench_seen_store.py
+"""
+Cost of the seen-message store: claims per second, memory per user and how
+often a Bloom hit has to be settled against the database.
+
+The database fallback is counted instead of queried, so this runs without
+PostgreSQL.
+
+Run with ``python -m app.benchmarks.bench_seen_store [--users N --messages N]``.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.services.seen_store import SeenStore
+
+
+class CountingSeenStore(SeenStore):
+    async def _was_forwarded(self, user_id, rule_id, message_id):
+        return False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5000, help="Distinct messages per user")
+    parser.add_argument("--rules", type=int, default=3)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Share of re-delivered messages")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    store = CountingSeenStore(persist_interval=0)
+    claims = duplicates_sent = 0
+
+    started = time.perf_counter()
+    for user_id in range(args.users):
+        for message_id in range(args.messages):
+            for rule_id in range(user_id * args.rules, (user_id + 1) * args.rules):
+                claims += 1
+                await store.claim(user_id, rule_id, message_id)
+                if rng.random() < args.duplicates:
+                    # Re-delivery shortly after the original
+                    claims += 1
+                    if await store.claim(user_id, rule_id, max(message_id - rng.randrange(50), 0)):
+                        duplicates_sent += 1
+    elapsed = time.perf_counter() - started
+
+    stats = store.stats()
+    print(f"users={args.users} messages/user={args.messages} rules/user={args.rules}")
+    print(f"claims={claims} in {elapsed:.2f}s ({claims / elapsed:,.0f}/s, {elapsed / claims * 1e6:.1f}us each)")
+    print(f"bloom bytes/user={stats['bytes'] // args.users} lru entries/user={store.lru_size}")
+    print(f"duplicates dropped={stats['duplicates']} duplicates sent={duplicates_sent} "
+          f"db fallbacks={stats['fallback_checks']} ({stats['fallback_checks'] / claims:.3%} of claims)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+# app/benchmarks/bench_send_scheduler.py
+"""
+Fan-out against a fake account that enforces Telegram-style flood limits:
+direct concurrent sends vs. the send scheduler.
+
+Run with ``python -m app.benchmarks.bench_send_scheduler [--targets N --messages N]``.
+"""
+import argparse
+import asyncio
+import time
+
+from app.benchmarks.fakes import FakeFloodingSender
+from app.services.send_scheduler import SendScheduler
+
+
+async def direct(sender, targets, messages):
+    failures = 0
+
+    async def one(target, message):
+        nonlocal failures
+        try:
+            await sender.forward_messages(target, message)
+        except Exception:
+            failures += 1
+
+    for message in range(messages):
+        await asyncio.gather(*(one(target, message) for target in targets))
+    return failures
+
+
+async def scheduled(sender, targets, messages, scheduler):
+    failures = 0
+
+    async def one(target, message):
+        nonlocal failures
+        try:
+            await scheduler.send(1, target, lambda: sender.forward_messages(target, message))
+        except Exception:
+            failures += 1
+
+    await asyncio.gather(*(one(target, message) for message in range(messages) for target in targets))
+    return failures
+
+
+def in_order(sender, targets):
+    delivered = {target: [message for chat, message in sender.delivered if chat == target] for target in targets}
+    return all(messages == sorted(messages) for messages in delivered.values())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--targets", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--account-rate", type=int, default=20, help="Sends per second the fake account allows")
+    parser.add_argument("--chat-interval", type=float, default=0.25, help="Minimum seconds between sends to one chat")
+    parser.add_argument("--flood-probability", type=float, default=0.02)
+    args = parser.parse_args()
+
+    targets = [f"target-{index}" for index in range(args.targets)]
+    total = args.targets * args.messages
+    print(f"targets={args.targets} messages={args.messages} sends={total}")
+
+    sender = FakeFloodingSender(args.account_rate, args.chat_interval, flood_probability=args.flood_probability)
+    started = time.perf_counter()
+    failures = await direct(sender, targets, args.messages)
+    print(f"direct:    {time.perf_counter() - started:6.2f}s delivered={len(sender.delivered)}/{total} failed={failures}")
+
+    sender = FakeFloodingSender(args.account_rate, args.chat_interval, flood_probability=args.flood_probability)
+    scheduler = SendScheduler(
+        account_rate=args.account_rate * 0.8,
+        account_burst=args.account_rate / 2,
+        target_rate=1 / args.chat_interval * 0.9,
+        target_burst=1,
+        max_pending=total,
+    )
+    started = time.perf_counter()
+    failures = await scheduled(sender, targets, args.messages, scheduler)
+    print(
+        f"scheduler: {time.perf_counter() - started:6.2f}s delivered={len(sender.delivered)}/{total} failed={failures} "
+        f"flood_waits={scheduler.flood_waits} in_order={in_order(sender, targets)}"
+    )
+    await scheduler.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
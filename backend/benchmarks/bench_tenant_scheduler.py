@@ -0,0 +1,118 @@
+# app/benchmarks/bench_tenant_scheduler.py
+"""
+Noisy neighbour: latency of light users while one user floods the worker,
+with a shared FIFO queue vs. the weighted fair tenant scheduler.
+
+Each message costs ``--service`` seconds of a processing slot. One free user
+dumps ``--burst`` messages at once; ``--light`` users (half of them premium)
+send one message every ``--interval`` seconds meanwhile.
+
+Run with ``python -m app.benchmarks.bench_tenant_scheduler [--burst N --light N]``.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.services.tenant_scheduler import TenantScheduler, tenant_weight
+
+NOISY = 0
+
+
+class FifoQueue:
+    """What a worker does without tenant scheduling: one queue, first come first served"""
+
+    def __init__(self, concurrency):
+        self.queue = asyncio.Queue()
+        self.slots = [asyncio.create_task(self._run()) for _ in range(concurrency)]
+
+    async def submit(self, user_id, work):
+        await self.queue.put(work)
+
+    async def _run(self):
+        while True:
+            work = await self.queue.get()
+            await work()
+
+    async def stop(self):
+        for slot in self.slots:
+            slot.cancel()
+        await asyncio.gather(*self.slots, return_exceptions=True)
+
+
+async def run(scheduler, args):
+    latencies = {}
+    done = asyncio.Event()
+    remaining = args.burst
+
+    def work(user_id, submitted):
+        async def process():
+            nonlocal remaining
+            await asyncio.sleep(args.service)
+            latencies.setdefault(user_id, []).append(time.perf_counter() - submitted)
+            if user_id == NOISY:
+                remaining -= 1
+                if not remaining:
+                    done.set()
+        return process
+
+    async def light(user_id):
+        for _ in range(args.messages):
+            await scheduler.submit(user_id, work(user_id, time.perf_counter()))
+            await asyncio.sleep(args.interval)
+
+    started = time.perf_counter()
+    for _ in range(args.burst):
+        await scheduler.submit(NOISY, work(NOISY, time.perf_counter()))
+    await asyncio.gather(*(light(user_id) for user_id in range(1, args.light + 1)))
+    await done.wait()
+    drained = time.perf_counter() - started
+    # let the last light messages finish
+    await asyncio.sleep(args.service * 4)
+    return latencies, drained
+
+
+def report(label, latencies, drained, args):
+    def ms(values, q):
+        values = sorted(values)
+        return values[min(int(len(values) * q), len(values) - 1)] * 1e3
+
+    free = [value for user_id in range(1, args.light + 1, 2) for value in latencies.get(user_id, [])]
+    premium = [value for user_id in range(2, args.light + 1, 2) for value in latencies.get(user_id, [])]
+    print(
+        f"{label:5s} light free p50={ms(free, 0.5):7.1f}ms p99={ms(free, 0.99):7.1f}ms | "
+        f"light premium p50={ms(premium, 0.5):7.1f}ms p99={ms(premium, 0.99):7.1f}ms | "
+        f"noisy p50={statistics.median(latencies[NOISY]) * 1e3:7.1f}ms drained in {drained:5.2f}s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--burst", type=int, default=2000, help="Messages dumped at once by the noisy user")
+    parser.add_argument("--light", type=int, default=20, help="Number of light users")
+    parser.add_argument("--messages", type=int, default=20, help="Messages per light user")
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--service", type=float, default=0.002, help="Slot time per message")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"burst={args.burst} light={args.light}x{args.messages} service={args.service * 1e3:.1f}ms "
+          f"concurrency={args.concurrency}")
+
+    fifo = FifoQueue(args.concurrency)
+    latencies, drained = await run(fifo, args)
+    await fifo.stop()
+    report("fifo", latencies, drained, args)
+
+    fair = TenantScheduler(concurrency=args.concurrency, max_pending=args.burst, flush_interval=0)
+    fair.set_weight(NOISY, tenant_weight(False))
+    for user_id in range(1, args.light + 1):
+        fair.set_weight(user_id, tenant_weight(user_id % 2 == 0))
+    await fair.start()
+    latencies, drained = await run(fair, args)
+    await fair.stop()
+    report("wfq", latencies, drained, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+# app/benchmarks/fakes.py
+"""
+In-memory stand-ins for Telethon objects used by the benchmarks.
+
+They model the latencies that matter (connect handshake, per-request round
+trip) without talking to Telegram.
+"""
+import asyncio
+
+
+class FakeEntity:
+    def __init__(self, id, title, username=None, broadcast=True):
+        self.id = id
+        self.title = title
+        self.username = username
+        self.broadcast = broadcast
+
+
+class FakeDialog:
+    def __init__(self, entity):
+        self.entity = entity
+        self.id = entity.id
+        self.name = entity.title
+        self.is_channel = True
+        self.is_group = not entity.broadcast
+
+
+class FakeTelegramClient:
+    """Connect costs ``connect_delay`` seconds, every request ``rtt`` seconds"""
+
+    def __init__(self, dialogs=100, connect_delay=0.3, rtt=0.02):
+        self.connect_delay = connect_delay
+        self.rtt = rtt
+        self.connected = False
+        self.connects = 0
+        self.requests = 0
+        self.entities = [
+            FakeEntity(-1000000000000 - index, f"Channel {index}", f"channel{index}" if index % 2 else None)
+            for index in range(dialogs)
+        ]
+
+    def is_connected(self):
+        return self.connected
+
+    async def connect(self):
+        await asyncio.sleep(self.connect_delay)
+        self.connected = True
+        self.connects += 1
+
+    async def disconnect(self):
+        self.connected = False
+
+    async def is_user_authorized(self):
+        await self._request()
+        return True
+
+    async def iter_dialogs(self):
+        # Dialogs arrive in pages of 100, one round trip each
+        for index, entity in enumerate(self.entities):
+            if index % 100 == 0:
+                await self._request()
+            yield FakeDialog(entity)
+
+    async def get_entity(self, peer):
+        await self._request()
+        for entity in self.entities:
+            if peer in (entity.id, entity.username, f"@{entity.username}"):
+                return entity
+        raise ValueError(f"Cannot find any entity corresponding to {peer!r}")
+
+    async def _request(self):
+        if not self.connected:
+            raise ConnectionError("client is not connected")
+        self.requests += 1
+        await asyncio.sleep(self.rtt)
+
+
+class FakeSentMessage:
+    def __init__(self, id, chat):
+        self.id = id
+        self.chat = chat
+
+
+class FakeFloodingSender:
+    """Send side of an account that answers rate violations like Telegram.
+
+    More than ``account_rate`` sends within one second raise FloodWaitError for
+    ``flood_seconds``; a second send to the same chat within ``chat_interval``
+    raises SlowModeWaitError for the remaining time. ``flood_probability``
+    injects additional random FloodWaitErrors.
+    """
+
+    def __init__(self, account_rate=20, chat_interval=0.25, flood_seconds=2, flood_probability=0.0, rtt=0.005, seed=7):
+        import random
+
+        self.account_rate = account_rate
+        self.chat_interval = chat_interval
+        self.flood_seconds = flood_seconds
+        self.flood_probability = flood_probability
+        self.rtt = rtt
+        self.rng = random.Random(seed)
+        self.recent = []
+        self.last_by_chat = {}
+        self.blocked_until = 0.0
+        self.delivered = []
+        self.copies = 0
+        self.errors = 0
+
+    async def forward_messages(self, entity, messages, from_peer=None):
+        from telethon.errors import FloodWaitError, SlowModeWaitError
+
+        await asyncio.sleep(self.rtt)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.recent = [sent_at for sent_at in self.recent if now - sent_at < 1.0]
+
+        if now < self.blocked_until or len(self.recent) >= self.account_rate or self.rng.random() < self.flood_probability:
+            self.errors += 1
+            if now >= self.blocked_until:
+                self.blocked_until = now + self.flood_seconds
+            raise FloodWaitError(request=None, capture=max(1, round(self.blocked_until - now)))
+        chat = str(entity)
+        last = self.last_by_chat.get(chat)
+        if last is not None and now - last < self.chat_interval:
+            self.errors += 1
+            raise SlowModeWaitError(request=None, capture=max(1, round(self.chat_interval - (now - last))))
+
+        self.recent.append(now)
+        self.last_by_chat[chat] = now
+        self.delivered.append((entity, messages))
+        if isinstance(messages, list):
+            # One copy per message, in order, like a multi-id ForwardMessagesRequest
+            self.copies += len(messages)
+            return [FakeSentMessage(self.copies - len(messages) + index + 1, entity) for index in range(len(messages))]
+        self.copies += 1
+        return FakeSentMessage(self.copies, entity)
@@ -0,0 +1,28 @@
+# app/services/__init__.py
+"""
+Service layer for Telegram Forwarder
+
+Long-lived helpers shared by the API routers and the forwarding worker:
+- keyword_matcher: compiled include/exclude keyword matching for forwarding rules
+- rule_index: in-memory source channel -> rules routing table for the forwarder
+- log_sink: buffered bulk writer for ForwardingLog rows
+- rule_counters: coalesced messages_forwarded / last_forwarded_at updates
+- log_rollup: per-user, per-rule daily rollups behind /stats/analytics
+- latency: per-message processing time histograms behind /stats/performance
+- log_partitions: daily partition creation and partition-drop retention for forwarding_logs
+- principal_cache: LRU + TTL cache of verified token claims and user principals
+- hash_ring: consistent hash ring assigning users to forwarder workers
+- forwarder_control: LISTEN/NOTIFY command channel from the API to the forwarder workers
+- client_registry: shared, capped pool of connected Telethon clients per user
+- dialog_mirror: persisted, update-driven copy of each account's channels behind /channels/available
+- peer_cache: LRU + Postgres cache of resolved peers, access hashes and access checks
+- send_scheduler: flood-wait-aware pacing of outgoing sends per account and target chat
+- tenant_scheduler: weighted fair queueing of message processing between the users of a worker
+- seen_store: Bloom filter + LRU of forwarded (rule, message) pairs that keeps forwarding idempotent
+- high_water: per-source last processed message ids driving catch-up after downtime
+- forward_batcher: per (source, target) coalescing of message bursts and albums into multi-message forwards
+- shared_sources: one listener per public source channel per worker, fanned out to subscribed users
+- outbox: fsync'd segment log of received messages, acknowledged after sending and replayed after a crash
+- retry_engine: classified, batched re-sends of failed forwards with exponential backoff
+- forwarding: per-user pipeline of the forwarder workers (listen, route, send, report)
+"""
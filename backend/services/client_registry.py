@@ -0,0 +1,265 @@
+# app/services/client_registry.py
+"""
+Process-wide registry of connected Telethon clients, keyed by user.
+
+Endpoints used to build a TelegramService (and a fresh TelegramClient) per
+request, paying the connect and auth handshakes on every call. The registry
+keeps one client per user and hands it out through ``client_registry.client(user_id)``:
+
+- clients connect lazily on first use and reconnect if Telegram dropped them;
+- at most ``TELEGRAM_CLIENT_MAX_CONNECTIONS`` clients are connected at once,
+  when full the least recently used idle client is disconnected to make room
+  and callers wait if every client is busy;
+- clients borrowed with ``pinned=True`` (a worker's forwarder, which holds its
+  client for as long as it runs) are exempt from the cap: they neither wait
+  for room nor count against it, so the forwarders a worker owns always get
+  their clients;
+- clients idle for longer than ``TELEGRAM_CLIENT_IDLE_TIMEOUT`` seconds are
+  disconnected by a background sweep.
+
+Clients are shared between concurrent requests for the same user; Telethon
+serialises requests on one connection itself. Reuse does not span processes:
+the forwarders run in the worker processes, each with its own registry, and
+the API has another. Both would open the same session files, so the API
+(:meth:`ClientRegistry.use_session_copies`) connects on an in-memory copy of
+the user's session and drops clients idle for ``TELEGRAM_API_CLIENT_IDLE_TIMEOUT``
+seconds, leaving the file itself to the worker's long-lived forwarder client.
+
+Services that follow a user's
+update stream (e.g. ``dialog_mirror``) register a connect hook, which runs
+once per client right after it is connected and authorized.
+"""
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
+import asyncio
+import logging
+import os
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_SESSION_DIR = os.getenv("TELEGRAM_SESSION_DIR", "sessions")
+TELEGRAM_CLIENT_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_CLIENT_MAX_CONNECTIONS", "200"))
+TELEGRAM_CLIENT_IDLE_TIMEOUT = float(os.getenv("TELEGRAM_CLIENT_IDLE_TIMEOUT", "600"))
+TELEGRAM_CLIENT_SWEEP_INTERVAL = float(os.getenv("TELEGRAM_CLIENT_SWEEP_INTERVAL", "60"))
+TELEGRAM_API_CLIENT_IDLE_TIMEOUT = float(os.getenv("TELEGRAM_API_CLIENT_IDLE_TIMEOUT", "30"))
+
+
+class ClientNotAuthorizedError(Exception):
+    """The user's Telegram session is missing or was logged out"""
+
+
+def session_path(user_id: int) -> str:
+    return os.path.join(TELEGRAM_SESSION_DIR, f"user_{user_id}")
+
+
+def _default_factory(user_id: int):
+    from telethon import TelegramClient
+
+    return TelegramClient(session_path(user_id), settings.telegram_api_id, settings.telegram_api_hash)
+
+
+def session_copy(user_id: int):
+    """In-memory copy of the user's session file (auth key and update state)"""
+    from telethon.sessions import SQLiteSession, StringSession
+
+    path = session_path(user_id) + ".session"
+    if not os.path.exists(path):
+        # Not logged in: the client reports itself unauthorized
+        return StringSession()
+    stored = SQLiteSession(path)
+    try:
+        session = StringSession(StringSession.save(stored))
+        for entity_id, state in stored.get_update_states():
+            session.set_update_state(entity_id, state)
+    finally:
+        stored.close()
+    return session
+
+
+def _session_copy_factory(user_id: int):
+    from telethon import TelegramClient
+
+    return TelegramClient(session_copy(user_id), settings.telegram_api_id, settings.telegram_api_hash)
+
+
+def parse_peer(channel_id: str) -> Union[int, str]:
+    """Channel ids are stored as text: numeric ids or @usernames / t.me links"""
+    try:
+        return int(channel_id)
+    except (TypeError, ValueError):
+        return channel_id
+
+
+class _Entry:
+    __slots__ = ("client", "users", "pinned", "authorized", "last_used", "connect_lock")
+
+    def __init__(self, client):
+        self.client = client
+        self.users = 0
+        self.pinned = 0
+        self.authorized = False
+        self.last_used = time.monotonic()
+        self.connect_lock = asyncio.Lock()
+
+
+class ClientRegistry:
+    """LRU of connected Telethon clients with a connection cap and idle eviction"""
+
+    def __init__(
+        self,
+        factory: Callable[[int], Any] = _default_factory,
+        max_connections: int = TELEGRAM_CLIENT_MAX_CONNECTIONS,
+        idle_timeout: float = TELEGRAM_CLIENT_IDLE_TIMEOUT,
+        sweep_interval: float = TELEGRAM_CLIENT_SWEEP_INTERVAL,
+    ):
+        self.factory = factory
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._available: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connect_hooks: List[Callable[[int, Any], Awaitable[None]]] = []
+        self.connects = 0
+        self.reuses = 0
+        self.evictions = 0
+
+    @property
+    def available(self) -> asyncio.Condition:
+        if self._available is None:
+            self._available = asyncio.Condition()
+        return self._available
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="telegram-client-sweep")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        async with self.available:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            await self._disconnect(entry)
+
+    def use_session_copies(self, idle_timeout: float = TELEGRAM_API_CLIENT_IDLE_TIMEOUT) -> None:
+        """Connect on copies of the session files and keep clients short-lived (the API process)"""
+        self.factory = _session_copy_factory
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = min(self.sweep_interval, idle_timeout)
+
+    def add_connect_hook(self, hook: Callable[[int, Any], Awaitable[None]]) -> None:
+        """Run ``hook(user_id, client)`` whenever a client becomes usable"""
+        self._connect_hooks.append(hook)
+
+    @asynccontextmanager
+    async def client(self, user_id: int, pinned: bool = False) -> AsyncIterator[Any]:
+        """Borrow the user's connected, authorized client (``pinned``: held for a forwarder's lifetime)"""
+        entry = await self._checkout(user_id, pinned)
+        try:
+            await self._ensure_connected(user_id, entry)
+            yield entry.client
+        finally:
+            async with self.available:
+                entry.users -= 1
+                if pinned:
+                    entry.pinned -= 1
+                entry.last_used = time.monotonic()
+                self.available.notify_all()
+
+    async def invalidate(self, user_id: int) -> None:
+        """Drop a user's client, e.g. after re-authentication replaced its session"""
+        async with self.available:
+            entry = self._entries.pop(user_id, None)
+            self.available.notify_all()
+        if entry is not None:
+            await self._disconnect(entry)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._entries),
+            "in_use": sum(1 for entry in self._entries.values() if entry.users),
+            "pinned": sum(1 for entry in self._entries.values() if entry.pinned),
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "evictions": self.evictions,
+        }
+
+    async def _checkout(self, user_id: int, pinned: bool = False) -> _Entry:
+        evicted = []
+        async with self.available:
+            while True:
+                entry = self._entries.get(user_id)
+                if entry is not None:
+                    self._entries.move_to_end(user_id)
+                    self.reuses += 1
+                    break
+                capped = sum(1 for candidate in self._entries.values() if not candidate.pinned)
+                if pinned or capped < self.max_connections:
+                    entry = self._entries[user_id] = _Entry(self.factory(user_id))
+                    break
+                idle = next((key for key, candidate in self._entries.items() if not candidate.users), None)
+                if idle is not None:
+                    evicted.append(self._entries.pop(idle))
+                    self.evictions += 1
+                    continue
+                # Every client is busy: wait for one to be returned
+                await self.available.wait()
+            entry.users += 1
+            if pinned:
+                entry.pinned += 1
+        for stale in evicted:
+            await self._disconnect(stale)
+        return entry
+
+    async def _ensure_connected(self, user_id: int, entry: _Entry) -> None:
+        async with entry.connect_lock:
+            if entry.client.is_connected() and entry.authorized:
+                return
+            if not entry.client.is_connected():
+                await entry.client.connect()
+                self.connects += 1
+            if not entry.authorized:
+                if not await entry.client.is_user_authorized():
+                    raise ClientNotAuthorizedError(f"Telegram session for user {user_id} is not authorized")
+                entry.authorized = True
+                for hook in self._connect_hooks:
+                    try:
+                        await hook(user_id, entry.client)
+                    except Exception as e:
+                        logger.error(f"Telegram client connect hook failed for user {user_id}: {str(e)}")
+
+    async def _disconnect(self, entry: _Entry) -> None:
+        try:
+            await entry.client.disconnect()
+        except Exception as e:
+            logger.warning(f"Error disconnecting Telegram client: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            async with self.available:
+                expired = [
+                    user_id for user_id, entry in self._entries.items()
+                    if not entry.users and entry.last_used < cutoff
+                ]
+                entries = [self._entries.pop(user_id) for user_id in expired]
+                self.evictions += len(entries)
+            for entry in entries:
+                await self._disconnect(entry)
+            if entries:
+                logger.info(f"Disconnected {len(entries)} idle Telegram clients")
+
+
+client_registry = ClientRegistry()
@@ -0,0 +1,290 @@
+# app/services/dialog_mirror.py
+"""
+Persistent per-user mirror of the channels and groups in a Telegram account.
+
+``/channels/available`` used to walk the account's whole dialog list on every
+call. The mirror is filled by one full sync per user and then kept current
+from the update stream of the user's registry clients: joining, leaving or
+being removed from a chat and title / username changes are applied as they
+arrive, and updates missed while no client was connected are fetched with
+``catch_up`` when one connects. The hook is registered in every process that
+imports this module: the forwarder workers keep it running on the long-lived
+clients of users whose bot is running, and a read in the API first makes
+sure its own client is connected and caught up, so an evicted client does
+not leave the mirror stale. A full resync is still scheduled in the
+background when the last one is older than ``DIALOG_MIRROR_MAX_AGE``.
+Endpoints read from ``telegram_dialogs`` with server-side search and paging.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, String, delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base
+from app.services.client_registry import client_registry
+
+logger = logging.getLogger(__name__)
+
+DIALOG_MIRROR_MAX_AGE = float(os.getenv("DIALOG_MIRROR_MAX_AGE", "86400"))
+DIALOG_MIRROR_BATCH_SIZE = int(os.getenv("DIALOG_MIRROR_BATCH_SIZE", "1000"))
+
+
+class TelegramDialog(Base):
+    __tablename__ = "telegram_dialogs"
+
+    user_id = Column(Integer, primary_key=True)
+    peer_id = Column(BigInteger, primary_key=True)
+    title = Column(String(255), nullable=False, default="")
+    username = Column(String(64), nullable=True)
+    dialog_type = Column(String(16), nullable=False)
+    is_broadcast = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class DialogSyncState(Base):
+    __tablename__ = "telegram_dialog_syncs"
+
+    user_id = Column(Integer, primary_key=True)
+    synced_at = Column(DateTime, nullable=False)
+    dialog_count = Column(Integer, nullable=False, default=0)
+
+
+def dialog_row(user_id: int, entity) -> Optional[Dict[str, Any]]:
+    """Mirror row for a channel / group entity, None for users and bots"""
+    from telethon import utils
+    from telethon.tl.types import Channel, Chat
+
+    if not isinstance(entity, (Channel, Chat)):
+        return None
+    username = getattr(entity, "username", None)
+    return {
+        "user_id": user_id,
+        "peer_id": utils.get_peer_id(entity),
+        "title": (entity.title or "")[:255],
+        "username": username,
+        "dialog_type": "public" if username else "private",
+        "is_broadcast": bool(getattr(entity, "broadcast", False)),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def channel_response(dialog: TelegramDialog) -> Dict[str, Any]:
+    return {
+        "id": str(dialog.peer_id),
+        "title": dialog.title,
+        "username": dialog.username,
+        "type": dialog.dialog_type,
+        "is_broadcast": dialog.is_broadcast,
+    }
+
+
+async def upsert_dialogs(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    for start in range(0, len(rows), DIALOG_MIRROR_BATCH_SIZE):
+        stmt = pg_insert(TelegramDialog).values(rows[start:start + DIALOG_MIRROR_BATCH_SIZE])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[TelegramDialog.user_id, TelegramDialog.peer_id],
+            set_={
+                "title": stmt.excluded.title,
+                "username": stmt.excluded.username,
+                "dialog_type": stmt.excluded.dialog_type,
+                "is_broadcast": stmt.excluded.is_broadcast,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        ))
+
+
+class DialogMirror:
+    """Full sync, live updates and reads for ``telegram_dialogs``"""
+
+    def __init__(self, max_age: float = DIALOG_MIRROR_MAX_AGE):
+        self.max_age = max_age
+        # Full syncs in progress; concurrent callers for a user share one
+        self._syncs: Dict[int, asyncio.Task] = {}
+        self._background: Dict[int, asyncio.Task] = {}
+        # Catch-up of the client most recently attached per user
+        self._catch_ups: Dict[int, asyncio.Task] = {}
+        self.full_syncs = 0
+        self.updates_applied = 0
+
+    async def full_sync(self, user_id: int) -> int:
+        """Replace a user's mirror with their current dialog list"""
+        task = self._syncs.get(user_id)
+        if task is None:
+            task = self._syncs[user_id] = asyncio.create_task(self._full_sync(user_id), name=f"dialog-sync-{user_id}")
+            task.add_done_callback(lambda done: self._forget(self._syncs, user_id, done))
+        return await asyncio.shield(task)
+
+    async def _full_sync(self, user_id: int) -> int:
+        rows = []
+        async with client_registry.client(user_id) as client:
+            async for dialog in client.iter_dialogs():
+                row = dialog_row(user_id, dialog.entity)
+                if row is not None:
+                    rows.append(row)
+
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(delete(TelegramDialog).where(
+                    TelegramDialog.user_id == user_id,
+                    TelegramDialog.peer_id.notin_([row["peer_id"] for row in rows])
+                ))
+                await upsert_dialogs(db, rows)
+                stmt = pg_insert(DialogSyncState).values(
+                    user_id=user_id, synced_at=datetime.utcnow(), dialog_count=len(rows)
+                )
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=[DialogSyncState.user_id],
+                    set_={"synced_at": stmt.excluded.synced_at, "dialog_count": stmt.excluded.dialog_count},
+                ))
+        self.full_syncs += 1
+        logger.info(f"Dialog mirror for user {user_id} synced ({len(rows)} chats)")
+        return len(rows)
+
+    async def ensure_synced(self, db: AsyncSession, user_id: int, refresh: bool = False) -> None:
+        """Full sync on first use or on request; stale mirrors resync in the background"""
+        synced_at = await db.scalar(select(DialogSyncState.synced_at).where(DialogSyncState.user_id == user_id))
+        if synced_at is None or refresh:
+            await self.full_sync(user_id)
+            return
+        await self._follow(user_id)
+        if synced_at < datetime.utcnow() - timedelta(seconds=self.max_age):
+            self._resync_in_background(user_id)
+
+    async def _follow(self, user_id: int) -> None:
+        """Connect a hooked client if none is (it was evicted) and wait for its catch-up"""
+        try:
+            async with client_registry.client(user_id):
+                catch_up = self._catch_ups.get(user_id)
+                if catch_up is not None:
+                    await asyncio.shield(catch_up)
+        except Exception as e:
+            logger.warning(f"Serving the dialog mirror of user {user_id} without catching up: {str(e)}")
+
+    async def reset(self, db: AsyncSession, user_id: int) -> None:
+        """Forget a user's mirror (new login); the next read does a full sync"""
+        await db.execute(delete(TelegramDialog).where(TelegramDialog.user_id == user_id))
+        await db.execute(delete(DialogSyncState).where(DialogSyncState.user_id == user_id))
+
+    async def list_channels(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        search: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 100,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of mirrored chats ordered by title, plus the total matching"""
+        filters = [TelegramDialog.user_id == user_id]
+        if search:
+            pattern = f"%{search.strip().lstrip('@')}%"
+            filters.append(or_(TelegramDialog.title.ilike(pattern), TelegramDialog.username.ilike(pattern)))
+
+        total = await db.scalar(select(func.count()).select_from(TelegramDialog).where(*filters))
+        dialogs = (await db.scalars(
+            select(TelegramDialog).where(*filters)
+            .order_by(func.lower(TelegramDialog.title), TelegramDialog.peer_id)
+            .offset(offset).limit(limit)
+        )).all()
+        return [channel_response(dialog) for dialog in dialogs], total
+
+    async def attach(self, user_id: int, client) -> None:
+        """Registry connect hook: follow the client's updates, then catch up on missed ones"""
+        from telethon import events
+        from telethon.tl.types import UpdateChannel
+
+        async def on_channel_update(update) -> None:
+            await self._on_channel_update(user_id, client, update)
+
+        async def on_chat_action(event) -> None:
+            await self._on_chat_action(user_id, client, event)
+
+        client.add_event_handler(on_channel_update, events.Raw(UpdateChannel))
+        client.add_event_handler(on_chat_action, events.ChatAction())
+        task = self._catch_ups[user_id] = asyncio.create_task(self._catch_up(user_id, client))
+        task.add_done_callback(lambda done: self._forget(self._catch_ups, user_id, done))
+
+    async def _catch_up(self, user_id: int, client) -> None:
+        try:
+            await client.catch_up()
+        except Exception as e:
+            logger.warning(f"Dialog mirror catch-up failed for user {user_id}: {str(e)}")
+
+    async def _on_channel_update(self, user_id: int, client, update) -> None:
+        # Sent when we join, leave, get removed from or see a change to a channel
+        from telethon import utils
+        from telethon.errors import RPCError
+        from telethon.tl.types import PeerChannel
+
+        peer = PeerChannel(update.channel_id)
+        try:
+            entity = await client.get_entity(peer)
+        except (ValueError, RPCError):
+            entity = None
+        if entity is None or getattr(entity, "left", False):
+            await self._remove(user_id, utils.get_peer_id(peer))
+        else:
+            await self._upsert(user_id, entity)
+
+    async def _on_chat_action(self, user_id: int, client, event) -> None:
+        if event.new_title:
+            await self._upsert(user_id, await event.get_chat())
+            return
+        if not (event.user_joined or event.user_added or event.user_left or event.user_kicked):
+            return
+        if event.user_id != await client.get_peer_id("me"):
+            return
+        if event.user_left or event.user_kicked:
+            await self._remove(user_id, event.chat_id)
+        else:
+            await self._upsert(user_id, await event.get_chat())
+
+    async def _upsert(self, user_id: int, entity) -> None:
+        row = dialog_row(user_id, entity)
+        if row is None:
+            return
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await upsert_dialogs(db, [row])
+        self.updates_applied += 1
+
+    async def _remove(self, user_id: int, peer_id: int) -> None:
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(delete(TelegramDialog).where(
+                    TelegramDialog.user_id == user_id,
+                    TelegramDialog.peer_id == peer_id
+                ))
+        self.updates_applied += 1
+
+    def _resync_in_background(self, user_id: int) -> None:
+        task = self._background.get(user_id)
+        if task is not None and not task.done():
+            return
+
+        async def resync() -> None:
+            try:
+                await self.full_sync(user_id)
+            except Exception as e:
+                logger.error(f"Background dialog resync failed for user {user_id}: {str(e)}")
+            finally:
+                self._background.pop(user_id, None)
+
+        self._background[user_id] = asyncio.create_task(resync(), name=f"dialog-resync-{user_id}")
+
+    @staticmethod
+    def _forget(tasks: Dict[int, asyncio.Task], user_id: int, done: asyncio.Task) -> None:
+        if tasks.get(user_id) is done:
+            del tasks[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"full_syncs": self.full_syncs, "updates_applied": self.updates_applied}
+
+
+dialog_mirror = DialogMirror()
+client_registry.add_connect_hook(dialog_mirror.attach)
@@ -0,0 +1,217 @@
+# app/services/forward_batcher.py
+"""
+Coalesces bursts from one source into multi-message forward requests.
+
+News channels post bursts (and albums arrive as one message per item), and
+every message used to cost its own forward call and send-scheduler token.
+The forwarder hands each (message, target) to :meth:`ForwardBatcher.submit`,
+which collects messages per (user, source, target) for up to
+``FORWARD_BATCH_WINDOW`` seconds after the first one, or until
+``FORWARD_BATCH_MAX_MESSAGES`` are collected, and then queues them on the send
+scheduler as a single ``forward_messages`` call:
+
+- messages keep their arrival order, and album items forwarded together stay
+  one album on the target; while parts of the album at the end of a batch are
+  still arriving, the window is extended by up to another window;
+- batches of one (source, target) are handed to the send scheduler strictly
+  in order;
+- messages are forwarded by id from the user's own input peer of the source,
+  as they may have been received by another account's client
+  (``shared_sources``);
+- every message gets its own future resolving to its forwarded copy, so the
+  log still records one row per message with its target message id; once
+  every message future of a batch is cancelled (its forwarder stopped), the
+  batch is withdrawn from the send scheduler, even while it waits out a
+  flood wait.
+
+``FORWARD_BATCH_WINDOW=0`` forwards every message on its own.
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+
+from app.services.send_scheduler import SendScheduler, send_scheduler
+
+logger = logging.getLogger(__name__)
+
+FORWARD_BATCH_WINDOW = float(os.getenv("FORWARD_BATCH_WINDOW", "0.3"))
+# Telegram accepts up to 100 ids per ForwardMessagesRequest
+FORWARD_BATCH_MAX_MESSAGES = int(os.getenv("FORWARD_BATCH_MAX_MESSAGES", "100"))
+
+_Key = Tuple[int, str, str]
+
+
+class NotForwardedError(Exception):
+    """Telegram accepted the request but returned no copy of this message"""
+
+
+class _Batch:
+    __slots__ = ("client", "target_peer", "source_peer", "messages", "futures", "timer", "added_at", "sent")
+
+    def __init__(self, client, target_peer, source_peer):
+        self.client = client
+        self.target_peer = target_peer
+        self.source_peer = source_peer
+        self.messages: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.Task] = None
+        self.added_at = 0.0
+        # The send scheduler's future once the batch is flushed
+        self.sent: Optional[asyncio.Future] = None
+
+    def abandoned(self) -> bool:
+        return all(future.cancelled() for future in self.futures)
+
+    def withdraw(self, _=None) -> None:
+        if self.sent is not None and not self.sent.done() and self.abandoned():
+            self.sent.cancel()
+
+
+class ForwardBatcher:
+    """Per (user, source, target) coalescing window in front of the send scheduler"""
+
+    def __init__(
+        self,
+        window: float = FORWARD_BATCH_WINDOW,
+        max_messages: int = FORWARD_BATCH_MAX_MESSAGES,
+        scheduler: SendScheduler = send_scheduler,
+    ):
+        self.window = window
+        self.max_messages = max(1, max_messages)
+        self.scheduler = scheduler
+        self._open: Dict[_Key, _Batch] = {}
+        self._order: Dict[_Key, asyncio.Lock] = {}
+        # Flushed batches whose send has not completed yet
+        self._sending: Dict[_Key, Set[_Batch]] = {}
+        self.batches = 0
+        self.messages = 0
+
+    async def submit(
+        self, user_id: int, client, source: str, target: str, target_peer, source_peer, message
+    ) -> asyncio.Future:
+        """Queue ``message`` for ``target``; the future resolves to its forwarded copy"""
+        future = asyncio.get_running_loop().create_future()
+        key = (user_id, source, target)
+        batch = self._open.get(key)
+        if batch is None:
+            batch = self._open[key] = _Batch(client, target_peer, source_peer)
+            if self.window > 0:
+                batch.timer = asyncio.create_task(self._flush_later(key, batch))
+        batch.messages.append(message)
+        batch.futures.append(future)
+        future.add_done_callback(batch.withdraw)
+        batch.added_at = asyncio.get_running_loop().time()
+
+        if self.window <= 0 or len(batch.messages) >= self.max_messages:
+            self._close(key, batch)
+            await self._flush(key, batch)
+        return future
+
+    def drop_user(self, user_id: int) -> None:
+        """Cancel a user's open and queued batches (forwarder stopped)"""
+        for key in [key for key in self._open if key[0] == user_id]:
+            batch = self._close(key, self._open[key])
+            for future in batch.futures:
+                future.cancel()
+        for key in [key for key in self._sending if key[0] == user_id]:
+            for batch in self._sending.pop(key):
+                for future in batch.futures:
+                    future.cancel()
+                if batch.sent is not None:
+                    batch.sent.cancel()
+        for key in [key for key in self._order if key[0] == user_id]:
+            del self._order[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": len(self._open),
+            "sending": sum(len(batches) for batches in self._sending.values()),
+            "batches": self.batches,
+            "messages": self.messages,
+            "messages_per_batch": round(self.messages / self.batches, 2) if self.batches else None,
+        }
+
+    def _close(self, key: _Key, batch: _Batch) -> _Batch:
+        if self._open.get(key) is batch:
+            del self._open[key]
+        if batch.timer is not None and batch.timer is not asyncio.current_task():
+            batch.timer.cancel()
+        return batch
+
+    async def _flush_later(self, key: _Key, batch: _Batch) -> None:
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(self.window)
+        # Album items arrive as separate updates; do not cut an album that is still arriving
+        while getattr(batch.messages[-1], "grouped_id", None) and loop.time() - batch.added_at < self.window:
+            await asyncio.sleep(batch.added_at + self.window - loop.time())
+        if self._open.get(key) is batch:
+            self._close(key, batch)
+            await self._flush(key, batch)
+
+    async def _flush(self, key: _Key, batch: _Batch) -> None:
+        user_id, _, target = key
+        message_ids = [message.id for message in batch.messages]
+        client, target_peer, source_peer = batch.client, batch.target_peer, batch.source_peer
+        lock = self._order.setdefault(key, asyncio.Lock())
+        try:
+            # Batches of a pair reach the send scheduler in the order they were opened
+            async with lock:
+                if batch.abandoned():
+                    return
+                sent = await self.scheduler.submit(
+                    user_id, target, lambda: client.forward_messages(target_peer, message_ids, from_peer=source_peer)
+                )
+        except asyncio.CancelledError:
+            for future in batch.futures:
+                future.cancel()
+            if asyncio.current_task().cancelling():
+                raise
+            # The scheduler dropped the user's account; the caller (a tenant slot) carries on
+            return
+        except Exception as e:
+            self._resolve(batch, error=e)
+            return
+        self.batches += 1
+        self.messages += len(message_ids)
+        batch.sent = sent
+        self._sending.setdefault(key, set()).add(batch)
+        sent.add_done_callback(lambda done: self._sent(key, batch, done))
+        # Every message was cancelled while the batch waited for its turn
+        batch.withdraw()
+
+    def _sent(self, key: _Key, batch: _Batch, done: asyncio.Future) -> None:
+        sending = self._sending.get(key)
+        if sending is not None:
+            sending.discard(batch)
+            if not sending:
+                del self._sending[key]
+        self._resolve(batch, done=done)
+
+    def _resolve(self, batch: _Batch, done: Optional[asyncio.Future] = None, error: Optional[BaseException] = None) -> None:
+        if done is not None:
+            if done.cancelled():
+                for future in batch.futures:
+                    future.cancel()
+                return
+            error = done.exception()
+        if error is not None:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        copies = done.result()
+        if not isinstance(copies, list):
+            copies = [copies]
+        for index, future in enumerate(batch.futures):
+            if future.done():
+                continue
+            copy = copies[index] if index < len(copies) else None
+            if copy is None:
+                future.set_exception(NotForwardedError("Telegram returned no forwarded copy"))
+            else:
+                future.set_result(copy)
+
+
+forward_batcher = ForwardBatcher()
@@ -0,0 +1,122 @@
+# app/services/forwarder_control.py
+"""
+Control channel between the API and the forwarder workers.
+
+The API publishes ``start``, ``stop``, ``reload_rules``, ``reload_plan`` and
+``reset_account`` (the user logged in again, possibly with another account)
+commands with PostgreSQL ``NOTIFY`` on ``forwarder_control``. NOTIFY is
+transactional, so a command published in the same session as the BotSession,
+rule or subscription change is only delivered once that change is committed.
+Every worker listens and acts only on the users the hash ring assigns to it.
+Notifications are not queued for disconnected listeners; workers resynchronise
+from ``bot_sessions`` whenever they (re)connect, so a missed command is picked
+up from the table.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import json
+import logging
+import os
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+CONTROL_CHANNEL = "forwarder_control"
+FORWARDER_CONTROL_RECONNECT_INTERVAL = float(os.getenv("FORWARDER_CONTROL_RECONNECT_INTERVAL", "5.0"))
+
+START = "start"
+STOP = "stop"
+RELOAD_RULES = "reload_rules"
+RELOAD_PLAN = "reload_plan"
+RESET_ACCOUNT = "reset_account"
+COMMANDS = (START, STOP, RELOAD_RULES, RELOAD_PLAN, RESET_ACCOUNT)
+
+
+async def publish_command(db: AsyncSession, command: str, user_id: int) -> None:
+    """Queue a command for the forwarders; delivered when ``db`` commits"""
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown forwarder command: {command}")
+    payload = json.dumps({"cmd": command, "user_id": user_id})
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CONTROL_CHANNEL, "payload": payload})
+
+
+def parse(payload: str) -> Optional[Dict[str, Any]]:
+    try:
+        message = json.loads(payload)
+        if message["cmd"] in COMMANDS:
+            return {"cmd": message["cmd"], "user_id": int(message["user_id"])}
+    except (ValueError, KeyError, TypeError):
+        pass
+    logger.warning(f"Ignoring malformed forwarder command: {payload!r}")
+    return None
+
+
+class ControlListener:
+    """Holds a dedicated asyncpg connection LISTENing on the control channel"""
+
+    def __init__(
+        self,
+        dsn: str,
+        on_command: Callable[[str, int], Awaitable[None]],
+        on_connect: Callable[[], Awaitable[None]],
+        reconnect_interval: float = FORWARDER_CONTROL_RECONNECT_INTERVAL,
+    ):
+        self.dsn = dsn
+        self.on_command = on_command
+        self.on_connect = on_connect
+        self.reconnect_interval = reconnect_interval
+        self._task: Optional[asyncio.Task] = None
+        # Commands being handled; the loop only keeps weak references to tasks
+        self._dispatches: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="forwarder-control")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _notify(self, connection, pid, channel, payload) -> None:
+        message = parse(payload)
+        if message is not None:
+            task = asyncio.create_task(self._dispatch(message["cmd"], message["user_id"]))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, command: str, user_id: int) -> None:
+        try:
+            await self.on_command(command, user_id)
+        except Exception as e:
+            logger.error(f"Forwarder command {command} for user {user_id} failed: {str(e)}")
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(CONTROL_CHANNEL, self._notify)
+                logger.info(f"Listening on {CONTROL_CHANNEL}")
+                # Anything published while we were not listening is recovered from the table
+                await self.on_connect()
+                while True:
+                    await asyncio.sleep(self.reconnect_interval)
+                    # Keepalive: a dead socket only surfaces when we use it
+                    await connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Forwarder control connection failed: {str(e)}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.reconnect_interval)
@@ -0,0 +1,378 @@
+# app/services/forwarding.py
+"""
+Per-user forwarding pipeline run by the forwarder workers.
+
+A ``UserForwarder`` borrows the user's client from the client registry for
+as long as it runs, listens for new messages in the chats behind the user's
+active source channels and forwards each message to the targets of the rules
+it matches:
+
+- routing is served from ``rule_index`` and target peers from ``peer_cache``,
+  so the hot path does not query the database or resolve usernames;
+- public source channels are followed through ``shared_sources``: one
+  forwarder per worker listens to a channel and delivers its messages to
+  every subscribed user, who forwards them by id with their own client;
+- ``seen_store`` drops (rule, message) pairs that were already forwarded, so
+  updates re-delivered after a reconnect or restart are not posted twice;
+- messages are processed in the worker's ``tenant_scheduler`` slots, shared
+  fairly between users; ``forward_batcher`` coalesces bursts per (source,
+  target) into multi-message forwards, and every forward goes through
+  ``send_scheduler``, which paces it and absorbs flood waits instead of
+  failing the message;
+- outcomes are reported to the log sink, rule counters and latency recorder;
+  failures are logged with their error class so ``retry_engine`` can tell
+  transient ones apart and re-drive them.
+
+Each time it (re)connects, the forwarder first catches up: for every source
+it fetches the messages above the source's high-water mark in batches of
+``CATCH_UP_BATCH_SIZE`` (at most ``CATCH_UP_MAX_MESSAGES``, oldest first) and
+queues them at ``CATCH_UP_RATE`` messages per second through the same path as
+live messages, which are held back per source until its backlog is queued.
+
+Every message is recorded in the worker's ``outbox`` before it is queued and
+acknowledged once its sends are recorded; entries left over from a crash are
+fetched by id and processed again when the user's forwarder connects, ahead
+of the catch-up.
+
+If the client disconnects or the handler setup fails, the forwarder retries
+after ``FORWARDER_RECONNECT_DELAY`` seconds until it is stopped.
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from app.async_database import AsyncSessionLocal
+from app.services.client_registry import ClientNotAuthorizedError, client_registry
+from app.services.rule_index import RuleRecord, rule_index, load_user_rules
+from app.services.peer_cache import peer_cache, peer_key
+from app.services.shared_sources import shared_sources
+from app.services.send_scheduler import TokenBucket
+from app.services.forward_batcher import forward_batcher
+from app.services.tenant_scheduler import tenant_scheduler
+from app.services.seen_store import seen_store
+from app.services.high_water import CATCH_UP_BATCH_SIZE, CATCH_UP_MAX_MESSAGES, CATCH_UP_RATE, high_water
+from app.services.outbox import OutboxEntry, outbox
+from app.services.retry_engine import describe_error
+from app.services.log_sink import forwarding_log_sink
+from app.services.rule_counters import rule_counters
+from app.services.latency import latency_recorder
+
+logger = logging.getLogger(__name__)
+
+FORWARDER_RECONNECT_DELAY = float(os.getenv("FORWARDER_RECONNECT_DELAY", "5.0"))
+
+
+class UserForwarder:
+    """Follows one user's source channels and forwards matching messages"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # Marked peer id of a source chat -> source_channel_id as stored on the rules
+        self._sources: Dict[int, str] = {}
+        # Peer ids of the public sources followed through shared_sources
+        self._public: Set[int] = set()
+        self._shared: Set[int] = set()
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self._completions: Set[asyncio.Task] = set()
+        self._held: Dict[str, List[Tuple[Any, float]]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"forwarder-user-{self.user_id}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        tenant_scheduler.remove_tenant(self.user_id)
+        forward_batcher.drop_user(self.user_id)
+        await high_water.unload(self.user_id)
+        for task in list(self._completions):
+            task.cancel()
+        await asyncio.gather(*self._completions, return_exceptions=True)
+        # Whatever did not complete is replayed when the user is started again
+        outbox.release_user(self.user_id)
+
+    async def refresh_sources(self, client=None) -> None:
+        """Reload the user's rules if needed and map source chats to their channel ids"""
+        if not rule_index.is_loaded(self.user_id):
+            async with AsyncSessionLocal() as db:
+                await load_user_rules(db, self.user_id)
+
+        sources: Dict[int, str] = {}
+        public: Set[int] = set()
+        for source in rule_index.sources(self.user_id):
+            try:
+                peer = await peer_cache.get(self.user_id, source, client, allow_expired=True)
+            except Exception as e:
+                logger.warning(f"Could not resolve source {source} for user {self.user_id}: {str(e)}")
+                continue
+            if peer.has_access:
+                sources[peer.peer_id] = source
+                if peer.peer_type == "channel" and not peer_key(source).lstrip("-").isdigit():
+                    public.add(peer.peer_id)
+            else:
+                logger.warning(f"User {self.user_id} has no access to source {source}, skipping it")
+        self._sources = sources
+        self._public = public
+        if self._client is not None:
+            self._sync_shared()
+
+    def _sync_shared(self) -> None:
+        """Join / leave shared public sources to match the current sources"""
+        wanted = self._public if shared_sources.enabled and self._client is not None else set()
+        for peer_id in self._shared - wanted:
+            shared_sources.leave(peer_id, self.user_id)
+        for peer_id in wanted - self._shared:
+            shared_sources.join(peer_id, self)
+        self._shared = set(wanted)
+
+    async def deliver(self, peer_id: int, message, received: float) -> None:
+        """A message of one of the user's sources (live update or shared_sources)"""
+        held = self._held.get(self._sources.get(peer_id))
+        if held is not None:
+            held.append((message, received))
+            return
+        if self._client is not None:
+            await self._queue(self._client, message, received)
+
+    async def fetch_missed(self, peer_id: int, after_id: int) -> List[Any]:
+        """Messages of a shared source posted after ``after_id``, oldest first (ownership handover)"""
+        source = self._sources.get(peer_id)
+        entity = await peer_cache.input_peer(self.user_id, source, self._client) if source else None
+        if entity is None:
+            return []
+        return await self._client.get_messages(entity, limit=CATCH_UP_MAX_MESSAGES, min_id=after_id, reverse=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._follow()
+                logger.warning(f"Client of user {self.user_id} disconnected, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except ClientNotAuthorizedError as e:
+                logger.error(f"Stopping forwarding for user {self.user_id}: {str(e)}")
+                return
+            except Exception as e:
+                logger.error(f"Forwarding for user {self.user_id} failed: {str(e)}")
+            await asyncio.sleep(FORWARDER_RECONNECT_DELAY)
+
+    async def _follow(self) -> None:
+        from telethon import events
+
+        async with client_registry.client(self.user_id, pinned=True) as client:
+            await self.refresh_sources(client)
+            marks = await high_water.load(self.user_id)
+            # Live messages of a source are held back until its backlog was queued, to keep order
+            self._held = {source: [] for source in self._sources.values()}
+
+            async def on_message(event) -> None:
+                received = time.monotonic()
+                if event.chat_id in self._shared:
+                    # Only the channel's owner publishes; the other subscribers get it from there
+                    if shared_sources.owner_of(event.chat_id) == self.user_id:
+                        await shared_sources.publish(event.chat_id, event.message, received)
+                    return
+                await self.deliver(event.chat_id, event.message, received)
+
+            client.add_event_handler(on_message, events.NewMessage())
+            self._client = client
+            self._sync_shared()
+            logger.info(
+                f"Forwarding for user {self.user_id} from {len(self._sources)} sources "
+                f"({len(self._shared)} shared)"
+            )
+            try:
+                await self._replay(client)
+                for source in list(self._held):
+                    try:
+                        await self._catch_up(client, source, marks.get(source))
+                    except Exception as e:
+                        # The mark did not move past the gap; the next connect retries it
+                        logger.warning(f"Catch-up of user {self.user_id} on {source} failed: {str(e)}")
+                        high_water.set_progress(self.user_id, source, False)
+                    for message, received in self._held.pop(source, []):
+                        await self._queue(client, message, received)
+                await client.disconnected
+            finally:
+                client.remove_event_handler(on_message)
+                self._client = None
+                self._sync_shared()
+                self._held = {}
+
+    async def _catch_up(self, client, source: str, last_id: Optional[int]) -> None:
+        """Queue what was posted to ``source`` above its high-water mark, oldest first"""
+        entity = await peer_cache.input_peer(self.user_id, source, client)
+        if entity is None:
+            return
+        latest = await client.get_messages(entity, limit=1)
+        if not latest:
+            return
+        latest_id = latest[0].id
+        if last_id is None:
+            # First run on this source: start from here rather than forwarding its history
+            high_water.advance(self.user_id, source, latest_id)
+            return
+        if latest_id <= last_id:
+            return
+
+        if latest_id - last_id > CATCH_UP_MAX_MESSAGES:
+            logger.warning(
+                f"User {self.user_id} missed ~{latest_id - last_id} messages in {source}, "
+                f"catching up on the last {CATCH_UP_MAX_MESSAGES}"
+            )
+            last_id = latest_id - CATCH_UP_MAX_MESSAGES
+        logger.info(f"Catching up user {self.user_id} on {source} from message {last_id} to {latest_id}")
+
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(CATCH_UP_RATE, CATCH_UP_BATCH_SIZE, loop.time())
+        queued = 0
+        while last_id < latest_id:
+            high_water.set_progress(self.user_id, source, True, latest_id - last_id)
+            batch = await client.get_messages(entity, limit=CATCH_UP_BATCH_SIZE, min_id=last_id, reverse=True)
+            if not batch:
+                break
+            for message in batch:
+                if message.id > latest_id:
+                    break
+                wait = bucket.wait_time(loop.time())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                bucket.consume(loop.time())
+                await self._queue(client, message, time.monotonic())
+                queued += 1
+            last_id = batch[-1].id
+        high_water.set_progress(self.user_id, source, False)
+        logger.info(f"User {self.user_id} caught up on {source} ({queued} messages queued)")
+
+    async def _replay(self, client) -> None:
+        """Process the outbox entries a crash or stop left unfinished, oldest first"""
+        entries = outbox.take_replay(self.user_id)
+        if not entries:
+            return
+        logger.info(f"Replaying {len(entries)} unfinished messages of user {self.user_id}")
+        by_source: Dict[str, List[OutboxEntry]] = {}
+        for entry in entries:
+            by_source.setdefault(entry.source, []).append(entry)
+
+        for source, group in by_source.items():
+            try:
+                entity = await peer_cache.input_peer(self.user_id, source, client)
+                messages = await client.get_messages(entity, ids=[entry.message_id for entry in group]) if entity else []
+            except Exception as e:
+                logger.warning(f"Replay of user {self.user_id} on {source} failed: {str(e)}")
+                for entry in group:
+                    # Picked up again on the next connect
+                    entry.in_flight = False
+                continue
+            for index, entry in enumerate(group):
+                message = messages[index] if index < len(messages) else None
+                if message is None:
+                    # Deleted since, or the source is gone
+                    outbox.ack(entry.seq)
+                    continue
+                await self._queue(client, message, time.monotonic(), entry.seq)
+
+    async def _queue(self, client, message, received: float, seq: Optional[int] = None) -> None:
+        source = self._sources.get(message.chat_id)
+        if seq is None and source is not None:
+            try:
+                seq = await outbox.append(self.user_id, source, message.chat_id, message.id)
+            except OSError:
+                # Logged by the outbox; the message is still processed, just not crash-safe
+                pass
+        await tenant_scheduler.submit(self.user_id, lambda: self._on_message(client, message, received, seq))
+
+    async def _on_message(self, client, message, received: float, seq: Optional[int] = None) -> None:
+        """Route a message and hand its sends to the send scheduler (runs in a tenant slot)"""
+        completing = False
+        try:
+            if not rule_index.is_loaded(self.user_id):
+                # Rules were invalidated by a reload_rules command
+                await self.refresh_sources(client)
+            source = self._sources.get(message.chat_id)
+            if source is None:
+                return
+
+            high_water.advance(self.user_id, source, message.id)
+            matched = rule_index.route(self.user_id, source, message.message)
+            matched_ids = {rule.id for rule in matched}
+            for rule in rule_index.rules_on(self.user_id, source):
+                if rule.id not in matched_ids:
+                    await forwarding_log_sink.write(self.user_id, rule.id, message.id, "FILTERED")
+
+            if not matched:
+                return
+            sends = []
+            for rule in matched:
+                if not await seen_store.claim(self.user_id, rule.id, message.id):
+                    logger.info(f"Rule {rule.id} already forwarded message {message.id}, skipping duplicate")
+                    continue
+                future = await self._submit(client, source, rule, message)
+                if future is None:
+                    seen_store.release(self.user_id, rule.id, message.id)
+                else:
+                    sends.append((rule, future))
+
+            # Waiting for the sends (pacing, flood waits) happens outside the tenant slot
+            task = asyncio.create_task(self._complete(sends, message, received, seq))
+            self._completions.add(task)
+            task.add_done_callback(self._completions.discard)
+            completing = True
+        finally:
+            if not completing:
+                outbox.ack(seq)
+
+    async def _submit(self, client, source: str, rule: RuleRecord, message) -> Optional[asyncio.Future]:
+        try:
+            target = await peer_cache.input_peer(self.user_id, rule.target_channel_id, client)
+            if target is None:
+                raise ValueError(f"No access to target channel {rule.target_channel_id}")
+            # Forwarded by id from the user's own peer: the message may come from another account's client
+            source_peer = await peer_cache.input_peer(self.user_id, source, client)
+            return await forward_batcher.submit(
+                self.user_id, client, source, rule.target_channel_id, target, source_peer, message
+            )
+        except Exception as e:
+            await self._failed(rule, message, e)
+            return None
+
+    async def _complete(self, sends, message, received: float, seq: Optional[int] = None) -> None:
+        # Targets are sent concurrently by the send scheduler; record each as it lands
+        # (the batcher resolves each message to its own copy in a multi-message forward)
+        await asyncio.gather(*(self._record(rule, message, future) for rule, future in sends))
+        outbox.ack(seq)
+        latency_recorder.record(self.user_id, time.monotonic() - received)
+
+    async def _record(self, rule: RuleRecord, message, future: asyncio.Future) -> None:
+        try:
+            sent: Any = await future
+        except asyncio.CancelledError:
+            # Not sent: a replay of the message must not be skipped as a duplicate
+            seen_store.release(self.user_id, rule.id, message.id)
+            raise
+        except Exception as e:
+            seen_store.release(self.user_id, rule.id, message.id)
+            await self._failed(rule, message, e)
+            return
+
+        await forwarding_log_sink.write(
+            self.user_id, rule.id, message.id, "SUCCESS", target_message_id=getattr(sent, "id", None)
+        )
+        seen_store.confirm(self.user_id, rule.id, message.id)
+        rule_counters.record(self.user_id, rule.id)
+
+    async def _failed(self, rule: RuleRecord, message, error: Exception) -> None:
+        logger.warning(f"Rule {rule.id} failed to forward message {message.id}: {str(error)}")
+        await forwarding_log_sink.write(
+            self.user_id, rule.id, message.id, "FAILED", error_message=describe_error(error)
+        )
@@ -0,0 +1,60 @@
+# app/services/hash_ring.py
+"""
+Consistent hash ring used to shard users across forwarder workers.
+
+Each node is placed on the ring ``replicas`` times; a user belongs to the
+first node clockwise from the hash of its id. Changing the number of workers
+only moves the users whose arc changed hands (about 1/N of them) instead of
+reshuffling everyone.
+"""
+from typing import Dict, Iterable, List
+import bisect
+import hashlib
+
+DEFAULT_REPLICAS = 128
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Maps keys to nodes with virtual-node consistent hashing"""
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owners.values()))
+
+    def add_node(self, node: str) -> None:
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point in self._owners:
+                continue
+            bisect.insort(self._points, point)
+            self._owners[point] = node
+
+    def remove_node(self, node: str) -> None:
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key) -> str:
+        if not self._points:
+            raise LookupError("hash ring has no nodes")
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+def worker_name(index: int) -> str:
+    return f"forwarder-{index}"
+
+
+def worker_ring(workers: int) -> HashRing:
+    """The ring shared by ``python -m app.worker --workers N``"""
+    return HashRing(worker_name(index) for index in range(workers))
@@ -0,0 +1,160 @@
+# app/services/high_water.py
+"""
+Per-source high-water marks of the forwarder.
+
+For every (user, source channel) the id of the last message the forwarder
+processed is kept in memory and written to ``source_high_water_marks`` every
+``HIGH_WATER_FLUSH_INTERVAL`` seconds (marks only ever move forward). When a
+forwarder starts, it fetches everything posted above the mark before going
+live (see ``forwarding.UserForwarder``), so a stop, restart or crash leaves
+no gap. The ``CATCH_UP_*`` settings used there live here, next to the rows
+that carry the catch-up progress shown by ``/telegram/bot-status``.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, String, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base
+
+logger = logging.getLogger(__name__)
+
+HIGH_WATER_FLUSH_INTERVAL = float(os.getenv("HIGH_WATER_FLUSH_INTERVAL", "5.0"))
+CATCH_UP_RATE = float(os.getenv("CATCH_UP_RATE", "10.0"))
+CATCH_UP_BATCH_SIZE = int(os.getenv("CATCH_UP_BATCH_SIZE", "100"))
+CATCH_UP_MAX_MESSAGES = int(os.getenv("CATCH_UP_MAX_MESSAGES", "1000"))
+
+
+class SourceHighWaterMark(Base):
+    __tablename__ = "source_high_water_marks"
+
+    user_id = Column(Integer, primary_key=True)
+    source_channel_id = Column(String, primary_key=True)
+    last_message_id = Column(BigInteger, nullable=False)
+    catching_up = Column(Boolean, nullable=False, default=False)
+    backlog = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class HighWaterMarks:
+    """In-memory marks and catch-up progress, flushed to the table periodically"""
+
+    def __init__(self, flush_interval: float = HIGH_WATER_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._marks: Dict[Tuple[int, str], int] = {}
+        self._progress: Dict[Tuple[int, str], Tuple[bool, int]] = {}
+        self._dirty: Set[Tuple[int, str]] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="high-water-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def load(self, user_id: int) -> Dict[str, int]:
+        """The user's stored marks, merged with any newer in-memory ones"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(
+                SourceHighWaterMark.source_channel_id,
+                SourceHighWaterMark.last_message_id
+            ).where(SourceHighWaterMark.user_id == user_id))).all()
+        for source, message_id in rows:
+            self._marks[(user_id, source)] = max(self._marks.get((user_id, source), 0), message_id)
+        return {source: mark for (owner, source), mark in self._marks.items() if owner == user_id}
+
+    def get(self, user_id: int, source: str) -> Optional[int]:
+        return self._marks.get((user_id, source))
+
+    def advance(self, user_id: int, source: str, message_id: int) -> None:
+        """Record that ``message_id`` was processed"""
+        key = (user_id, source)
+        if message_id > self._marks.get(key, 0):
+            self._marks[key] = message_id
+            self._dirty.add(key)
+
+    def set_progress(self, user_id: int, source: str, catching_up: bool, backlog: int = 0) -> None:
+        key = (user_id, source)
+        self._progress[key] = (catching_up, backlog)
+        if key in self._marks:
+            self._dirty.add(key)
+
+    async def unload(self, user_id: int) -> None:
+        """Flush and drop a user's marks (forwarder stop)"""
+        for key in [key for key in self._progress if key[0] == user_id]:
+            self.set_progress(user_id, key[1], False)
+        await self.flush()
+        for key in [key for key in self._marks if key[0] == user_id]:
+            self._marks.pop(key, None)
+            self._progress.pop(key, None)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            now = datetime.utcnow()
+            rows = []
+            for user_id, source in keys:
+                if (user_id, source) not in self._marks:
+                    continue
+                catching_up, backlog = self._progress.get((user_id, source), (False, 0))
+                rows.append({
+                    "user_id": user_id,
+                    "source_channel_id": source,
+                    "last_message_id": self._marks[(user_id, source)],
+                    "catching_up": catching_up,
+                    "backlog": backlog,
+                    "updated_at": now,
+                })
+            if not rows:
+                return
+
+            stmt = pg_insert(SourceHighWaterMark).values(rows)
+            try:
+                async with AsyncSessionLocal() as db:
+                    async with db.begin():
+                        await db.execute(stmt.on_conflict_do_update(
+                            index_elements=[SourceHighWaterMark.user_id, SourceHighWaterMark.source_channel_id],
+                            set_={
+                                "last_message_id": func.greatest(
+                                    SourceHighWaterMark.last_message_id, stmt.excluded.last_message_id
+                                ),
+                                "catching_up": stmt.excluded.catching_up,
+                                "backlog": stmt.excluded.backlog,
+                                "updated_at": stmt.excluded.updated_at,
+                            },
+                        ))
+            except Exception as e:
+                logger.error(f"Failed to flush {len(rows)} high-water marks: {str(e)}")
+                self._dirty |= keys
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+async def catch_up_status(db: AsyncSession, user_id: int) -> List[SourceHighWaterMark]:
+    """Stored marks and catch-up progress of a user's sources"""
+    return (await db.scalars(select(SourceHighWaterMark).where(
+        SourceHighWaterMark.user_id == user_id
+    ).order_by(SourceHighWaterMark.source_channel_id))).all()
+
+
+high_water = HighWaterMarks()
@@ -0,0 +1,136 @@
+# app/services/keyword_matcher.py
+"""
+Compiled keyword matching for forwarding rules.
+
+Every active rule on a source channel contributes its ``filter_keywords`` and
+``exclude_keywords`` to a single Aho-Corasick automaton, so an incoming message
+is normalised once and scanned once no matter how many rules listen on the
+channel.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import unicodedata
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Unicode-normalise (NFKC) and case-fold text for keyword comparison"""
+    if not text:
+        return ""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over the keywords of all rules on one source channel.
+
+    ``rules`` is an iterable of ``(rule_id, filter_keywords, exclude_keywords)``.
+    A rule matches a message when it has no include keywords or at least one of
+    them occurs, and none of its exclude keywords occur.
+    """
+
+    __slots__ = ("_goto", "_outputs", "_include", "_exclude", "_unfiltered", "rule_ids")
+
+    def __init__(self, rules: Iterable[Tuple[int, Sequence[str], Sequence[str]]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        fail: List[int] = [0]
+        own_output: List[List[int]] = [[]]
+
+        patterns: Dict[str, int] = {}
+        include: List[List[int]] = []
+        exclude: List[List[int]] = []
+        unfiltered: List[int] = []
+        rule_ids: List[int] = []
+
+        def add_pattern(keyword: str) -> Optional[int]:
+            keyword = normalize_text(keyword).strip()
+            if not keyword:
+                return None
+            pattern_id = patterns.get(keyword)
+            if pattern_id is not None:
+                return pattern_id
+
+            pattern_id = len(include)
+            patterns[keyword] = pattern_id
+            include.append([])
+            exclude.append([])
+
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    fail.append(0)
+                    own_output.append([])
+                node = next_node
+            own_output[node].append(pattern_id)
+            return pattern_id
+
+        for rule_id, filter_keywords, exclude_keywords in rules:
+            rule_ids.append(rule_id)
+            has_include = False
+            for keyword in filter_keywords or ():
+                pattern_id = add_pattern(keyword)
+                if pattern_id is not None:
+                    include[pattern_id].append(rule_id)
+                    has_include = True
+            if not has_include:
+                unfiltered.append(rule_id)
+            for keyword in exclude_keywords or ():
+                pattern_id = add_pattern(keyword)
+                if pattern_id is not None:
+                    exclude[pattern_id].append(rule_id)
+
+        # Breadth-first pass to compute failure links; each node's output also
+        # carries the outputs reachable through its failure chain.
+        outputs: List[Tuple[int, ...]] = [()] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for node in queue:
+            outputs[node] = tuple(own_output[node])
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                state = fail[node]
+                while state and char not in self._goto[state]:
+                    state = fail[state]
+                fallback = self._goto[state].get(char, 0)
+                fail[child] = fallback if fallback != child else 0
+                outputs[child] = tuple(own_output[child]) + outputs[fail[child]]
+                queue.append(child)
+
+        # Fold failure transitions into the goto table so scanning never backtracks
+        for node in queue:
+            for char, target in self._goto[fail[node]].items():
+                self._goto[node].setdefault(char, target)
+
+        self._outputs = outputs
+        self._include = [tuple(ids) for ids in include]
+        self._exclude = [tuple(ids) for ids in exclude]
+        self._unfiltered = frozenset(unfiltered)
+        self.rule_ids = frozenset(rule_ids)
+
+    def match(self, text: Optional[str]) -> Set[int]:
+        """Return the ids of the rules whose filters accept ``text``"""
+        return self.match_normalized(normalize_text(text))
+
+    def match_normalized(self, text: str) -> Set[int]:
+        """Like :meth:`match` for text that already went through :func:`normalize_text`"""
+        goto = self._goto
+        root = goto[0]
+        node = 0
+        visited: Set[int] = set()
+        for char in text:
+            node = goto[node].get(char) or root.get(char, 0)
+            if node:
+                visited.add(node)
+
+        matched = set(self._unfiltered)
+        excluded: Set[int] = set()
+        outputs = self._outputs
+        for node in visited:
+            for pattern_id in outputs[node]:
+                matched.update(self._include[pattern_id])
+                excluded.update(self._exclude[pattern_id])
+
+        return matched - excluded
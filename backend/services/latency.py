@@ -0,0 +1,185 @@
+# app/services/latency.py
+"""
+Per-message processing latency histograms.
+
+The forwarder records how long each message took from receipt to the
+completed send. Durations go into fixed log-scale buckets (about 12% relative
+error per bucket), aggregated per user and hour in memory and merged into
+``forwarding_latency_hourly`` with an element-wise array add, so 24 rows are
+enough to answer p50/p95/p99 for the last day.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import bisect
+import logging
+import math
+import os
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base
+
+logger = logging.getLogger(__name__)
+
+LATENCY_FLUSH_INTERVAL = float(os.getenv("LATENCY_FLUSH_INTERVAL", "30.0"))
+
+# Bucket upper bounds in milliseconds: 1ms .. ~15min, growing by 25% per bucket
+_GROWTH = 1.25
+BUCKET_BOUNDS_MS: Tuple[float, ...] = tuple(_GROWTH ** i for i in range(int(math.log(900_000, _GROWTH)) + 2))
+BUCKET_COUNT = len(BUCKET_BOUNDS_MS) + 1  # last bucket catches everything above the top bound
+
+
+class ForwardingLatencyHourly(Base):
+    __tablename__ = "forwarding_latency_hourly"
+
+    user_id = Column(Integer, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    buckets = Column(ARRAY(BigInteger), nullable=False)
+    count = Column(BigInteger, nullable=False, default=0)
+    total_ms = Column(BigInteger, nullable=False, default=0)
+
+
+class LatencyHistogram:
+    """Fixed-size log-bucketed histogram of durations"""
+
+    __slots__ = ("buckets", "count", "total_ms")
+
+    def __init__(self, buckets: Optional[Sequence[int]] = None, count: int = 0, total_ms: float = 0):
+        self.buckets: List[int] = list(buckets) if buckets else [0] * BUCKET_COUNT
+        self.count = count
+        self.total_ms = total_ms
+
+    def record(self, seconds: float) -> None:
+        milliseconds = max(seconds, 0.0) * 1000
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total_ms += milliseconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, value in enumerate(other.buckets[:BUCKET_COUNT]):
+            self.buckets[index] += value
+        self.count += other.count
+        self.total_ms += other.total_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Approximate q-th percentile in seconds (geometric midpoint of its bucket)"""
+        if not self.count:
+            return None
+        rank = max(math.ceil(self.count * q / 100), 1)
+        seen = 0
+        for index, value in enumerate(self.buckets):
+            seen += value
+            if seen >= rank:
+                break
+        if index >= len(BUCKET_BOUNDS_MS):
+            return BUCKET_BOUNDS_MS[-1] / 1000
+        upper = BUCKET_BOUNDS_MS[index]
+        lower = BUCKET_BOUNDS_MS[index - 1] if index else 0.0
+        return (math.sqrt(lower * upper) if lower else upper) / 1000
+
+    def mean(self) -> Optional[float]:
+        """Mean duration in seconds"""
+        if not self.count:
+            return None
+        return self.total_ms / self.count / 1000
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class LatencyRecorder:
+    """Collects per-user hourly histograms and merges them into the database periodically"""
+
+    def __init__(self, flush_interval: float = LATENCY_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, datetime], LatencyHistogram] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def record(self, user_id: int, seconds: float, at: Optional[datetime] = None) -> None:
+        """Record the processing time of one message"""
+        key = (user_id, _hour(at or datetime.utcnow()))
+        histogram = self._pending.get(key)
+        if histogram is None:
+            histogram = self._pending[key] = LatencyHistogram()
+        histogram.record(seconds)
+
+    async def histogram_since(self, db: AsyncSession, user_id: int, since: datetime) -> LatencyHistogram:
+        """Stored latencies for a user from the hour containing ``since``
+
+        Latencies are recorded in the worker processes, so this lags them by up
+        to the workers' flush interval (``LATENCY_FLUSH_INTERVAL``).
+        """
+        histogram = LatencyHistogram()
+        rows = (await db.scalars(select(ForwardingLatencyHourly).where(
+            ForwardingLatencyHourly.user_id == user_id,
+            ForwardingLatencyHourly.hour >= _hour(since)
+        ))).all()
+        for row in rows:
+            histogram.merge(LatencyHistogram(row.buckets, row.count, row.total_ms))
+        return histogram
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="latency-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await self._apply(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush latency histograms: {str(e)}")
+                for key, histogram in batch.items():
+                    self._pending.setdefault(key, LatencyHistogram()).merge(histogram)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _apply(self, batch: Dict[Tuple[int, datetime], LatencyHistogram]) -> None:
+        stmt = pg_insert(ForwardingLatencyHourly).values([
+            {
+                "user_id": user_id,
+                "hour": hour,
+                "buckets": histogram.buckets,
+                "count": histogram.count,
+                "total_ms": int(histogram.total_ms),
+            } for (user_id, hour), histogram in batch.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ForwardingLatencyHourly.user_id, ForwardingLatencyHourly.hour],
+            set_={
+                "buckets": text(
+                    "(SELECT array_agg(coalesce(a, 0) + coalesce(b, 0) ORDER BY i) "
+                    "FROM unnest(forwarding_latency_hourly.buckets, excluded.buckets) WITH ORDINALITY AS u(a, b, i))"
+                ),
+                "count": ForwardingLatencyHourly.count + stmt.excluded.count,
+                "total_ms": ForwardingLatencyHourly.total_ms + stmt.excluded.total_ms,
+            },
+        )
+
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(stmt)
+
+
+latency_recorder = LatencyRecorder()
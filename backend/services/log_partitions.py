@@ -0,0 +1,181 @@
+# app/services/log_partitions.py
+"""
+Partition maintenance for the range-partitioned ``forwarding_logs`` table.
+
+``forwarding_logs`` is partitioned by day on ``created_at`` (see Alembic
+revision 0003). This job keeps ``LOG_PARTITION_PREMAKE_DAYS`` future
+partitions ready and enforces retention by detaching and dropping whole
+partitions older than ``LOG_RETENTION_DAYS``. Dropping a partition needs no
+row-by-row DELETE and leaves nothing for vacuum to clean up. Retention is
+global on purpose: there is no per-user purge, which could only be a DELETE.
+
+Rows for a day without a partition (maintenance did not run for longer than
+the premake window) land in the DEFAULT partition (revision 0011) instead of
+failing the insert; they are moved into the day's partition when it is
+created. The job runs in the API and in every worker so it does not depend on
+any one process being up; a PostgreSQL advisory lock lets one of them run a
+round at a time.
+"""
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+import asyncio
+import logging
+import os
+import re
+
+from sqlalchemy import text
+
+from app.async_database import AsyncSessionLocal, async_engine
+
+logger = logging.getLogger(__name__)
+
+LOG_PARTITION_PREMAKE_DAYS = int(os.getenv("LOG_PARTITION_PREMAKE_DAYS", "7"))
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90"))
+LOG_PARTITION_CHECK_INTERVAL = float(os.getenv("LOG_PARTITION_CHECK_INTERVAL", "3600"))
+
+PARENT_TABLE = "forwarding_logs"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+# pg_advisory_lock key serializing maintenance rounds across processes
+_MAINTENANCE_LOCK = 0x666C6F67
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_p(\d{{8}})$")
+
+
+def partition_name(day: date) -> str:
+    return f"{PARENT_TABLE}_p{day:%Y%m%d}"
+
+
+async def is_partitioned(db) -> bool:
+    """Whether the migration converting forwarding_logs has been applied"""
+    return await db.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+        "WHERE pg_class.relname = :parent)"
+    ), {"parent": PARENT_TABLE})
+
+
+async def list_partitions(db) -> List[Tuple[str, date]]:
+    """Daily partitions currently attached to the parent table, oldest first"""
+    rows = (await db.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :parent"
+    ), {"parent": PARENT_TABLE})).all()
+
+    partitions = []
+    for (name,) in rows:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime.strptime(match.group(1), "%Y%m%d").date()))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def ensure_partitions(db, days_ahead: int = LOG_PARTITION_PREMAKE_DAYS, today: Optional[date] = None) -> int:
+    """Create any missing daily partitions from today through ``days_ahead`` days out"""
+    today = today or datetime.utcnow().date()
+    existing = {day for _, day in await list_partitions(db)}
+    created = 0
+    for offset in range(days_ahead + 1):
+        day = today + timedelta(days=offset)
+        if day in existing:
+            continue
+        await _create_partition(db, day)
+        created += 1
+    await db.commit()
+    return created
+
+
+async def _create_partition(db, day: date) -> None:
+    """Create a day's partition, moving its rows out of the DEFAULT partition first"""
+    bounds = {"start": day, "end": day + timedelta(days=1)}
+    await db.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE"))
+    stray = await db.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end)"
+    ), bounds)
+    if stray:
+        await db.execute(text(f"CREATE TEMP TABLE forwarding_logs_moved (LIKE {PARENT_TABLE}) ON COMMIT DROP"))
+        await db.execute(text(
+            f"INSERT INTO forwarding_logs_moved "
+            f"SELECT * FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"
+        ), bounds)
+        await db.execute(text(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"
+        ), bounds)
+    await db.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(day)}" PARTITION OF {PARENT_TABLE} '
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    ))
+    if stray:
+        moved = await db.execute(text(f"INSERT INTO {PARENT_TABLE} SELECT * FROM forwarding_logs_moved"))
+        await db.commit()
+        logger.warning(f"Moved {moved.rowcount} rows from {DEFAULT_PARTITION} into {partition_name(day)}")
+
+
+async def drop_expired_partitions(db, retention_days: int = LOG_RETENTION_DAYS, today: Optional[date] = None) -> List[str]:
+    """Detach and drop partitions whose whole day is older than the retention window"""
+    cutoff = (today or datetime.utcnow().date()) - timedelta(days=retention_days)
+    dropped = []
+    for name, day in await list_partitions(db):
+        if day >= cutoff:
+            break
+        await db.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+        await db.execute(text(f'DROP TABLE "{name}"'))
+        await db.commit()
+        dropped.append(name)
+    # Stray rows are deleted one by one; normally the DEFAULT partition is empty
+    await db.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff"), {"cutoff": cutoff})
+    await db.commit()
+    return dropped
+
+
+async def run_maintenance() -> None:
+    # Session-level lock on a connection of its own: the session below commits (and
+    # returns its connection to the pool) several times during a round
+    async with async_engine.connect() as lock:
+        if not await lock.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _MAINTENANCE_LOCK}):
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                if not await is_partitioned(db):
+                    logger.warning(f"{PARENT_TABLE} is not partitioned yet, run 'alembic upgrade head'")
+                    return
+                created = await ensure_partitions(db)
+                dropped = await drop_expired_partitions(db)
+                if created or dropped:
+                    logger.info(
+                        f"Log partitions: created {created}, dropped {len(dropped)} ({', '.join(dropped) or '-'})"
+                    )
+        finally:
+            await lock.scalar(text("SELECT pg_advisory_unlock(:key)"), {"key": _MAINTENANCE_LOCK})
+
+
+class LogPartitionMaintainer:
+    """Background job running partition creation and retention periodically"""
+
+    def __init__(self, interval: float = LOG_PARTITION_CHECK_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="log-partition-maintenance")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await run_maintenance()
+            except Exception as e:
+                logger.error(f"Log partition maintenance failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+log_partition_maintainer = LogPartitionMaintainer()
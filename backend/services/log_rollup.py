@@ -0,0 +1,196 @@
+# app/services/log_rollup.py
+"""
+Per-user, per-rule, per-day rollups of ForwardingLog.
+
+The log sink folds every batch it writes into ``forwarding_log_daily`` and
+``forwarding_error_daily`` within the same transaction, so ``/stats/analytics``
+can read one row per rule and day for closed days and only scan raw logs for
+today. Existing history is loaded with the backfill command, which should run
+while forwarders are stopped so no batch lands in the window it rebuilds:
+
+    python -m app.services.log_rollup backfill --days 365
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import argparse
+import asyncio
+import hashlib
+import logging
+import re
+
+from sqlalchemy import Column, Date, Integer, String, Text, case, delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Base, ForwardingLog
+
+logger = logging.getLogger(__name__)
+
+
+class ForwardingLogDaily(Base):
+    __tablename__ = "forwarding_log_daily"
+
+    user_id = Column(Integer, primary_key=True)
+    rule_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    successful = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    filtered = Column(Integer, nullable=False, default=0)
+
+
+class ForwardingErrorDaily(Base):
+    __tablename__ = "forwarding_error_daily"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    fingerprint = Column(String(16), primary_key=True)
+    error_message = Column(Text, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+_VOLATILE = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def error_fingerprint(error_message: str) -> str:
+    """Stable key for an error message with ids, counts and timings masked out"""
+    normalized = _WHITESPACE.sub(" ", _VOLATILE.sub("#", error_message)).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+_STATUS_COLUMNS = {"SUCCESS": "successful", "FAILED": "failed", "FILTERED": "filtered"}
+
+
+async def apply_rollup(db: AsyncSession, rows: Iterable[Dict[str, Any]]) -> None:
+    """Add a batch of ForwardingLog rows (as dicts) to the daily rollups"""
+    counts: Dict[Tuple[int, int, date], Dict[str, int]] = defaultdict(
+        lambda: {"successful": 0, "failed": 0, "filtered": 0}
+    )
+    errors: Dict[Tuple[int, date, str], List] = {}
+
+    for row in rows:
+        day = row["created_at"].date()
+        column = _STATUS_COLUMNS.get(row["status"])
+        if column is not None:
+            counts[(row["user_id"], row["rule_id"], day)][column] += 1
+        if row["status"] == "FAILED" and row.get("error_message"):
+            key = (row["user_id"], day, error_fingerprint(row["error_message"]))
+            entry = errors.setdefault(key, [row["error_message"], 0])
+            entry[1] += 1
+
+    if counts:
+        stmt = pg_insert(ForwardingLogDaily).values([
+            {"user_id": user_id, "rule_id": rule_id, "day": day, **values}
+            for (user_id, rule_id, day), values in counts.items()
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[ForwardingLogDaily.user_id, ForwardingLogDaily.rule_id, ForwardingLogDaily.day],
+            set_={
+                "successful": ForwardingLogDaily.successful + stmt.excluded.successful,
+                "failed": ForwardingLogDaily.failed + stmt.excluded.failed,
+                "filtered": ForwardingLogDaily.filtered + stmt.excluded.filtered,
+            },
+        ))
+
+    if errors:
+        stmt = pg_insert(ForwardingErrorDaily).values([
+            {"user_id": user_id, "day": day, "fingerprint": fingerprint, "error_message": message, "count": count}
+            for (user_id, day, fingerprint), (message, count) in errors.items()
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[ForwardingErrorDaily.user_id, ForwardingErrorDaily.day, ForwardingErrorDaily.fingerprint],
+            set_={"count": ForwardingErrorDaily.count + stmt.excluded.count},
+        ))
+
+
+async def backfill(db: AsyncSession, days: int, user_id: Optional[int] = None) -> int:
+    """Rebuild rollups for the last ``days`` closed days plus today from raw logs"""
+    start_day = datetime.utcnow().date() - timedelta(days=days)
+    start = datetime.combine(start_day, datetime.min.time())
+
+    for model in (ForwardingLogDaily, ForwardingErrorDaily):
+        stmt = delete(model).where(model.day >= start_day)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        await db.execute(stmt)
+
+    day = func.date(ForwardingLog.created_at)
+    filters = [ForwardingLog.created_at >= start]
+    if user_id is not None:
+        filters.append(ForwardingLog.user_id == user_id)
+
+    daily = (await db.execute(select(
+        ForwardingLog.user_id,
+        ForwardingLog.rule_id,
+        day.label("day"),
+        func.sum(case((ForwardingLog.status == "SUCCESS", 1), else_=0)).label("successful"),
+        func.sum(case((ForwardingLog.status == "FAILED", 1), else_=0)).label("failed"),
+        func.sum(case((ForwardingLog.status == "FILTERED", 1), else_=0)).label("filtered"),
+    ).where(*filters).group_by(ForwardingLog.user_id, ForwardingLog.rule_id, day))).all()
+
+    if daily:
+        await db.execute(pg_insert(ForwardingLogDaily).values([
+            {
+                "user_id": row.user_id,
+                "rule_id": row.rule_id,
+                "day": row.day,
+                "successful": int(row.successful or 0),
+                "failed": int(row.failed or 0),
+                "filtered": int(row.filtered or 0),
+            } for row in daily
+        ]))
+
+    error_rows = (await db.execute(select(
+        ForwardingLog.user_id,
+        day.label("day"),
+        ForwardingLog.error_message,
+        func.count(ForwardingLog.id).label("count"),
+    ).where(
+        *filters,
+        ForwardingLog.status == "FAILED",
+        ForwardingLog.error_message.isnot(None),
+    ).group_by(ForwardingLog.user_id, day, ForwardingLog.error_message))).all()
+
+    errors: Dict[Tuple[int, date, str], List] = {}
+    for row in error_rows:
+        key = (row.user_id, row.day, error_fingerprint(row.error_message))
+        entry = errors.setdefault(key, [row.error_message, 0])
+        entry[1] += row.count
+
+    if errors:
+        await db.execute(pg_insert(ForwardingErrorDaily).values([
+            {"user_id": user_id, "day": day, "fingerprint": fingerprint, "error_message": message, "count": count}
+            for (user_id, day, fingerprint), (message, count) in errors.items()
+        ]))
+
+    await db.commit()
+    return len(daily)
+
+
+async def _run_backfill(days: int, user_id: Optional[int]) -> None:
+    from app.async_database import AsyncSessionLocal, async_engine
+
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = await backfill(db, days, user_id)
+        logger.info(f"Backfilled {rows} daily rollup rows covering {days} days")
+    finally:
+        await async_engine.dispose()
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Maintain ForwardingLog daily rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Rebuild rollups from raw forwarding logs")
+    backfill_parser.add_argument("--days", type=int, default=365)
+    backfill_parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(_run_backfill(args.days, args.user_id))
+
+
+if __name__ == "__main__":
+    main()
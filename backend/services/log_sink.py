@@ -0,0 +1,186 @@
+# app/services/log_sink.py
+"""
+Buffered bulk writer for ForwardingLog rows.
+
+The forwarder hands every forwarded, filtered or failed message to the sink
+instead of committing a row per message. Rows are flushed as one multi-row
+INSERT when the batch fills up or the flush interval elapses, whichever comes
+first, so ``/stats/logs`` lags the forwarder by at most ``flush_interval``
+seconds while the database keeps up. When it does not, the bounded queue
+fills and ``write`` blocks the producer until the backlog drains. Each batch
+also updates the daily rollups (see ``log_rollup``) in the same transaction.
+
+Only connection and server-availability errors are retried. A batch that
+fails for any other reason (a data or constraint error) is split in halves
+until the offending rows are isolated; those are logged and dropped so one
+bad row cannot wedge the sink and, through backpressure, every forwarder.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+
+from sqlalchemy import exc, insert
+
+from app.async_database import AsyncSessionLocal
+from app.models import ForwardingLog
+from app.services.log_rollup import apply_rollup
+
+logger = logging.getLogger(__name__)
+
+LOG_SINK_BATCH_SIZE = int(os.getenv("LOG_SINK_BATCH_SIZE", "500"))
+LOG_SINK_FLUSH_INTERVAL = float(os.getenv("LOG_SINK_FLUSH_INTERVAL", "1.0"))
+LOG_SINK_MAX_PENDING = int(os.getenv("LOG_SINK_MAX_PENDING", "10000"))
+
+_STOP = object()
+
+# SQLSTATE classes worth retrying: connection exception, transaction rollback
+# (deadlock, serialization), insufficient resources, operator intervention
+_TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+
+def _is_transient_db_error(error: Exception) -> bool:
+    """True for failures that may go away on retry (database down, connection lost)"""
+    if isinstance(error, (OSError, exc.TimeoutError, exc.OperationalError, exc.InterfaceError)):
+        return True
+    if isinstance(error, exc.DBAPIError):
+        if error.connection_invalidated:
+            return True
+        sqlstate = getattr(error.orig, "sqlstate", None) or ""
+        return sqlstate[:2] in _TRANSIENT_SQLSTATE_CLASSES
+    return False
+
+
+class ForwardingLogSink:
+    """Asynchronous, size/time triggered batch writer for ForwardingLog rows"""
+
+    def __init__(
+        self,
+        batch_size: int = LOG_SINK_BATCH_SIZE,
+        flush_interval: float = LOG_SINK_FLUSH_INTERVAL,
+        max_pending: int = LOG_SINK_MAX_PENDING,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.flush_failures = 0
+        self.rows_dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run(), name="forwarding-log-sink")
+        logger.info(f"Forwarding log sink started (batch={self.batch_size}, interval={self.flush_interval}s)")
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Flush everything queued so far and stop the writer"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.put(_STOP), timeout)
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.error(f"Forwarding log sink did not drain within {timeout}s, {self.pending} rows dropped")
+        self._task = None
+        self._queue = None
+        logger.info(f"Forwarding log sink stopped ({self.rows_written} rows written, {self.rows_dropped} dropped)")
+
+    async def write(
+        self,
+        user_id: int,
+        rule_id: int,
+        source_message_id: Optional[int],
+        status: str,
+        target_message_id: Optional[int] = None,
+        error_message: Optional[str] = None,
+    ) -> None:
+        """Queue a log row; waits while the sink is full (backpressure)"""
+        row = {
+            "user_id": user_id,
+            "rule_id": rule_id,
+            "source_message_id": source_message_id,
+            "target_message_id": target_message_id,
+            "status": status,
+            "error_message": error_message,
+            "created_at": datetime.utcnow(),
+        }
+        if self._queue is None:
+            # Sink not running (scripts, tests): write through immediately
+            await self._flush([row])
+            return
+        await self._queue.put(row)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._flush_with_retry(batch)
+
+    async def _flush_with_retry(self, batch: List[Dict[str, Any]]) -> None:
+        # Keep the batch until it lands while the database is unreachable; the
+        # queue behind it fills up and producers block, which is the
+        # backpressure we want while the DB lags.
+        delay = self.flush_interval
+        while True:
+            try:
+                await self._flush(batch)
+                return
+            except Exception as e:
+                self.flush_failures += 1
+                if not _is_transient_db_error(e):
+                    await self._isolate(batch, e)
+                    return
+                logger.error(f"Failed to flush {len(batch)} forwarding logs, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _isolate(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        """Bisect a batch rejected by the database until the bad rows are dropped"""
+        if len(batch) == 1:
+            self.rows_dropped += 1
+            logger.error(f"Dropping forwarding log row the database rejects: {batch[0]!r}: {str(error)}")
+            return
+        middle = len(batch) // 2
+        await self._flush_with_retry(batch[:middle])
+        await self._flush_with_retry(batch[middle:])
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if batch:
+            await self._insert(batch)
+            self.rows_written += len(batch)
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> None:
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(insert(ForwardingLog), batch)
+                await apply_rollup(db, batch)
+
+
+forwarding_log_sink = ForwardingLogSink()
@@ -0,0 +1,336 @@
+# app/services/outbox.py
+"""
+Durable local outbox between the receive and send stages of the forwarder.
+
+A message used to live only in memory from the moment its update arrived
+until its sends completed, so a crash in between lost it (its high-water
+mark may already have moved past it). Every message now gets an outbox
+entry before it is queued for processing, and the entry is acknowledged
+once all of its sends are recorded (or it turned out to match nothing):
+
+- entries are appended to segment files under ``OUTBOX_DIR/<worker>``; a
+  single writer task group-commits whatever was appended while the previous
+  write was in flight with one ``write`` + ``fsync``, so durability costs one
+  fsync per batch rather than per message;
+- the consumer offset (every entry up to it is acknowledged) is written
+  atomically to ``OUTBOX_DIR/<worker>/offset`` at most every
+  ``OUTBOX_CHECKPOINT_INTERVAL`` seconds, and segments entirely below it are
+  deleted (compaction); a new segment is started every
+  ``OUTBOX_SEGMENT_BYTES``;
+- on startup the segments are read back and entries above the offset that
+  are younger than ``OUTBOX_MAX_AGE`` are handed to their user's forwarder
+  when it connects, which fetches the messages by id and processes them
+  again. ``seen_store`` only remembers a (rule, message) pair once its
+  SUCCESS row is written, so sends that never completed go out on replay,
+  while entries acknowledged after the last offset write are skipped;
+- entries no forwarder picks up (the user was stopped, or moved to another
+  worker) are dropped by the worker's resync, and any entry waiting for a
+  forwarder longer than ``OUTBOX_MAX_AGE`` expires, so they do not hold back
+  the offset and compaction.
+
+Records are length-prefixed and CRC-checked; a torn write at the tail of a
+segment (crash mid-append) ends the replay of that segment.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "/app/outbox")
+OUTBOX_SEGMENT_BYTES = int(os.getenv("OUTBOX_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+OUTBOX_MAX_AGE = float(os.getenv("OUTBOX_MAX_AGE", "86400"))
+OUTBOX_CHECKPOINT_INTERVAL = float(os.getenv("OUTBOX_CHECKPOINT_INTERVAL", "1.0"))
+
+# Frame: payload length, crc32(payload); payload: seq, appended at, user, chat, message, source length + source
+_FRAME = struct.Struct(">II")
+_RECORD = struct.Struct(">QdIqqH")
+_SEGMENT_SUFFIX = ".seg"
+
+
+class OutboxEntry:
+    __slots__ = ("seq", "appended_at", "user_id", "chat_id", "message_id", "source", "in_flight")
+
+    def __init__(self, seq: int, appended_at: float, user_id: int, chat_id: int, message_id: int, source: str):
+        self.seq = seq
+        self.appended_at = appended_at
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.source = source
+        # False for entries recovered from disk until their forwarder picks them up
+        self.in_flight = True
+
+    def encode(self) -> bytes:
+        source = self.source.encode()
+        payload = _RECORD.pack(
+            self.seq, self.appended_at, self.user_id, self.chat_id, self.message_id, len(source)
+        ) + source
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @classmethod
+    def decode(cls, payload: bytes) -> "OutboxEntry":
+        seq, appended_at, user_id, chat_id, message_id, length = _RECORD.unpack_from(payload)
+        source = payload[_RECORD.size:_RECORD.size + length].decode()
+        return cls(seq, appended_at, user_id, chat_id, message_id, source)
+
+
+def _read_segment(path: str) -> Tuple[List[OutboxEntry], bool]:
+    """Entries of a segment and whether it ended cleanly"""
+    entries = []
+    with open(path, "rb") as segment:
+        data = segment.read()
+    offset = 0
+    while offset < len(data):
+        if offset + _FRAME.size > len(data):
+            return entries, False
+        length, crc = _FRAME.unpack_from(data, offset)
+        payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return entries, False
+        entries.append(OutboxEntry.decode(payload))
+        offset += _FRAME.size + length
+    return entries, True
+
+
+class Outbox:
+    """Append-only segment log of received messages with group-commit fsync"""
+
+    def __init__(
+        self,
+        directory: str = OUTBOX_DIR,
+        segment_bytes: int = OUTBOX_SEGMENT_BYTES,
+        max_age: float = OUTBOX_MAX_AGE,
+        checkpoint_interval: float = OUTBOX_CHECKPOINT_INTERVAL,
+        enabled: bool = OUTBOX_ENABLED,
+    ):
+        self.root = directory
+        self.segment_bytes = segment_bytes
+        self.max_age = max_age
+        self.checkpoint_interval = checkpoint_interval
+        self.enabled = enabled
+        self.directory: Optional[str] = None
+        # Unacknowledged entries in seq order; the first one bounds the consumer offset
+        self._pending: "OrderedDict[int, OutboxEntry]" = OrderedDict()
+        self._next_seq = 1
+        self._offset = 0
+        self._saved_offset = 0
+        # (first seq, path) of every segment on disk, the active one last
+        self._segments: List[Tuple[int, str]] = []
+        self._file = None
+        self._file_bytes = 0
+        self._appends: List[Tuple[OutboxEntry, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._checkpointed_at = 0.0
+        self.commits = 0
+        self.committed = 0
+        self.replayed = 0
+        self.expired = 0
+
+    async def start(self, worker_name: str = "worker") -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self.directory = os.path.join(self.root, worker_name)
+        await asyncio.to_thread(self._recover)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="outbox-writer")
+        recovered = sum(1 for entry in self._pending.values() if not entry.in_flight)
+        logger.info(f"Outbox at {self.directory}: {recovered} entries to replay, next seq {self._next_seq}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # The writer commits what is still queued and saves the offset before it exits;
+            # unacknowledged entries are replayed on the next start
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def append(self, user_id: int, source: str, chat_id: int, message_id: int) -> Optional[int]:
+        """Durably record a received message; returns its seq (None when the outbox is off)"""
+        if self._task is None:
+            return None
+        entry = OutboxEntry(self._next_seq, time.time(), user_id, chat_id, message_id, source)
+        self._next_seq += 1
+        self._pending[entry.seq] = entry
+        future = asyncio.get_running_loop().create_future()
+        self._appends.append((entry, future))
+        self._wakeup.set()
+        await future
+        return entry.seq
+
+    def ack(self, seq: Optional[int]) -> None:
+        """All sends of the entry are recorded (or it had none)"""
+        if seq is not None and self._pending.pop(seq, None) is not None:
+            self._offset = next(iter(self._pending)) - 1 if self._pending else self._next_seq - 1
+
+    def take_replay(self, user_id: int) -> List[OutboxEntry]:
+        """Recovered entries of a user not being processed yet, oldest first (forwarder connect)"""
+        entries = [entry for entry in self._pending.values() if entry.user_id == user_id and not entry.in_flight]
+        for entry in entries:
+            entry.in_flight = True
+        self.replayed += len(entries)
+        return entries
+
+    def release_user(self, user_id: int) -> None:
+        """Make a stopped forwarder's unfinished entries replayable again"""
+        for entry in self._pending.values():
+            if entry.user_id == user_id:
+                entry.in_flight = False
+
+    def discard_user(self, user_id: int) -> None:
+        """Drop a user's entries (forwarding stopped by the user)"""
+        for seq in [seq for seq, entry in self._pending.items() if entry.user_id == user_id]:
+            self.ack(seq)
+
+    def waiting_users(self) -> Set[int]:
+        """Users with entries no forwarder is processing"""
+        return {entry.user_id for entry in self._pending.values() if not entry.in_flight}
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop entries that waited for a forwarder longer than ``max_age``"""
+        cutoff = (now or time.time()) - self.max_age
+        expired = [
+            seq for seq, entry in self._pending.items() if not entry.in_flight and entry.appended_at < cutoff
+        ]
+        for seq in expired:
+            self.ack(seq)
+        if expired:
+            self.expired += len(expired)
+            logger.warning(f"Outbox: {len(expired)} entries expired without being replayed")
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "offset": self._offset,
+            "segments": len(self._segments),
+            "commits": self.commits,
+            "entries_per_commit": round(self.committed / self.commits, 2) if self.commits else None,
+            "replayed": self.replayed,
+            "expired": self.expired,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.checkpoint_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._commit()
+            due = loop.time() - self._checkpointed_at >= self.checkpoint_interval
+            if due:
+                self.expire()
+            if self._offset != self._saved_offset and (due or self._stopping):
+                self._checkpointed_at = loop.time()
+                try:
+                    await asyncio.to_thread(self._checkpoint)
+                except OSError as e:
+                    logger.error(f"Failed to write outbox offset: {str(e)}")
+
+    async def _commit(self) -> None:
+        if not self._appends:
+            return
+        batch, self._appends = self._appends, []
+        try:
+            await asyncio.to_thread(self._write, batch[0][0].seq, b"".join(entry.encode() for entry, _ in batch))
+        except OSError as e:
+            logger.error(f"Failed to commit {len(batch)} outbox entries: {str(e)}")
+            for entry, future in batch:
+                self._pending.pop(entry.seq, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.commits += 1
+        self.committed += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    # Blocking file operations, run in a thread
+
+    def _write(self, first_seq: int, data: bytes) -> None:
+        if self._file is None or self._file_bytes >= self.segment_bytes:
+            self._open_segment(first_seq)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file_bytes += len(data)
+
+    def _open_segment(self, first_seq: int) -> None:
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, f"{first_seq:020d}{_SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._file_bytes = self._file.tell()
+        self._segments.append((first_seq, path))
+        self._fsync_directory()
+
+    def _checkpoint(self) -> None:
+        offset = self._offset
+        path = os.path.join(self.directory, "offset")
+        with open(path + ".tmp", "w") as tmp:
+            tmp.write(str(offset))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(path + ".tmp", path)
+        self._saved_offset = offset
+
+        # A segment is fully acknowledged once the next one starts at or below offset + 1
+        while len(self._segments) > 1 and self._segments[1][0] <= offset + 1:
+            _, path = self._segments.pop(0)
+            os.remove(path)
+        self._fsync_directory()
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _recover(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        offset_path = os.path.join(self.directory, "offset")
+        if os.path.exists(offset_path):
+            with open(offset_path) as offset_file:
+                self._offset = self._saved_offset = int(offset_file.read().strip() or 0)
+
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(_SEGMENT_SUFFIX))
+        cutoff = time.time() - self.max_age
+        last_seq = self._offset
+        for name in names:
+            path = os.path.join(self.directory, name)
+            entries, clean = _read_segment(path)
+            if not clean:
+                logger.warning(f"Outbox segment {name} has a torn tail after {len(entries)} entries")
+            self._segments.append((int(name[:-len(_SEGMENT_SUFFIX)]), path))
+            for entry in entries:
+                last_seq = max(last_seq, entry.seq)
+                if entry.seq > self._offset and entry.appended_at >= cutoff:
+                    entry.in_flight = False
+                    self._pending[entry.seq] = entry
+        self._next_seq = last_seq + 1
+        # Expired entries count as acknowledged; new appends always go to a fresh segment
+        self._offset = next(iter(self._pending)) - 1 if self._pending else last_seq
+
+
+outbox = Outbox()
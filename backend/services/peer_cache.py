@@ -0,0 +1,235 @@
+# app/services/peer_cache.py
+"""
+Two-level cache of resolved Telegram peers and channel access checks.
+
+Resolving ``@username`` is one of the most tightly rate-limited Telegram
+calls, and the access hash it yields is stable for the account that
+resolved it. Results are kept per user in an in-process LRU in front of the
+``telegram_peers`` table:
+
+- positive entries (peer id, type, access hash) are valid for
+  ``PEER_CACHE_TTL`` seconds for access checks, but the stored input peer is
+  reused by the forwarder indefinitely so a peer is never resolved twice;
+- negative entries (unknown username, private / banned channel) expire after
+  ``PEER_CACHE_NEGATIVE_TTL`` seconds so a typo is not retried on every call;
+- transient failures (flood waits, network errors) are not cached, and
+  neither is Telethon's bare ``ValueError`` for an entity its session has
+  not seen yet, which a later call can resolve;
+- access hashes belong to the account, so logging in with another account
+  drops the user's entries (:meth:`PeerCache.invalidate_user`).
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import logging
+import os
+import re
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, String, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base
+from app.services.client_registry import client_registry, parse_peer
+from app.services.principal_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PEER_CACHE_TTL = float(os.getenv("PEER_CACHE_TTL", "2592000"))
+PEER_CACHE_NEGATIVE_TTL = float(os.getenv("PEER_CACHE_NEGATIVE_TTL", "600"))
+PEER_CACHE_MAX_ENTRIES = int(os.getenv("PEER_CACHE_MAX_ENTRIES", "50000"))
+
+_LINK_PREFIX = re.compile(r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/", re.IGNORECASE)
+
+
+class TelegramPeer(Base):
+    __tablename__ = "telegram_peers"
+
+    user_id = Column(Integer, primary_key=True)
+    peer_key = Column(String(128), primary_key=True)
+    peer_id = Column(BigInteger, nullable=True)
+    peer_type = Column(String(16), nullable=True)
+    access_hash = Column(BigInteger, nullable=True)
+    has_access = Column(Boolean, nullable=False)
+    resolved_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class CachedPeer:
+    """A resolved (or known-unresolvable) peer for one account"""
+
+    __slots__ = ("peer_id", "peer_type", "access_hash", "has_access", "expires_at")
+
+    def __init__(self, peer_id, peer_type, access_hash, has_access: bool, expires_at: datetime):
+        self.peer_id = peer_id
+        self.peer_type = peer_type
+        self.access_hash = access_hash
+        self.has_access = has_access
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_row(cls, row: TelegramPeer) -> "CachedPeer":
+        return cls(row.peer_id, row.peer_type, row.access_hash, row.has_access, row.expires_at)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= datetime.utcnow()
+
+    def input_peer(self):
+        """Telethon InputPeer usable without another resolve call"""
+        from telethon import utils
+        from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+        if not self.has_access:
+            return None
+        real_id, _ = utils.resolve_id(self.peer_id)
+        if self.peer_type == "channel":
+            return InputPeerChannel(real_id, self.access_hash or 0)
+        if self.peer_type == "chat":
+            return InputPeerChat(real_id)
+        return InputPeerUser(real_id, self.access_hash or 0)
+
+
+def peer_key(channel_id: str) -> str:
+    """Normalise the ways a channel can be written: -100..., @name, t.me/name"""
+    key = _LINK_PREFIX.sub("", str(channel_id).strip()).strip("/")
+    if key.lstrip("-").isdigit():
+        return key
+    return key.lstrip("@").lower()
+
+
+def _is_permanent_failure(error: Exception) -> bool:
+    from telethon.errors import (
+        ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError,
+        UsernameInvalidError, UsernameNotOccupiedError,
+    )
+
+    return isinstance(error, (
+        ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError,
+        UsernameInvalidError, UsernameNotOccupiedError,
+    ))
+
+
+class PeerCache:
+    """LRU over ``telegram_peers`` over ``client.get_entity``"""
+
+    def __init__(
+        self,
+        ttl: float = PEER_CACHE_TTL,
+        negative_ttl: float = PEER_CACHE_NEGATIVE_TTL,
+        max_entries: int = PEER_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # Expiry is tracked on the entries themselves; the LRU only bounds memory
+        self.local = TTLCache(max_entries, float("inf"))
+        self.resolves = 0
+
+    async def get(self, user_id: int, channel_id: str, client=None, allow_expired: bool = False) -> CachedPeer:
+        """Resolve through the LRU, then the table, then Telegram"""
+        key = (user_id, peer_key(channel_id))
+        peer = self.local.get(key)
+        if peer is None:
+            peer = await self._load(*key)
+            if peer is not None:
+                self.local.set(key, peer)
+        if peer is not None and (not peer.expired or (allow_expired and peer.has_access)):
+            return peer
+        return await self._resolve(user_id, channel_id, client)
+
+    async def verify_channel_access(self, user_id: int, channel_id: str) -> bool:
+        """Whether the user's account can resolve the channel"""
+        return (await self.get(user_id, channel_id)).has_access
+
+    async def input_peer(self, user_id: int, channel_id: str, client=None):
+        """InputPeer for the forwarder; known peers are never resolved again"""
+        return (await self.get(user_id, channel_id, client, allow_expired=True)).input_peer()
+
+    async def warm(self, user_id: int) -> int:
+        """Load a user's known peers into the LRU (forwarder start)"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(select(TelegramPeer).where(
+                TelegramPeer.user_id == user_id,
+                TelegramPeer.has_access == True
+            ))).all()
+        for row in rows:
+            self.local.set((user_id, row.peer_key), CachedPeer.from_row(row))
+        return len(rows)
+
+    def forget_user(self, user_id: int) -> int:
+        """Drop a user's in-process entries (the worker side of a new login)"""
+        return self.local.pop_where(lambda key: key[0] == user_id)
+
+    async def invalidate_user(self, db: AsyncSession, user_id: int) -> None:
+        """Forget a user's peers (new login); stored access hashes belong to the old account"""
+        self.forget_user(user_id)
+        await db.execute(delete(TelegramPeer).where(TelegramPeer.user_id == user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.local.stats(), "resolves": self.resolves}
+
+    async def _load(self, user_id: int, key: str) -> Optional[CachedPeer]:
+        async with AsyncSessionLocal() as db:
+            row = await db.scalar(select(TelegramPeer).where(
+                TelegramPeer.user_id == user_id,
+                TelegramPeer.peer_key == key
+            ))
+        return CachedPeer.from_row(row) if row is not None else None
+
+    async def _resolve(self, user_id: int, channel_id: str, client=None) -> CachedPeer:
+        if client is None:
+            async with client_registry.client(user_id) as client:
+                return await self._resolve(user_id, channel_id, client)
+
+        from telethon import utils
+        from telethon.tl.types import Channel, Chat
+
+        self.resolves += 1
+        now = datetime.utcnow()
+        try:
+            entity = await client.get_entity(parse_peer(channel_id))
+        except Exception as e:
+            if not _is_permanent_failure(e):
+                raise
+            logger.info(f"Peer {channel_id!r} is not accessible for user {user_id}: {str(e)}")
+            peer = CachedPeer(None, None, None, False, now + timedelta(seconds=self.negative_ttl))
+        else:
+            peer_type = "channel" if isinstance(entity, Channel) else "chat" if isinstance(entity, Chat) else "user"
+            peer = CachedPeer(
+                utils.get_peer_id(entity),
+                peer_type,
+                getattr(entity, "access_hash", None),
+                True,
+                now + timedelta(seconds=self.ttl),
+            )
+
+        key = peer_key(channel_id)
+        await self._store(user_id, key, peer, now)
+        self.local.set((user_id, key), peer)
+        if peer.has_access and str(peer.peer_id) != key:
+            # Let lookups by numeric id hit the same entry as lookups by username
+            await self._store(user_id, str(peer.peer_id), peer, now)
+            self.local.set((user_id, str(peer.peer_id)), peer)
+        return peer
+
+    async def _store(self, user_id: int, key: str, peer: CachedPeer, resolved_at: datetime) -> None:
+        values = {
+            "user_id": user_id,
+            "peer_key": key,
+            "peer_id": peer.peer_id,
+            "peer_type": peer.peer_type,
+            "access_hash": peer.access_hash,
+            "has_access": peer.has_access,
+            "resolved_at": resolved_at,
+            "expires_at": peer.expires_at,
+        }
+        stmt = pg_insert(TelegramPeer).values(**values)
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=[TelegramPeer.user_id, TelegramPeer.peer_key],
+                    set_={name: stmt.excluded[name] for name in values if name not in ("user_id", "peer_key")},
+                ))
+
+
+peer_cache = PeerCache()
@@ -0,0 +1,131 @@
+# app/services/principal_cache.py
+"""
+Bounded LRU + TTL cache for authenticated principals.
+
+``get_current_user`` runs on every authenticated request. Verified token
+claims (keyed by a hash of the token, never longer than the token's own
+expiry) and the small slice of the User row the routers need are cached
+here. Anything that changes a user's activity or subscription state must
+call :meth:`PrincipalCache.invalidate_user`.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import hashlib
+import os
+import threading
+import time
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches; returns how many were dropped"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class CachedPrincipal:
+    """The User columns needed to authorise a request"""
+
+    __slots__ = ("id", "is_active", "subscription_active")
+
+    def __init__(self, id: int, is_active: bool, subscription_active: bool):
+        self.id = id
+        self.is_active = is_active
+        self.subscription_active = subscription_active
+
+    @classmethod
+    def from_user(cls, user) -> "CachedPrincipal":
+        return cls(id=user.id, is_active=user.is_active, subscription_active=user.subscription_active)
+
+
+class PrincipalCache:
+    """Caches verified JWT claims by token and principals by user id"""
+
+    def __init__(self, max_entries: int = AUTH_CACHE_MAX_ENTRIES, ttl: float = AUTH_CACHE_TTL):
+        self.claims = TTLCache(max_entries, ttl)
+        self.users = TTLCache(max_entries, ttl)
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get_claims(self, token: str) -> Optional[Dict[str, Any]]:
+        return self.claims.get(self._token_key(token))
+
+    def put_claims(self, token: str, claims: Dict[str, Any]) -> None:
+        ttl = None
+        expires_at = claims.get("exp")
+        if expires_at is not None:
+            ttl = float(expires_at) - time.time()
+        self.claims.set(self._token_key(token), claims, ttl)
+
+    def get_user(self, user_id: int) -> Optional[CachedPrincipal]:
+        return self.users.get(user_id)
+
+    def put_user(self, user) -> CachedPrincipal:
+        principal = user if isinstance(user, CachedPrincipal) else CachedPrincipal.from_user(user)
+        self.users.set(principal.id, principal)
+        return principal
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop a user's cached principal after its activity or subscription changed"""
+        self.users.pop(user_id)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"claims": self.claims.stats(), "users": self.users.stats()}
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,400 @@
+# app/services/retry_engine.py
+"""
+Automatic retries of failed forwards.
+
+A FAILED row in ``forwarding_logs`` used to be final. Each forwarder worker
+now runs a ``RetryEngine`` over the users it serves:
+
+- every ``RETRY_SCAN_INTERVAL`` seconds, FAILED rows logged since the last
+  scan (``RETRY_LOOKBACK`` seconds back for a user that just started) are
+  copied to ``forwarding_retries`` and classified by their error: flood
+  waits, timeouts, disconnects and Telegram server errors are transient,
+  everything else (no access, banned, deleted message, ...) is permanent
+  and recorded as such without a retry;
+- every ``RETRY_POLL_INTERVAL`` seconds, due transient retries are grouped
+  per (user, source, target) and re-sent as multi-message forwards of up to
+  ``RETRY_BATCH_SIZE`` ids through ``send_scheduler``, so they share the
+  account's and target's rate limits with live traffic; retries whose rule
+  was deactivated or deleted, or whose source or target channel was turned
+  off, are marked permanent instead of being sent;
+- a retry that succeeds turns the original log row into SUCCESS with its
+  target message id and moves the row from ``failed`` to ``successful`` in
+  the daily rollup; a transient failure is retried after
+  ``RETRY_BASE_DELAY * 2^(attempt-1)`` seconds (at most ``RETRY_MAX_DELAY``,
+  with jitter) until ``RETRY_MAX_ATTEMPTS`` attempts were made.
+
+Queue depth and outcomes per user are served from the table by
+``/stats/performance``.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import random
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Integer, String, Text, and_, bindparam, exists, func, or_, select, update
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base, ForwardingLog, ForwardingRule, TelegramChannel
+from app.services.client_registry import client_registry
+from app.services.log_rollup import ForwardingLogDaily
+from app.services.peer_cache import peer_cache
+from app.services.rule_counters import rule_counters
+from app.services.send_scheduler import send_scheduler
+
+logger = logging.getLogger(__name__)
+
+RETRY_ENABLED = os.getenv("RETRY_ENABLED", "true").lower() == "true"
+RETRY_SCAN_INTERVAL = float(os.getenv("RETRY_SCAN_INTERVAL", "30"))
+RETRY_POLL_INTERVAL = float(os.getenv("RETRY_POLL_INTERVAL", "5"))
+RETRY_LOOKBACK = float(os.getenv("RETRY_LOOKBACK", "86400"))
+RETRY_BATCH_SIZE = int(os.getenv("RETRY_BATCH_SIZE", "100"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "30"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "3600"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "6"))
+
+PENDING = "pending"
+SUCCEEDED = "succeeded"
+EXHAUSTED = "exhausted"
+PERMANENT = "permanent"
+
+# Error classes (as logged, "<class>: <message>") worth another attempt
+TRANSIENT_ERRORS = frozenset({
+    "FloodWaitError", "FloodPremiumWaitError", "SlowModeWaitError", "FloodError",
+    "TimeoutError", "TimedOutError", "ConnectionError", "ConnectionResetError", "OSError",
+    "ServerError", "RpcCallFailError", "RpcMcgetFailError", "WorkerBusyTooLongRetryError",
+    "InterdcCallErrorError", "InterdcCallRichErrorError",
+})
+# For rows logged before errors carried their class name
+_TRANSIENT_TEXT = ("a wait of", "timed out", "timeout", "disconnected", "not connected", "internal server", "try again")
+
+
+class ForwardingRetry(Base):
+    __tablename__ = "forwarding_retries"
+
+    log_id = Column(BigInteger, primary_key=True)
+    log_created_at = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    rule_id = Column(Integer, nullable=False)
+    source_channel_id = Column(String, nullable=False)
+    target_channel_id = Column(String, nullable=False)
+    source_message_id = Column(BigInteger, nullable=False)
+    status = Column(String(16), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+def describe_error(error: BaseException) -> str:
+    """How errors are logged: class name first, so they can be classified later"""
+    return f"{type(error).__name__}: {str(error)}"
+
+
+def is_transient(error_message: Optional[str]) -> bool:
+    if not error_message:
+        return False
+    name, _, _ = error_message.partition(":")
+    if name.isidentifier():
+        return name in TRANSIENT_ERRORS
+    text = error_message.lower()
+    return any(hint in text for hint in _TRANSIENT_TEXT)
+
+
+def backoff(attempts: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Delay before the next attempt: exponential, capped, with equal jitter"""
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryEngine:
+    """Re-drives transient forward failures of the users served by this worker"""
+
+    def __init__(
+        self,
+        scan_interval: float = RETRY_SCAN_INTERVAL,
+        poll_interval: float = RETRY_POLL_INTERVAL,
+        lookback: float = RETRY_LOOKBACK,
+        batch_size: int = RETRY_BATCH_SIZE,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        enabled: bool = RETRY_ENABLED,
+    ):
+        self.scan_interval = scan_interval
+        self.poll_interval = poll_interval
+        self.lookback = lookback
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.enabled = enabled
+        self._active_users: Callable[[], Iterable[int]] = lambda: ()
+        self._scanned: Set[int] = set()
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+        self.attempted = 0
+        self.succeeded = 0
+        self.exhausted = 0
+
+    async def start(self, active_users: Callable[[], Iterable[int]]) -> None:
+        """``active_users()`` lists the users whose forwarders run in this worker"""
+        if not self.enabled or self._task is not None:
+            return
+        self._active_users = active_users
+        self._task = asyncio.create_task(self._run(), name="retry-engine")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"attempted": self.attempted, "succeeded": self.succeeded, "exhausted": self.exhausted}
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        scanned_at = None
+        while True:
+            try:
+                if scanned_at is None or loop.time() - scanned_at >= self.scan_interval:
+                    scanned_at = loop.time()
+                    await self.scan()
+                await self.drive()
+            except Exception as e:
+                logger.error(f"Retry cycle failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def scan(self) -> int:
+        """Queue FAILED log rows not seen yet; returns how many were queued"""
+        users = set(self._active_users())
+        if not users:
+            return 0
+        since = datetime.utcnow() - timedelta(seconds=self.lookback)
+        new_users = users - self._scanned
+        known = users & self._scanned
+        # Users seen by the previous scan continue after the cursor, new ones from the lookback window
+        conditions = []
+        if known:
+            conditions.append(and_(ForwardingLog.user_id.in_(known), ForwardingLog.id > self._cursor))
+        if new_users:
+            conditions.append(ForwardingLog.user_id.in_(new_users))
+
+        queued = 0
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(
+                ForwardingLog.id,
+                ForwardingLog.created_at,
+                ForwardingLog.user_id,
+                ForwardingLog.rule_id,
+                ForwardingLog.source_message_id,
+                ForwardingLog.error_message,
+                ForwardingRule.source_channel_id,
+                ForwardingRule.target_channel_id,
+            ).join(ForwardingRule, ForwardingRule.id == ForwardingLog.rule_id).where(
+                or_(*conditions),
+                ForwardingLog.status == "FAILED",
+                ForwardingLog.created_at >= since,
+                ForwardingLog.source_message_id.isnot(None),
+            ))).all()
+            if rows:
+                queued = await self._queue(db, rows)
+                self._cursor = max(self._cursor, max(row.id for row in rows))
+        # Users that stopped are scanned from the lookback window again when they come back
+        self._scanned = users
+        return queued
+
+    async def _queue(self, db: AsyncSession, rows) -> int:
+        now = datetime.utcnow()
+        values = []
+        for row in rows:
+            transient = is_transient(row.error_message)
+            values.append({
+                "log_id": row.id,
+                "log_created_at": row.created_at,
+                "user_id": row.user_id,
+                "rule_id": row.rule_id,
+                "source_channel_id": row.source_channel_id,
+                "target_channel_id": row.target_channel_id,
+                "source_message_id": row.source_message_id,
+                "status": PENDING if transient else PERMANENT,
+                "attempts": 0,
+                "next_attempt_at": now + timedelta(seconds=backoff(1)) if transient else now,
+                "last_error": row.error_message,
+                "created_at": now,
+                "updated_at": now,
+            })
+        result = await db.execute(pg_insert(ForwardingRetry).values(values).on_conflict_do_nothing(
+            index_elements=[ForwardingRetry.log_id]
+        ))
+        await db.commit()
+        return result.rowcount or 0
+
+    async def drive(self) -> int:
+        """Attempt the retries that are due; returns how many were attempted"""
+        users = set(self._active_users())
+        if not users:
+            return 0
+        # Same conditions the forwarder routes on (rule_index): active rule, no inactive source or target
+        channel_off = exists().where(
+            TelegramChannel.user_id == ForwardingRetry.user_id,
+            TelegramChannel.is_active == False,
+            or_(
+                TelegramChannel.channel_id == ForwardingRetry.source_channel_id,
+                TelegramChannel.channel_id == ForwardingRetry.target_channel_id,
+            ),
+        )
+        forwardable = and_(ForwardingRule.is_active == True, ~channel_off)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(ForwardingRetry, forwardable).outerjoin(
+                ForwardingRule, ForwardingRule.id == ForwardingRetry.rule_id
+            ).where(
+                ForwardingRetry.status == PENDING,
+                ForwardingRetry.user_id.in_(users),
+                ForwardingRetry.next_attempt_at <= datetime.utcnow(),
+            ).order_by(ForwardingRetry.next_attempt_at).limit(self.batch_size * 10))).all()
+            due = [retry for retry, live in rows if live]
+            dropped = [retry.log_id for retry, live in rows if not live]
+            if dropped:
+                await db.execute(update(ForwardingRetry).where(ForwardingRetry.log_id.in_(dropped)).values(
+                    status=PERMANENT,
+                    last_error="Rule or channel is no longer active",
+                    updated_at=datetime.utcnow(),
+                ))
+                await db.commit()
+                logger.info(f"Dropped {len(dropped)} retries of inactive or deleted rules")
+
+        groups: Dict[Tuple[int, str, str], List[ForwardingRetry]] = {}
+        for retry in due:
+            groups.setdefault((retry.user_id, retry.source_channel_id, retry.target_channel_id), []).append(retry)
+        batches = []
+        for retries in groups.values():
+            retries.sort(key=lambda retry: retry.source_message_id)
+            batches.extend(retries[index:index + self.batch_size] for index in range(0, len(retries), self.batch_size))
+        # Batches of different targets are paced concurrently by the send scheduler
+        await asyncio.gather(*(self._attempt(batch) for batch in batches))
+        return len(due)
+
+    async def _attempt(self, retries: List[ForwardingRetry]) -> None:
+        user_id, source, target = retries[0].user_id, retries[0].source_channel_id, retries[0].target_channel_id
+        try:
+            async with client_registry.client(user_id) as client:
+                target_peer = await peer_cache.input_peer(user_id, target, client)
+                source_peer = await peer_cache.input_peer(user_id, source, client)
+                if target_peer is None or source_peer is None:
+                    raise ValueError(f"No access to {target if target_peer is None else source}")
+                ids = [retry.source_message_id for retry in retries]
+                copies = await send_scheduler.send(
+                    user_id, target, lambda: client.forward_messages(target_peer, ids, from_peer=source_peer)
+                )
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # The user's forwarder stopped here; the retries stay due for the worker serving it next
+            return
+        except Exception as e:
+            outcomes = [(retry, None, describe_error(e)) for retry in retries]
+        else:
+            if not isinstance(copies, list):
+                copies = [copies]
+            outcomes = [
+                (retry, copy, None if copy is not None else "NotForwardedError: message is no longer available")
+                for retry, copy in zip(retries, copies + [None] * (len(retries) - len(copies)))
+            ]
+        await self._record(outcomes)
+
+    async def _record(self, outcomes: List[Tuple[ForwardingRetry, Any, Optional[str]]]) -> None:
+        now = datetime.utcnow()
+        succeeded, failed = [], []
+        for retry, copy, error in outcomes:
+            attempts = retry.attempts + 1
+            if error is None:
+                succeeded.append({
+                    "b_log_id": retry.log_id,
+                    "b_log_created_at": retry.log_created_at,
+                    "b_target_message_id": getattr(copy, "id", None),
+                    "b_attempts": attempts,
+                })
+                continue
+            again = is_transient(error) and attempts < self.max_attempts
+            failed.append({
+                "b_log_id": retry.log_id,
+                "b_status": PENDING if again else EXHAUSTED,
+                "b_attempts": attempts,
+                "b_next_attempt_at": now + timedelta(seconds=backoff(attempts + 1)) if again else now,
+                "b_last_error": error,
+            })
+            if not again:
+                logger.info(
+                    f"Giving up on log {retry.log_id} of user {retry.user_id} after {attempts} retries: {error}"
+                )
+
+        logs = ForwardingLog.__table__
+        retries = ForwardingRetry.__table__
+        daily = ForwardingLogDaily.__table__
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                if succeeded:
+                    await db.execute(update(logs).where(
+                        logs.c.id == bindparam("b_log_id"),
+                        logs.c.created_at == bindparam("b_log_created_at"),
+                    ).values(
+                        status="SUCCESS", target_message_id=bindparam("b_target_message_id"), error_message=None
+                    ), succeeded)
+                    await db.execute(update(retries).where(retries.c.log_id == bindparam("b_log_id")).values(
+                        status=SUCCEEDED, attempts=bindparam("b_attempts"), last_error=None, updated_at=now
+                    ), succeeded)
+                    await self._move_rollups(db, [retry for retry, _, error in outcomes if error is None])
+                if failed:
+                    await db.execute(update(retries).where(retries.c.log_id == bindparam("b_log_id")).values(
+                        status=bindparam("b_status"),
+                        attempts=bindparam("b_attempts"),
+                        next_attempt_at=bindparam("b_next_attempt_at"),
+                        last_error=bindparam("b_last_error"),
+                        updated_at=now,
+                    ), failed)
+
+        self.attempted += len(outcomes)
+        self.succeeded += len(succeeded)
+        self.exhausted += sum(1 for row in failed if row["b_status"] == EXHAUSTED)
+        for retry, _, error in outcomes:
+            if error is None:
+                rule_counters.record(retry.user_id, retry.rule_id)
+
+    async def _move_rollups(self, db: AsyncSession, retries: List[ForwardingRetry]) -> None:
+        counts: Dict[Tuple[int, int, Any], int] = {}
+        for retry in retries:
+            key = (retry.user_id, retry.rule_id, retry.log_created_at.date())
+            counts[key] = counts.get(key, 0) + 1
+        for (user_id, rule_id, day), count in counts.items():
+            await db.execute(update(ForwardingLogDaily).where(
+                ForwardingLogDaily.user_id == user_id,
+                ForwardingLogDaily.rule_id == rule_id,
+                ForwardingLogDaily.day == day,
+            ).values(
+                successful=ForwardingLogDaily.successful + count,
+                failed=func.greatest(ForwardingLogDaily.failed - count, 0),
+            ))
+
+
+async def retry_stats(db: AsyncSession, user_id: int, since: datetime) -> Dict[str, int]:
+    """Retry queue depth and outcomes of a user since ``since``"""
+    rows = (await db.execute(select(
+        ForwardingRetry.status, func.count()
+    ).where(
+        ForwardingRetry.user_id == user_id,
+        (ForwardingRetry.status == PENDING) | (ForwardingRetry.updated_at >= since),
+    ).group_by(ForwardingRetry.status))).all()
+    counts = {status: count for status, count in rows}
+    return {
+        "queue_depth": counts.get(PENDING, 0),
+        "succeeded_after_retry": counts.get(SUCCEEDED, 0),
+        "exhausted": counts.get(EXHAUSTED, 0),
+        "permanent": counts.get(PERMANENT, 0),
+    }
+
+
+retry_engine = RetryEngine()
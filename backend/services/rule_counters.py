@@ -0,0 +1,118 @@
+# app/services/rule_counters.py
+"""
+Coalesced ``messages_forwarded`` / ``last_forwarded_at`` updates.
+
+Instead of an UPDATE on the rule row for every forwarded message, the
+forwarder records deltas here and they are applied for all rules at once with
+a single ``UPDATE ... FROM (VALUES ...)`` every flush interval and on
+shutdown. Deltas live in the worker processes and the API reads the stored
+values, so the interval is what keeps ``GET /forwarding-rules/`` and
+``/stats/`` live: it defaults to one second, the same lag as ``/stats/logs``
+behind the log sink. That is still one UPDATE per worker per second for all
+its rules, and none while nothing is forwarded.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+
+from sqlalchemy import DateTime, Integer, column, func, update, values
+
+from app.async_database import AsyncSessionLocal
+from app.models import ForwardingRule
+
+logger = logging.getLogger(__name__)
+
+RULE_COUNTERS_FLUSH_INTERVAL = float(os.getenv("RULE_COUNTERS_FLUSH_INTERVAL", "1.0"))
+
+
+class _PendingCount:
+    __slots__ = ("user_id", "delta", "last_at")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.delta = 0
+        self.last_at: Optional[datetime] = None
+
+
+class RuleCounterAggregator:
+    """In-memory per-rule forward counters flushed as one batched UPDATE"""
+
+    def __init__(self, flush_interval: float = RULE_COUNTERS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, _PendingCount] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def record(self, user_id: int, rule_id: int, count: int = 1, forwarded_at: Optional[datetime] = None) -> None:
+        """Count ``count`` messages forwarded by a rule"""
+        forwarded_at = forwarded_at or datetime.utcnow()
+        entry = self._pending.get(rule_id)
+        if entry is None:
+            entry = self._pending[rule_id] = _PendingCount(user_id)
+        entry.delta += count
+        if entry.last_at is None or forwarded_at > entry.last_at:
+            entry.last_at = forwarded_at
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="rule-counter-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await self._apply(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush counters for {len(batch)} rules: {str(e)}")
+                self._merge_back(batch)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _merge_back(self, batch: Dict[int, _PendingCount]) -> None:
+        for rule_id, entry in batch.items():
+            self.record(entry.user_id, rule_id, entry.delta, entry.last_at)
+
+    async def _apply(self, batch: Dict[int, _PendingCount]) -> None:
+        deltas = values(
+            column("rule_id", Integer),
+            column("delta", Integer),
+            column("last_at", DateTime),
+            name="deltas",
+        ).data([(rule_id, entry.delta, entry.last_at) for rule_id, entry in batch.items()])
+
+        stmt = (
+            update(ForwardingRule)
+            .where(ForwardingRule.id == deltas.c.rule_id)
+            .values(
+                messages_forwarded=func.coalesce(ForwardingRule.messages_forwarded, 0) + deltas.c.delta,
+                last_forwarded_at=func.greatest(
+                    func.coalesce(ForwardingRule.last_forwarded_at, deltas.c.last_at),
+                    deltas.c.last_at,
+                ),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(stmt)
+
+
+rule_counters = RuleCounterAggregator()
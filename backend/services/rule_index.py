@@ -0,0 +1,159 @@
+# app/services/rule_index.py
+"""
+In-memory routing index for the forwarding worker.
+
+Maps ``source_channel_id`` to the compact records of the active rules that
+listen on it, together with the compiled keyword matcher for that channel, so
+routing an incoming message never touches the database. When rules or
+channels change, the API publishes ``reload_rules`` and the worker owning the
+user invalidates its entry.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import sys
+import logging
+
+from app.services.keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+class RuleRecord:
+    """Immutable, slot-backed snapshot of the ForwardingRule columns the forwarder needs"""
+
+    __slots__ = ("id", "user_id", "source_channel_id", "target_channel_id", "filter_keywords", "exclude_keywords")
+
+    def __init__(self, id: int, user_id: int, source_channel_id: str, target_channel_id: str,
+                 filter_keywords: Tuple[str, ...] = (), exclude_keywords: Tuple[str, ...] = ()):
+        self.id = id
+        self.user_id = user_id
+        self.source_channel_id = sys.intern(source_channel_id)
+        self.target_channel_id = sys.intern(target_channel_id)
+        self.filter_keywords = tuple(filter_keywords or ())
+        self.exclude_keywords = tuple(exclude_keywords or ())
+
+    @classmethod
+    def from_rule(cls, rule) -> "RuleRecord":
+        """Build a record from a ForwardingRule row (or anything with the same attributes)"""
+        return cls(
+            id=rule.id,
+            user_id=rule.user_id,
+            source_channel_id=rule.source_channel_id,
+            target_channel_id=rule.target_channel_id,
+            filter_keywords=rule.filter_keywords,
+            exclude_keywords=rule.exclude_keywords,
+        )
+
+    def __repr__(self) -> str:
+        return f"RuleRecord(id={self.id}, source={self.source_channel_id}, target={self.target_channel_id})"
+
+
+class _SourceBucket:
+    """Rules sharing one source channel plus their lazily compiled matcher"""
+
+    __slots__ = ("rules", "matcher")
+
+    def __init__(self, rules: Tuple[RuleRecord, ...] = ()):
+        self.rules = rules
+        self.matcher: Optional[KeywordMatcher] = None
+
+    def get_matcher(self) -> KeywordMatcher:
+        if self.matcher is None:
+            self.matcher = KeywordMatcher(
+                (rule.id, rule.filter_keywords, rule.exclude_keywords) for rule in self.rules
+            )
+        return self.matcher
+
+
+class _UserIndex:
+    __slots__ = ("sources", "inactive_channels")
+
+    def __init__(self):
+        self.sources: Dict[str, _SourceBucket] = {}
+        self.inactive_channels: Set[str] = set()
+
+
+class RuleIndex:
+    """Per-user ``source_channel_id -> rules`` routing table.
+
+    A user is either loaded (served entirely from memory) or not; any change to
+    the user's rules or channels calls :meth:`invalidate_user` and the forwarder
+    reloads that user with a single query before the next message.
+    """
+
+    def __init__(self):
+        self._users: Dict[int, _UserIndex] = {}
+
+    def is_loaded(self, user_id: int) -> bool:
+        return user_id in self._users
+
+    def load_user(self, user_id: int, rules: Iterable, inactive_channels: Iterable[str] = ()) -> None:
+        """Replace the user's entry with the given active rules"""
+        index = _UserIndex()
+        index.inactive_channels = {sys.intern(channel_id) for channel_id in inactive_channels}
+        grouped: Dict[str, List[RuleRecord]] = {}
+        for rule in rules:
+            record = rule if isinstance(rule, RuleRecord) else RuleRecord.from_rule(rule)
+            grouped.setdefault(record.source_channel_id, []).append(record)
+        index.sources = {source: _SourceBucket(tuple(records)) for source, records in grouped.items()}
+        self._users[user_id] = index
+        count = sum(len(records) for records in grouped.values())
+        logger.info(f"Loaded {count} active rules on {len(index.sources)} sources for user {user_id}")
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop the user's entry so the forwarder reloads it from the database"""
+        self._users.pop(user_id, None)
+
+    def sources(self, user_id: int) -> List[str]:
+        """Source channels the user currently has active rules on"""
+        index = self._users.get(user_id)
+        if index is None:
+            return []
+        return [source for source in index.sources if source not in index.inactive_channels]
+
+    def rules_on(self, user_id: int, source_channel_id: str) -> List[RuleRecord]:
+        """Every rule that could forward from ``source_channel_id``, before keyword matching"""
+        index = self._users.get(user_id)
+        if index is None or source_channel_id in index.inactive_channels:
+            return []
+        bucket = index.sources.get(source_channel_id)
+        if bucket is None:
+            return []
+        return [rule for rule in bucket.rules if rule.target_channel_id not in index.inactive_channels]
+
+    def route(self, user_id: int, source_channel_id: str, text: Optional[str]) -> List[RuleRecord]:
+        """Return the rules that should forward a message from ``source_channel_id``"""
+        index = self._users.get(user_id)
+        if index is None:
+            return []
+        bucket = index.sources.get(source_channel_id)
+        if bucket is None or source_channel_id in index.inactive_channels:
+            return []
+
+        matched = bucket.get_matcher().match(text)
+        if not matched:
+            return []
+        return [
+            rule for rule in bucket.rules
+            if rule.id in matched and rule.target_channel_id not in index.inactive_channels
+        ]
+
+
+async def load_user_rules(db, user_id: int) -> None:
+    """Populate the index for a user from the database (forwarder start / after invalidation)"""
+    from sqlalchemy import select
+    from app.models import ForwardingRule, TelegramChannel
+
+    rules = (await db.scalars(select(ForwardingRule).where(
+        ForwardingRule.user_id == user_id,
+        ForwardingRule.is_active == True
+    ))).all()
+
+    inactive_channels = (await db.scalars(select(TelegramChannel.channel_id).where(
+        TelegramChannel.user_id == user_id,
+        TelegramChannel.is_active == False
+    ))).all()
+
+    rule_index.load_user(user_id, rules, inactive_channels)
+
+
+rule_index = RuleIndex()
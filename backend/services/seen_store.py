@@ -0,0 +1,314 @@
+# app/services/seen_store.py
+"""
+Compact per-user record of the (rule, source message) pairs already forwarded.
+
+Telegram re-delivers updates after reconnects and ``catch_up``, and a worker
+restart replays whatever it fetches again. Before a message is handed to the
+send scheduler for a rule, the forwarder claims ``(rule_id, message_id)``
+here and skips the rule if the pair is in flight or was forwarded before.
+A claim only marks the pair in flight (in memory, never persisted); the pair
+is remembered once its SUCCESS is logged (:meth:`SeenStore.confirm`), and a
+failed or cancelled send releases it, so a message that was never sent is
+never skipped after a restart:
+
+- a time-bucketed Bloom filter (``SEEN_STORE_BUCKETS`` buckets of
+  ``SEEN_STORE_BUCKET_SECONDS`` each, ``SEEN_STORE_BLOOM_BYTES`` per user in
+  total) answers "definitely new" in O(1) for almost every message; the
+  oldest bucket is dropped as time moves on, so memory never grows;
+- an exact LRU of the last ``SEEN_STORE_LRU_SIZE`` forwarded pairs per user
+  confirms a Bloom hit without further work;
+- a Bloom hit missing from the LRU (an old duplicate or a false positive) is
+  settled against ``forwarding_logs`` so a false positive never drops a
+  message.
+
+Each user's state is written to ``forwarding_seen_state`` every
+``SEEN_STORE_PERSIST_INTERVAL`` seconds. On load, pairs logged as forwarded
+since the last write are replayed from ``forwarding_logs``, so restarts stay
+exactly-once in practice.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+import time
+import zlib
+
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base, ForwardingLog
+
+logger = logging.getLogger(__name__)
+
+SEEN_STORE_BUCKETS = int(os.getenv("SEEN_STORE_BUCKETS", "4"))
+SEEN_STORE_BUCKET_SECONDS = float(os.getenv("SEEN_STORE_BUCKET_SECONDS", "21600"))
+SEEN_STORE_BLOOM_BYTES = int(os.getenv("SEEN_STORE_BLOOM_BYTES", "65536"))
+SEEN_STORE_LRU_SIZE = int(os.getenv("SEEN_STORE_LRU_SIZE", "2048"))
+SEEN_STORE_PERSIST_INTERVAL = float(os.getenv("SEEN_STORE_PERSIST_INTERVAL", "60"))
+BLOOM_HASHES = 7
+
+_STATE_VERSION = 1
+
+
+class SeenState(Base):
+    __tablename__ = "forwarding_seen_state"
+
+    user_id = Column(Integer, primary_key=True)
+    state = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+def _positions(rule_id: int, message_id: int, bits: int) -> List[int]:
+    """BLOOM_HASHES bit positions by double hashing one 128-bit digest"""
+    digest = hashlib.blake2b(struct.pack(">qq", rule_id, message_id), digest_size=16).digest()
+    h1, h2 = struct.unpack(">QQ", digest)
+    h2 |= 1
+    return [(h1 + index * h2) % bits for index in range(BLOOM_HASHES)]
+
+
+class _UserSeen:
+    """Bloom buckets (newest last) plus the exact LRU of one user"""
+
+    __slots__ = ("bits", "buckets", "starts", "recent", "in_flight", "dirty")
+
+    def __init__(self, buckets: int, bucket_bytes: int, bucket_seconds: float, now: float):
+        self.bits = bucket_bytes * 8
+        self.buckets = [bytearray(bucket_bytes) for _ in range(buckets)]
+        self.starts = [now - (buckets - 1 - index) * bucket_seconds for index in range(buckets)]
+        self.recent: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+        self.in_flight: Set[Tuple[int, int]] = set()
+        self.dirty = False
+
+    def rotate(self, now: float, bucket_seconds: float) -> None:
+        if now - self.starts[-1] >= len(self.buckets) * bucket_seconds:
+            # Everything expired (e.g. a long stop): start over instead of rotating bucket by bucket
+            in_flight = self.in_flight
+            self.__init__(len(self.buckets), len(self.buckets[0]), bucket_seconds, now)
+            self.in_flight = in_flight
+            self.dirty = True
+            return
+        while now - self.starts[-1] >= bucket_seconds:
+            self.buckets.pop(0)
+            self.starts.pop(0)
+            self.buckets.append(bytearray(len(self.buckets[-1])))
+            self.starts.append(self.starts[-1] + bucket_seconds)
+            self.dirty = True
+
+    def might_contain(self, positions: List[int]) -> bool:
+        for bucket in self.buckets:
+            if all(bucket[position >> 3] & (1 << (position & 7)) for position in positions):
+                return True
+        return False
+
+    def add(self, key: Tuple[int, int], positions: List[int], lru_size: int) -> None:
+        bucket = self.buckets[-1]
+        for position in positions:
+            bucket[position >> 3] |= 1 << (position & 7)
+        self.recent[key] = None
+        self.recent.move_to_end(key)
+        while len(self.recent) > lru_size:
+            self.recent.popitem(last=False)
+        self.dirty = True
+
+    def dump(self) -> bytes:
+        header = struct.pack(">BHI", _STATE_VERSION, len(self.buckets), len(self.buckets[0]))
+        starts = struct.pack(f">{len(self.starts)}d", *self.starts)
+        recent = b"".join(struct.pack(">qq", *key) for key in self.recent)
+        return zlib.compress(header + starts + b"".join(self.buckets) + recent)
+
+    @classmethod
+    def load(cls, blob: bytes, buckets: int, bucket_bytes: int, bucket_seconds: float, now: float) -> "_UserSeen":
+        """Restore a dump; a dump with a different layout is discarded"""
+        seen = cls(buckets, bucket_bytes, bucket_seconds, now)
+        data = zlib.decompress(blob)
+        version, count, size = struct.unpack_from(">BHI", data)
+        if version != _STATE_VERSION or count != buckets or size != bucket_bytes:
+            return seen
+        offset = struct.calcsize(">BHI")
+        seen.starts = list(struct.unpack_from(f">{count}d", data, offset))
+        offset += 8 * count
+        seen.buckets = [bytearray(data[offset + index * size:offset + (index + 1) * size]) for index in range(count)]
+        offset += count * size
+        for key_offset in range(offset, len(data), 16):
+            seen.recent[struct.unpack_from(">qq", data, key_offset)] = None
+        return seen
+
+
+class SeenStore:
+    """Claims (rule, source message) pairs per user with a fixed memory budget"""
+
+    def __init__(
+        self,
+        buckets: int = SEEN_STORE_BUCKETS,
+        bucket_seconds: float = SEEN_STORE_BUCKET_SECONDS,
+        bloom_bytes: int = SEEN_STORE_BLOOM_BYTES,
+        lru_size: int = SEEN_STORE_LRU_SIZE,
+        persist_interval: float = SEEN_STORE_PERSIST_INTERVAL,
+    ):
+        self.buckets = buckets
+        self.bucket_seconds = bucket_seconds
+        self.bucket_bytes = max(bloom_bytes // buckets, 1)
+        self.lru_size = lru_size
+        self.persist_interval = persist_interval
+        self._users: Dict[int, _UserSeen] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.duplicates = 0
+        self.fallback_checks = 0
+        self.false_positives = 0
+
+    @property
+    def window(self) -> float:
+        """How long a claim is remembered, at least"""
+        return (self.buckets - 1) * self.bucket_seconds
+
+    async def start(self) -> None:
+        if self._task is None and self.persist_interval > 0:
+            self._task = asyncio.create_task(self._run(), name="seen-store-persist")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.persist()
+
+    async def claim(self, user_id: int, rule_id: int, message_id: int) -> bool:
+        """True if the pair is new (and is now in flight), False for a duplicate"""
+        seen = self._user(user_id)
+        seen.rotate(time.time(), self.bucket_seconds)
+        key = (rule_id, message_id)
+        if key in seen.in_flight:
+            self.duplicates += 1
+            return False
+        if key in seen.recent:
+            seen.recent.move_to_end(key)
+            self.duplicates += 1
+            return False
+
+        positions = _positions(rule_id, message_id, seen.bits)
+        if seen.might_contain(positions):
+            self.fallback_checks += 1
+            if await self._was_forwarded(user_id, rule_id, message_id):
+                seen.add(key, positions, self.lru_size)
+                self.duplicates += 1
+                return False
+            self.false_positives += 1
+
+        seen.in_flight.add(key)
+        return True
+
+    def confirm(self, user_id: int, rule_id: int, message_id: int) -> None:
+        """The pair's SUCCESS was logged: remember it"""
+        seen = self._users.get(user_id)
+        if seen is None:
+            # Unloaded meanwhile; the next load replays the SUCCESS row
+            return
+        key = (rule_id, message_id)
+        seen.in_flight.discard(key)
+        seen.add(key, _positions(rule_id, message_id, seen.bits), self.lru_size)
+
+    def release(self, user_id: int, rule_id: int, message_id: int) -> None:
+        """The send failed or was cancelled: the pair may be claimed again"""
+        seen = self._users.get(user_id)
+        if seen is not None:
+            seen.in_flight.discard((rule_id, message_id))
+
+    async def load(self, user_id: int) -> None:
+        """Restore a user's state and replay what was forwarded since it was saved (forwarder start)"""
+        now = time.time()
+        async with AsyncSessionLocal() as db:
+            row = await db.scalar(select(SeenState).where(SeenState.user_id == user_id))
+            since = datetime.utcnow() - timedelta(seconds=self.window)
+            if row is not None:
+                try:
+                    self._users[user_id] = _UserSeen.load(
+                        row.state, self.buckets, self.bucket_bytes, self.bucket_seconds, now
+                    )
+                    since = max(since, row.updated_at - timedelta(seconds=self.persist_interval))
+                except (zlib.error, struct.error) as e:
+                    logger.warning(f"Discarding unreadable seen state of user {user_id}: {str(e)}")
+            pairs = (await db.execute(select(ForwardingLog.rule_id, ForwardingLog.source_message_id).where(
+                ForwardingLog.user_id == user_id,
+                ForwardingLog.created_at >= since,
+                ForwardingLog.status == "SUCCESS"
+            ))).all()
+
+        seen = self._user(user_id)
+        seen.rotate(now, self.bucket_seconds)
+        for rule_id, message_id in pairs:
+            if rule_id is not None and message_id is not None:
+                seen.add((rule_id, message_id), _positions(rule_id, message_id, seen.bits), self.lru_size)
+
+    async def unload(self, user_id: int) -> None:
+        """Save and drop a user's state (forwarder stop)"""
+        await self.persist([user_id])
+        self._users.pop(user_id, None)
+
+    async def persist(self, user_ids: Optional[Iterable[int]] = None) -> None:
+        """Write every (or every given) user whose state changed since the last write"""
+        rows = []
+        now = datetime.utcnow()
+        for user_id in list(self._users if user_ids is None else user_ids):
+            seen = self._users.get(user_id)
+            if seen is not None and seen.dirty:
+                rows.append({"user_id": user_id, "state": seen.dump(), "updated_at": now})
+                seen.dirty = False
+        if not rows:
+            return
+
+        stmt = pg_insert(SeenState).values(rows)
+        try:
+            async with AsyncSessionLocal() as db:
+                async with db.begin():
+                    await db.execute(stmt.on_conflict_do_update(
+                        index_elements=[SeenState.user_id],
+                        set_={"state": stmt.excluded.state, "updated_at": stmt.excluded.updated_at},
+                    ))
+        except Exception as e:
+            logger.error(f"Failed to persist seen state of {len(rows)} users: {str(e)}")
+            for row in rows:
+                if row["user_id"] in self._users:
+                    self._users[row["user_id"]].dirty = True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._users),
+            "bytes": sum(len(bucket) for seen in self._users.values() for bucket in seen.buckets),
+            "duplicates": self.duplicates,
+            "fallback_checks": self.fallback_checks,
+            "false_positives": self.false_positives,
+        }
+
+    def _user(self, user_id: int) -> _UserSeen:
+        seen = self._users.get(user_id)
+        if seen is None:
+            seen = self._users[user_id] = _UserSeen(self.buckets, self.bucket_bytes, self.bucket_seconds, time.time())
+        return seen
+
+    async def _was_forwarded(self, user_id: int, rule_id: int, message_id: int) -> bool:
+        since = datetime.utcnow() - timedelta(seconds=self.window + self.bucket_seconds)
+        async with AsyncSessionLocal() as db:
+            found = await db.scalar(select(ForwardingLog.id).where(
+                ForwardingLog.rule_id == rule_id,
+                ForwardingLog.source_message_id == message_id,
+                ForwardingLog.user_id == user_id,
+                ForwardingLog.created_at >= since,
+                ForwardingLog.status == "SUCCESS"
+            ).limit(1))
+        return found is not None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            await self.persist()
+
+
+seen_store = SeenStore()
@@ -0,0 +1,332 @@
+# app/services/send_scheduler.py
+"""
+Flood-wait-aware scheduler for outgoing Telegram sends.
+
+Every send of the forwarder goes through :meth:`SendScheduler.send`, which
+queues it on a lane for its target chat under the sending account. A
+dispatcher per account starts a send whenever both the target's and the
+account's token buckets have a token, so a popular source fanning out to many
+targets is paced instead of tripping Telegram's limits. Sends to different
+targets run concurrently, up to ``SEND_FANOUT_CONCURRENCY`` per account, so
+a message fanned out to 50 targets within the account's burst takes about one
+round trip rather than 50; each target has at most one send in flight, which
+keeps its order:
+
+- ``FloodWaitError`` (account-wide) pauses the whole account for exactly the
+  number of seconds the server asked for; ``SlowModeWaitError`` pauses only
+  that target. The send stays at the head of its lane and is retried when
+  the pause ends, so per-target order is preserved and nothing is reported
+  as failed;
+- a wait longer than ``SEND_MAX_FLOOD_WAIT`` fails the send instead;
+- each account holds at most ``SEND_QUEUE_MAX_PENDING`` queued sends;
+  further ``send`` calls wait for room (backpressure into the forwarder);
+- :meth:`SendScheduler.drop_account` closes an account whose forwarder
+  stopped: its queued sends and the callers waiting for room get
+  ``CancelledError``, and so does a send for an account the worker no
+  longer serves instead of starting a new dispatcher for it.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SEND_ACCOUNT_RATE = float(os.getenv("SEND_ACCOUNT_RATE", "5.0"))
+SEND_ACCOUNT_BURST = float(os.getenv("SEND_ACCOUNT_BURST", "50"))
+SEND_TARGET_RATE = float(os.getenv("SEND_TARGET_RATE", "1.0"))
+SEND_TARGET_BURST = float(os.getenv("SEND_TARGET_BURST", "3"))
+SEND_QUEUE_MAX_PENDING = int(os.getenv("SEND_QUEUE_MAX_PENDING", "1000"))
+SEND_MAX_FLOOD_WAIT = float(os.getenv("SEND_MAX_FLOOD_WAIT", "300"))
+SEND_FANOUT_CONCURRENCY = int(os.getenv("SEND_FANOUT_CONCURRENCY", "64"))
+SEND_LANE_IDLE_TIMEOUT = 300.0
+
+
+class TokenBucket:
+    """Classic token bucket that can also be blocked until a point in time"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token can be taken"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class _Job:
+    __slots__ = ("send", "future")
+
+    def __init__(self, send: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.send = send
+        self.future = future
+
+
+class _Lane:
+    __slots__ = ("jobs", "bucket", "last_used", "busy")
+
+    def __init__(self, bucket: TokenBucket, now: float):
+        self.jobs: Deque[_Job] = deque()
+        self.bucket = bucket
+        self.last_used = now
+        # One send per target in flight keeps the target's order
+        self.busy = False
+
+
+class _Account:
+    __slots__ = ("bucket", "lanes", "pending", "wakeup", "room", "slots", "task", "sending", "closed")
+
+    def __init__(self, bucket: TokenBucket, concurrency: int):
+        self.bucket = bucket
+        self.lanes: "OrderedDict[Hashable, _Lane]" = OrderedDict()
+        self.pending = 0
+        self.wakeup = asyncio.Event()
+        self.room = asyncio.Condition()
+        self.slots = asyncio.Semaphore(concurrency)
+        self.task: Optional[asyncio.Task] = None
+        self.sending: Set[asyncio.Task] = set()
+        self.closed = False
+
+
+def _flood_wait(error: Exception) -> Optional[tuple]:
+    """(scope, seconds) for Telegram's rate-limit errors, None for anything else"""
+    from telethon.errors import FloodWaitError, SlowModeWaitError
+
+    if isinstance(error, SlowModeWaitError):
+        return "target", float(error.seconds)
+    if isinstance(error, FloodWaitError):
+        return "account", float(error.seconds)
+    return None
+
+
+class SendScheduler:
+    """Per-account dispatchers pacing sends with per-target and per-account token buckets"""
+
+    def __init__(
+        self,
+        account_rate: float = SEND_ACCOUNT_RATE,
+        account_burst: float = SEND_ACCOUNT_BURST,
+        target_rate: float = SEND_TARGET_RATE,
+        target_burst: float = SEND_TARGET_BURST,
+        max_pending: int = SEND_QUEUE_MAX_PENDING,
+        max_flood_wait: float = SEND_MAX_FLOOD_WAIT,
+        concurrency: int = SEND_FANOUT_CONCURRENCY,
+    ):
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.target_rate = target_rate
+        self.target_burst = target_burst
+        self.max_pending = max_pending
+        self.max_flood_wait = max_flood_wait
+        self.concurrency = concurrency
+        self._accounts: Dict[int, _Account] = {}
+        self._serves: Callable[[int], bool] = lambda account_id: True
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+
+    async def start(self, serves: Callable[[int], bool]) -> None:
+        """``serves(account_id)`` tells whether this worker still forwards for the account"""
+        self._serves = serves
+
+    async def send(self, account_id: int, target: Hashable, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Queue ``send()`` for ``target`` and return its result once it went out"""
+        return await (await self.submit(account_id, target, send))
+
+    async def submit(self, account_id: int, target: Hashable, send: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Queue ``send()`` for ``target``; the returned future resolves once it went out"""
+        loop = asyncio.get_running_loop()
+        account = self._account(account_id)
+
+        async with account.room:
+            await account.room.wait_for(lambda: account.closed or account.pending < self.max_pending)
+            if account.closed:
+                # Dropped while waiting for room
+                raise asyncio.CancelledError()
+            account.pending += 1
+
+        lane = account.lanes.get(target)
+        if lane is None:
+            now = loop.time()
+            lane = account.lanes[target] = _Lane(TokenBucket(self.target_rate, self.target_burst, now), now)
+        job = _Job(send, loop.create_future())
+        lane.jobs.append(job)
+        account.wakeup.set()
+        return job.future
+
+    async def stop(self) -> None:
+        """Cancel the dispatchers; queued sends fail with CancelledError"""
+        for account in self._accounts.values():
+            await self._close(account)
+        self._accounts.clear()
+
+    async def drop_account(self, account_id: int) -> None:
+        """Cancel an account's dispatcher, queued sends and waiting callers (its forwarder stopped)"""
+        account = self._accounts.pop(account_id, None)
+        if account is not None:
+            await self._close(account)
+
+    def queue_depth(self, account_id: int) -> int:
+        account = self._accounts.get(account_id)
+        return account.pending if account else 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "accounts": len(self._accounts),
+            "queued": sum(account.pending for account in self._accounts.values()),
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+        }
+
+    async def _close(self, account: _Account) -> None:
+        account.closed = True
+        async with account.room:
+            account.room.notify_all()
+        tasks = list(account.sending) + ([account.task] if account.task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for lane in account.lanes.values():
+            for job in lane.jobs:
+                if not job.future.done():
+                    job.future.cancel()
+
+    def _account(self, account_id: int) -> _Account:
+        account = self._accounts.get(account_id)
+        if account is None:
+            if not self._serves(account_id):
+                # A late send of a user whose forwarder stopped must not restart its dispatcher
+                raise asyncio.CancelledError()
+            now = asyncio.get_running_loop().time()
+            account = self._accounts[account_id] = _Account(
+                TokenBucket(self.account_rate, self.account_burst, now), self.concurrency
+            )
+            account.task = asyncio.create_task(self._dispatch(account), name=f"send-dispatch-{account_id}")
+        return account
+
+    def _next_lane(self, account: _Account, now: float):
+        """The idle lane that can send soonest; ties go to the least recently served lane"""
+        best_key, best_wait = None, float("inf")
+        account_wait = account.bucket.wait_time(now)
+        for key, lane in account.lanes.items():
+            if not lane.jobs or lane.busy:
+                continue
+            wait = max(account_wait, lane.bucket.wait_time(now))
+            if wait < best_wait:
+                best_key, best_wait = key, wait
+                if wait <= 0:
+                    break
+        return best_key, best_wait
+
+    async def _dispatch(self, account: _Account) -> None:
+        while True:
+            await account.slots.acquire()
+            try:
+                key, lane, job = await self._next_job(account)
+            except BaseException:
+                account.slots.release()
+                raise
+            task = asyncio.create_task(self._send(account, key, lane, job))
+            account.sending.add(task)
+            task.add_done_callback(account.sending.discard)
+
+    async def _next_job(self, account: _Account):
+        """Wait for a lane that may send now, take a token from both buckets and mark the lane busy"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            key, wait = self._next_lane(account, now)
+            if key is None:
+                self._prune(account, now)
+                account.wakeup.clear()
+                await account.wakeup.wait()
+                continue
+            if wait > 0:
+                # Sleep until the earliest lane is ready, unless new work arrives first
+                account.wakeup.clear()
+                try:
+                    await asyncio.wait_for(account.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            lane = account.lanes[key]
+            account.lanes.move_to_end(key)
+            job = lane.jobs[0]
+            if job.future.cancelled():
+                # The caller gave up (e.g. its forwarder stopped)
+                lane.jobs.popleft()
+                await self._release(account)
+                continue
+            account.bucket.consume(now)
+            lane.bucket.consume(now)
+            lane.last_used = now
+            lane.busy = True
+            return key, lane, job
+
+    async def _send(self, account: _Account, key: Hashable, lane: _Lane, job: _Job) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                result = await job.send()
+            except Exception as e:
+                flood = _flood_wait(e)
+                if flood is not None and flood[1] <= self.max_flood_wait:
+                    scope, seconds = flood
+                    self.flood_waits += 1
+                    resume_at = loop.time() + seconds
+                    (account.bucket if scope == "account" else lane.bucket).block(resume_at)
+                    where = "the account" if scope == "account" else f"target {key!r}"
+                    logger.warning(f"Flood wait of {seconds:.0f}s on {where}, send re-queued")
+                    return
+                lane.jobs.popleft()
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                lane.jobs.popleft()
+                self.sent += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            await self._release(account)
+        finally:
+            lane.busy = False
+            account.slots.release()
+            account.wakeup.set()
+
+    async def _release(self, account: _Account) -> None:
+        async with account.room:
+            account.pending -= 1
+            account.room.notify()
+
+    def _prune(self, account: _Account, now: float) -> None:
+        idle = [
+            key for key, lane in account.lanes.items()
+            if not lane.jobs and now - lane.last_used > SEND_LANE_IDLE_TIMEOUT
+        ]
+        for key in idle:
+            del account.lanes[key]
+
+
+send_scheduler = SendScheduler()
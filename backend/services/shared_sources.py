@@ -0,0 +1,135 @@
+# app/services/shared_sources.py
+"""
+One listener per public source channel per worker.
+
+Popular public channels are sources of many users, and every forwarder used
+to process the same post from its own client: one update handler run, one
+catch-up fetch and one ``get_messages`` page per subscriber. Public channel
+sources (configured by username or ``t.me`` link) are joined here instead,
+keyed by the channel's peer id:
+
+- the first forwarder that joins owns the channel; only the owner's update
+  handler publishes its messages, every other subscriber drops its own copy
+  of the update as soon as it arrives;
+- a published message is delivered to every subscriber, which routes it
+  through its own rules (``rule_index``) and forwards it with its own client;
+- when the owner leaves (stop, disconnect, rule change), the next subscriber
+  takes over and first fetches what was posted after the last published
+  message, holding live messages until then, so the handover leaves no gap;
+- message ids are monotonic per channel, so anything at or below the last
+  published id is dropped as a repeat.
+
+Private sources, and sources configured by numeric id, stay on the per-user
+path. ``SHARED_SOURCES_ENABLED=false`` turns sharing off.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+SHARED_SOURCES_ENABLED = os.getenv("SHARED_SOURCES_ENABLED", "true").lower() == "true"
+
+
+class _SharedSource:
+    __slots__ = ("subscribers", "owner", "last_id", "held", "handover")
+
+    def __init__(self):
+        # user_id -> forwarder, in join order (the next owner is the oldest subscriber)
+        self.subscribers: Dict[int, Any] = {}
+        self.owner: Optional[int] = None
+        self.last_id = 0
+        self.held: Optional[List[Tuple[Any, float]]] = None
+        self.handover: Optional[asyncio.Task] = None
+
+
+class SharedSources:
+    """Subscriptions of a worker's forwarders to public source channels"""
+
+    def __init__(self, enabled: bool = SHARED_SOURCES_ENABLED):
+        self.enabled = enabled
+        self._sources: Dict[int, _SharedSource] = {}
+        self.published = 0
+        self.delivered = 0
+
+    def join(self, peer_id: int, forwarder) -> None:
+        """Subscribe ``forwarder`` (a connected ``UserForwarder``) to a channel"""
+        shared = self._sources.get(peer_id)
+        if shared is None:
+            shared = self._sources[peer_id] = _SharedSource()
+        shared.subscribers[forwarder.user_id] = forwarder
+        if shared.owner is None:
+            self._hand_over(peer_id, shared)
+
+    def leave(self, peer_id: int, user_id: int) -> None:
+        shared = self._sources.get(peer_id)
+        if shared is None or shared.subscribers.pop(user_id, None) is None:
+            return
+        if not shared.subscribers:
+            if shared.handover is not None:
+                shared.handover.cancel()
+            del self._sources[peer_id]
+        elif shared.owner == user_id:
+            self._hand_over(peer_id, shared)
+
+    def owner_of(self, peer_id: int) -> Optional[int]:
+        shared = self._sources.get(peer_id)
+        return shared.owner if shared else None
+
+    async def publish(self, peer_id: int, message, received: float) -> None:
+        """A live message seen by the owner's client"""
+        shared = self._sources.get(peer_id)
+        if shared is None:
+            return
+        if shared.held is not None:
+            shared.held.append((message, received))
+            return
+        await self._fan_out(peer_id, shared, message, received)
+
+    def stats(self) -> Dict[str, int]:
+        subscriptions = sum(len(shared.subscribers) for shared in self._sources.values())
+        return {
+            "channels": len(self._sources),
+            "subscriptions": subscriptions,
+            "listeners_saved": subscriptions - len(self._sources),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+    def _hand_over(self, peer_id: int, shared: _SharedSource) -> None:
+        if shared.handover is not None:
+            shared.handover.cancel()
+        user_id, forwarder = next(iter(shared.subscribers.items()))
+        shared.owner = user_id
+        if shared.last_id:
+            shared.held = shared.held if shared.held is not None else []
+            shared.handover = asyncio.create_task(
+                self._catch_up(peer_id, shared, forwarder), name=f"shared-source-{peer_id}"
+            )
+
+    async def _catch_up(self, peer_id: int, shared: _SharedSource, forwarder) -> None:
+        try:
+            for message in await forwarder.fetch_missed(peer_id, shared.last_id):
+                await self._fan_out(peer_id, shared, message, time.monotonic())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Subscribers close the gap from their own high-water marks when they reconnect
+            logger.warning(f"Handover of shared source {peer_id} to user {forwarder.user_id} failed: {str(e)}")
+        held, shared.held, shared.handover = shared.held or [], None, None
+        for message, received in held:
+            await self._fan_out(peer_id, shared, message, received)
+
+    async def _fan_out(self, peer_id: int, shared: _SharedSource, message, received: float) -> None:
+        if message.id <= shared.last_id:
+            return
+        shared.last_id = message.id
+        self.published += 1
+        subscribers = list(shared.subscribers.values())
+        self.delivered += len(subscribers)
+        await asyncio.gather(*(forwarder.deliver(peer_id, message, received) for forwarder in subscribers))
+
+
+shared_sources = SharedSources()
@@ -0,0 +1,258 @@
+# app/services/tenant_scheduler.py
+"""
+Weighted fair queueing of message processing across the users of a worker.
+
+Every incoming message is handed to :meth:`TenantScheduler.submit` instead
+of being processed in Telethon's update task. A fixed pool of
+``TENANT_SCHEDULER_CONCURRENCY`` slots runs the queued work, always picking
+the user whose next message has the smallest virtual finish tag
+(start-time fair queueing): a user's tags advance by ``1 / weight`` per
+message, so a user with a firehose source only gets its weighted share of
+the slots while it has competition, and a light user's next message is
+served ahead of the backlog of a noisy one.
+
+- Weights come from the user's plan: ``TENANT_WEIGHT_PREMIUM`` for an active
+  subscription, ``TENANT_WEIGHT_FREE`` otherwise;
+- a user's messages run one at a time, in arrival order;
+- each user holds at most ``TENANT_QUEUE_MAX_PENDING`` queued messages,
+  further submits wait, which only slows that user's update handler;
+- queue depth and queueing delay per user are written to
+  ``tenant_queue_stats`` every ``TENANT_STATS_FLUSH_INTERVAL`` seconds and
+  reported by ``/stats/performance``.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from sqlalchemy import Column, DateTime, Float, Integer, String, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_database import AsyncSessionLocal
+from app.models import Base
+from app.services.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+TENANT_SCHEDULER_CONCURRENCY = int(os.getenv("TENANT_SCHEDULER_CONCURRENCY", "32"))
+TENANT_QUEUE_MAX_PENDING = int(os.getenv("TENANT_QUEUE_MAX_PENDING", "1000"))
+TENANT_WEIGHT_FREE = float(os.getenv("TENANT_WEIGHT_FREE", "1"))
+TENANT_WEIGHT_PREMIUM = float(os.getenv("TENANT_WEIGHT_PREMIUM", "4"))
+TENANT_STATS_FLUSH_INTERVAL = float(os.getenv("TENANT_STATS_FLUSH_INTERVAL", "15"))
+
+
+class TenantQueueStats(Base):
+    __tablename__ = "tenant_queue_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    worker = Column(String(32), nullable=False)
+    weight = Column(Float, nullable=False)
+    queued = Column(Integer, nullable=False)
+    processed = Column(Integer, nullable=False)
+    wait_p50 = Column(Float, nullable=True)
+    wait_p95 = Column(Float, nullable=True)
+    wait_max = Column(Float, nullable=True)
+    updated_at = Column(DateTime, nullable=False)
+
+
+def tenant_weight(subscription_active: bool) -> float:
+    """Scheduling weight of a user's plan"""
+    # premium_monthly is the only paid plan (see /subscription/plans)
+    return TENANT_WEIGHT_PREMIUM if subscription_active else TENANT_WEIGHT_FREE
+
+
+class _Tenant:
+    __slots__ = ("weight", "jobs", "finish", "busy", "room", "waits", "max_wait", "processed")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        # (start tag, finish tag, enqueued at, work)
+        self.jobs: Deque[Tuple[float, float, float, Callable[[], Awaitable[Any]]]] = deque()
+        self.finish = 0.0
+        self.busy = False
+        self.room = asyncio.Condition()
+        self.waits = LatencyHistogram()
+        self.max_wait = 0.0
+        self.processed = 0
+
+
+class TenantScheduler:
+    """Start-time fair queueing of per-user work over a fixed number of slots"""
+
+    def __init__(
+        self,
+        concurrency: int = TENANT_SCHEDULER_CONCURRENCY,
+        max_pending: int = TENANT_QUEUE_MAX_PENDING,
+        flush_interval: float = TENANT_STATS_FLUSH_INTERVAL,
+    ):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.worker_name = "worker"
+        self._tenants: Dict[int, _Tenant] = {}
+        self._ready: List[Tuple[float, int, int]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._slots: List[asyncio.Task] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def wakeup(self) -> asyncio.Condition:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Condition()
+        return self._wakeup
+
+    async def start(self, worker_name: Optional[str] = None) -> None:
+        if self._slots:
+            return
+        if worker_name:
+            self.worker_name = worker_name
+        self._slots = [
+            asyncio.create_task(self._run_slot(), name=f"tenant-slot-{index}")
+            for index in range(self.concurrency)
+        ]
+        if self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._run_flush(), name="tenant-stats-flush")
+
+    async def stop(self) -> None:
+        tasks = self._slots + ([self._flush_task] if self._flush_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._slots = []
+        self._flush_task = None
+        if self.flush_interval > 0:
+            await self.flush()
+
+    def set_weight(self, user_id: int, weight: float) -> None:
+        """Applies to messages queued from now on"""
+        tenant = self._tenants.get(user_id)
+        if tenant is None:
+            self._tenants[user_id] = _Tenant(weight)
+        else:
+            tenant.weight = weight
+
+    def remove_tenant(self, user_id: int) -> int:
+        """Forget a user and drop its queued work (forwarder stopped); returns the number dropped"""
+        tenant = self._tenants.pop(user_id, None)
+        return len(tenant.jobs) if tenant else 0
+
+    async def submit(self, user_id: int, work: Callable[[], Awaitable[Any]]) -> None:
+        """Queue ``work()`` for the user; waits while the user's queue is full"""
+        tenant = self._tenants.get(user_id)
+        if tenant is None:
+            tenant = self._tenants[user_id] = _Tenant(TENANT_WEIGHT_FREE)
+
+        async with tenant.room:
+            await tenant.room.wait_for(lambda: len(tenant.jobs) < self.max_pending)
+
+        start = max(self._virtual_time, tenant.finish)
+        tenant.finish = start + 1.0 / tenant.weight
+        tenant.jobs.append((start, tenant.finish, time.monotonic(), work))
+        if not tenant.busy and len(tenant.jobs) == 1:
+            await self._make_ready(user_id, tenant)
+
+    def queue_depth(self, user_id: int) -> int:
+        tenant = self._tenants.get(user_id)
+        return len(tenant.jobs) if tenant else 0
+
+    def stats(self) -> Dict[int, Dict[str, Any]]:
+        """Per-user queue depth and queueing delay since the last flush"""
+        return {user_id: self._tenant_stats(tenant) for user_id, tenant in self._tenants.items()}
+
+    async def _make_ready(self, user_id: int, tenant: _Tenant) -> None:
+        async with self.wakeup:
+            heapq.heappush(self._ready, (tenant.jobs[0][1], next(self._sequence), user_id))
+            self.wakeup.notify()
+
+    async def _run_slot(self) -> None:
+        while True:
+            async with self.wakeup:
+                await self.wakeup.wait_for(lambda: bool(self._ready))
+                _, _, user_id = heapq.heappop(self._ready)
+            tenant = self._tenants.get(user_id)
+            if tenant is None or tenant.busy or not tenant.jobs:
+                # Stale entry of a removed tenant; a busy tenant is re-queued when it finishes
+                continue
+
+            start, _, enqueued_at, work = tenant.jobs.popleft()
+            self._virtual_time = max(self._virtual_time, start)
+            tenant.busy = True
+            waited = time.monotonic() - enqueued_at
+            tenant.waits.record(waited)
+            tenant.max_wait = max(tenant.max_wait, waited)
+            async with tenant.room:
+                tenant.room.notify()
+
+            try:
+                await work()
+            except Exception as e:
+                logger.error(f"Queued work for user {user_id} failed: {str(e)}")
+            finally:
+                tenant.busy = False
+                tenant.processed += 1
+                if self._tenants.get(user_id) is tenant and tenant.jobs:
+                    await self._make_ready(user_id, tenant)
+
+    def _tenant_stats(self, tenant: _Tenant) -> Dict[str, Any]:
+        return {
+            "weight": tenant.weight,
+            "queued": len(tenant.jobs),
+            "processed": tenant.processed,
+            "wait_p50": tenant.waits.percentile(50),
+            "wait_p95": tenant.waits.percentile(95),
+            "wait_max": tenant.max_wait if tenant.waits.count else None,
+        }
+
+    async def _run_flush(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Publish the current window to ``tenant_queue_stats`` and start a new one"""
+        now = datetime.utcnow()
+        rows = []
+        for user_id, tenant in list(self._tenants.items()):
+            rows.append({
+                "user_id": user_id,
+                "worker": self.worker_name,
+                "updated_at": now,
+                **self._tenant_stats(tenant),
+            })
+            tenant.waits = LatencyHistogram()
+            tenant.max_wait = 0.0
+            tenant.processed = 0
+        if not rows:
+            return
+
+        stmt = pg_insert(TenantQueueStats).values(rows)
+        try:
+            async with AsyncSessionLocal() as db:
+                async with db.begin():
+                    await db.execute(stmt.on_conflict_do_update(
+                        index_elements=[TenantQueueStats.user_id],
+                        set_={name: stmt.excluded[name] for name in rows[0] if name != "user_id"},
+                    ))
+        except Exception as e:
+            logger.error(f"Failed to write tenant queue stats: {str(e)}")
+
+
+async def load_tenant_weight(db: AsyncSession, user_id: int) -> float:
+    """Set the user's weight from their subscription (forwarder start / reload_plan)"""
+    from app.models import User
+
+    subscription_active = await db.scalar(select(User.subscription_active).where(User.id == user_id))
+    weight = tenant_weight(bool(subscription_active))
+    tenant_scheduler.set_weight(user_id, weight)
+    return weight
+
+
+tenant_scheduler = TenantScheduler()
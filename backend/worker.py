@@ -0,0 +1,275 @@
+# app/worker.py
+"""
+Telegram Forwarder worker service
+
+Runs the per-user Telethon forwarders outside the API process:
+
+    python -m app.worker --workers 4            # supervisor + 4 worker processes
+    python -m app.worker --workers 8 --index 3  # a single shard, e.g. one per container
+
+Users are assigned to workers with a consistent hash ring over
+``forwarder-0 .. forwarder-N-1``. Each worker takes the users it owns whose
+BotSession is running, then follows the ``forwarder_control`` channel for
+start / stop / reload_rules / reload_plan commands published by the API. API
+redeploys no longer touch running forwarders, and a crashed worker is
+restarted by the supervisor and resumes its shard from ``bot_sessions``.
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.async_database import AsyncSessionLocal, async_engine
+from app.models import BotSession
+from app.services.hash_ring import worker_name, worker_ring
+from app.services.forwarder_control import ControlListener, START, STOP, RELOAD_RULES, RELOAD_PLAN, RESET_ACCOUNT
+from app.services.rule_index import rule_index
+from app.services.peer_cache import peer_cache
+from app.services.client_registry import client_registry
+from app.services.send_scheduler import send_scheduler
+from app.services.tenant_scheduler import tenant_scheduler, load_tenant_weight
+from app.services.seen_store import seen_store
+from app.services.high_water import high_water
+from app.services.shared_sources import shared_sources
+from app.services.outbox import outbox
+# Registers the dialog mirror's connect hook, so forwarder clients keep the mirror current
+import app.services.dialog_mirror
+from app.services.log_partitions import log_partition_maintainer
+from app.services.retry_engine import retry_engine
+from app.services.forwarding import UserForwarder
+from app.services.log_sink import forwarding_log_sink
+from app.services.rule_counters import rule_counters
+from app.services.latency import latency_recorder
+
+logger = logging.getLogger(__name__)
+
+FORWARDER_WORKERS = int(os.getenv("FORWARDER_WORKERS", "4"))
+FORWARDER_RESTART_DELAY = float(os.getenv("FORWARDER_RESTART_DELAY", "5.0"))
+
+
+class ForwarderWorker:
+    """One shard of the forwarder service, running on its own event loop"""
+
+    def __init__(self, index: int, workers: int):
+        self.name = worker_name(index)
+        self.ring = worker_ring(workers)
+        self._forwarders: Dict[int, UserForwarder] = {}
+        self._lock = asyncio.Lock()
+
+    def owns(self, user_id: int) -> bool:
+        return self.ring.node_for(user_id) == self.name
+
+    async def handle_command(self, command: str, user_id: int) -> None:
+        if not self.owns(user_id):
+            return
+        logger.info(f"{self.name}: {command} for user {user_id}")
+        async with self._lock:
+            if command == START:
+                await self._start_user(user_id)
+            elif command == STOP:
+                await self._stop_user(user_id)
+            elif command == RELOAD_RULES:
+                await self._reload_rules(user_id)
+            elif command == RELOAD_PLAN:
+                await self._reload_plan(user_id)
+            elif command == RESET_ACCOUNT:
+                await self._reset_account(user_id)
+
+    async def resync(self) -> None:
+        """Converge on the running BotSessions this worker owns"""
+        async with AsyncSessionLocal() as db:
+            running = (await db.scalars(select(BotSession.user_id).where(
+                BotSession.is_running == True
+            ))).all()
+        owned = {user_id for user_id in running if self.owns(user_id)}
+
+        async with self._lock:
+            for user_id in set(self._forwarders) - owned:
+                await self._stop_user(user_id)
+            for user_id in owned - set(self._forwarders):
+                await self._start_user(user_id)
+            # Recovered entries of users stopped meanwhile or now on another shard would never be replayed here
+            for user_id in outbox.waiting_users() - owned:
+                logger.warning(f"{self.name}: dropping unfinished outbox entries of user {user_id}")
+                outbox.discard_user(user_id)
+        shared = shared_sources.stats()
+        logger.info(
+            f"{self.name}: forwarding for {len(self._forwarders)} users, "
+            f"{shared['channels']} shared channels for {shared['subscriptions']} subscriptions"
+        )
+
+    async def _start_user(self, user_id: int) -> None:
+        if user_id in self._forwarders:
+            return
+        # Source and target peers resolved before (by the API or a previous run) are reused as is
+        await peer_cache.warm(user_id)
+        async with AsyncSessionLocal() as db:
+            await load_tenant_weight(db, user_id)
+        await seen_store.load(user_id)
+        forwarder = self._forwarders[user_id] = UserForwarder(user_id)
+        await forwarder.start()
+
+    async def _stop_user(self, user_id: int, shutdown: bool = False) -> None:
+        forwarder = self._forwarders.pop(user_id, None)
+        if forwarder is None:
+            return
+        await forwarder.stop()
+        await send_scheduler.drop_account(user_id)
+        if not shutdown:
+            # Forwarding was stopped for the user: unfinished messages are not replayed later
+            outbox.discard_user(user_id)
+        await seen_store.unload(user_id)
+        rule_index.invalidate_user(user_id)
+
+    async def _reload_rules(self, user_id: int) -> None:
+        rule_index.invalidate_user(user_id)
+        forwarder = self._forwarders.get(user_id)
+        if forwarder is not None:
+            try:
+                await forwarder.refresh_sources()
+            except Exception as e:
+                logger.error(f"{self.name}: reloading rules for user {user_id} failed: {str(e)}")
+
+    async def _reset_account(self, user_id: int) -> None:
+        # Client session and peer access hashes belong to the previous account
+        running = user_id in self._forwarders
+        await self._stop_user(user_id, shutdown=True)
+        peer_cache.forget_user(user_id)
+        await client_registry.invalidate(user_id)
+        if running:
+            await self._start_user(user_id)
+
+    async def _reload_plan(self, user_id: int) -> None:
+        if user_id in self._forwarders:
+            async with AsyncSessionLocal() as db:
+                weight = await load_tenant_weight(db, user_id)
+            logger.info(f"{self.name}: user {user_id} now scheduled with weight {weight}")
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await forwarding_log_sink.start()
+        await rule_counters.start()
+        await latency_recorder.start()
+        await client_registry.start()
+        await send_scheduler.start(lambda user_id: user_id in self._forwarders)
+        await tenant_scheduler.start(self.name)
+        await seen_store.start()
+        await high_water.start()
+        await outbox.start(self.name)
+        await retry_engine.start(lambda: list(self._forwarders))
+        await log_partition_maintainer.start()
+
+        listener = ControlListener(settings.database_url, self.handle_command, self.resync)
+        await listener.start()
+        logger.info(f"{self.name} started (pid {os.getpid()})")
+
+        await stop.wait()
+
+        logger.info(f"{self.name} shutting down")
+        await listener.stop()
+        await log_partition_maintainer.stop()
+        await retry_engine.stop()
+        async with self._lock:
+            for user_id in list(self._forwarders):
+                await self._stop_user(user_id, shutdown=True)
+
+        await tenant_scheduler.stop()
+        await outbox.stop()
+        await seen_store.stop()
+        await high_water.stop()
+        await send_scheduler.stop()
+        await client_registry.stop()
+        await forwarding_log_sink.stop()
+        await rule_counters.stop()
+        await latency_recorder.stop()
+        await async_engine.dispose()
+
+
+def _configure_logging() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+
+
+def run_worker(index: int, workers: int) -> None:
+    """Process entry point for one shard"""
+    _configure_logging()
+
+    async def main() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await ForwarderWorker(index, workers).run(stop)
+
+    asyncio.run(main())
+
+
+def supervise(workers: int) -> None:
+    """Run one process per shard and restart any that exit unexpectedly"""
+    context = multiprocessing.get_context("spawn")
+    processes: List[multiprocessing.Process] = [None] * workers
+    stopping = False
+
+    def spawn(index: int) -> None:
+        process = context.Process(target=run_worker, args=(index, workers), name=worker_name(index))
+        process.start()
+        processes[index] = process
+
+    def shutdown(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for index in range(workers):
+        spawn(index)
+    logger.info(f"Forwarder supervisor started {workers} workers")
+
+    while not stopping:
+        time.sleep(1.0)
+        for index, process in enumerate(processes):
+            if not stopping and not process.is_alive():
+                logger.error(f"{process.name} exited with code {process.exitcode}, restarting")
+                time.sleep(FORWARDER_RESTART_DELAY)
+                spawn(index)
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=60)
+    logger.info("Forwarder supervisor stopped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Telegram forwarder workers")
+    parser.add_argument("--workers", type=int, default=FORWARDER_WORKERS, help="Total number of shards")
+    parser.add_argument("--index", type=int, default=None, help="Run only this shard in the current process")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if args.index is not None:
+        if not 0 <= args.index < args.workers:
+            parser.error("--index must be between 0 and --workers - 1")
+        run_worker(args.index, args.workers)
+        return
+
+    _configure_logging()
+    supervise(args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -86,8 +86,21 @@ class ApiClient {
     });
   }
 
-  async getAvailableChannels() {
-    return this.request("/channels/available");
+  async getAvailableChannels({ search, refresh = false } = {}) {
+    // The endpoint is paged; follow next_offset until every channel is loaded
+    const channels = [];
+    let offset = 0;
+    let page;
+    do {
+      const params = { offset, limit: 500 };
+      if (search) params.search = search;
+      if (refresh && offset === 0) params.refresh = true;
+      const queryString = new URLSearchParams(params).toString();
+      page = await this.request(`/channels/available?${queryString}`);
+      channels.push(...page.channels);
+      offset = page.next_offset;
+    } while (offset !== null && offset !== undefined);
+    return { ...page, channels };
   }
 
   // Forwarding rules endpoints